@@ -0,0 +1,501 @@
+#
+# bench/filters.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Benchmarks the filter engine against synthetic filter sets and message
+corpora, and compares the results against a saved baseline.
+
+Throughput varies between runs on the same machine (CPU frequency, other
+load), so each result is also compared as a ratio to the simple per-filter
+loop over the same kind of message with the same number of filters, which
+is run alongside it under the same conditions. Only a result which is
+slower by both measures is a regression.
+
+Usage:
+    python -m bench.filters [--sizes 10,100] [--save-baseline] [--threshold 0.25]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from hashlib import sha1
+from io import BytesIO
+
+from PIL import Image
+
+from futaba.cogs.filter.check.file import check_file_filter
+from futaba.cogs.filter.check.name import check_name_filter
+from futaba.cogs.filter.check.text import check_text_filter, get_check_content
+from futaba.cogs.filter.filter import (
+    Filter,
+    find_matches,
+    find_matching_contents,
+)
+from futaba.enums import FilterType, NameType
+from .stubs import (
+    StubChannel,
+    StubCog,
+    StubConfig,
+    StubEmbed,
+    StubGuild,
+    StubMember,
+    StubMessage,
+)
+
+__all__ = ["BenchResult", "run_benchmarks"]
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# The larger sets take most of the hour-long run, use --sizes for a quicker one
+DEFAULT_SIZES = (10, 100, 1000, 2500, 5000)
+DEFAULT_MESSAGES = 100
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.25
+
+# Quick passes are repeated until they've taken this long in total, in
+# seconds, as a pass of a few milliseconds is mostly noise
+MIN_MEASURE_TIME = 1.0
+
+# Latin letters which have many lookalikes, making filters expensive to expand
+CONFUSABLE_LETTERS = "aceijopsxyl"
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+CODE_LINES = (
+    "def handler(event, context):",
+    "    result = process(event['body'])",
+    "    for item in result.items():",
+    "        logger.info('processing %s', item)",
+    "    return {'statusCode': 200, 'body': json.dumps(result)}",
+    "class Widget(Base):",
+    "    __slots__ = ('name', 'size')",
+    "if (x < 0 && y > width) { return null; }",
+)
+
+BenchCase = namedtuple("BenchCase", ("key", "items", "func", "reset"), defaults=(None,))
+
+BenchResult = namedtuple(
+    "BenchResult", ("key", "messages_per_sec", "p50_ms", "p99_ms", "peak_kib")
+)
+
+
+def _word(rng, min_len=3, max_len=10, letters=LETTERS):
+    return "".join(rng.choice(letters) for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_filters(rng, count):
+    """
+    Generates filter text, mostly built from letters with many confusables.
+    """
+
+    texts = set()
+    while len(texts) < count:
+        letters = CONFUSABLE_LETTERS if rng.random() < 0.7 else LETTERS
+        texts.add(_word(rng, 4, 12, letters))
+    return sorted(texts)
+
+
+def make_corpus(rng, kind, count, guild, channel, author, filter_texts):
+    """
+    Generates messages of the given kind, where roughly one in twenty
+    contains one of the filtered strings.
+    """
+
+    messages = []
+    for i in range(count):
+        embeds = ()
+        if kind == "chat":
+            content = " ".join(_word(rng) for _ in range(rng.randint(3, 20)))
+        elif kind == "code":
+            lines = [rng.choice(CODE_LINES) for _ in range(rng.randint(20, 40))]
+            content = "```py\n" + "\n".join(lines) + "\n```"
+        elif kind == "embed":
+            content = _word(rng)
+            embeds = [
+                StubEmbed(
+                    {
+                        "title": " ".join(_word(rng) for _ in range(5)),
+                        "description": " ".join(_word(rng) for _ in range(40)),
+                        "fields": [
+                            {"name": _word(rng), "value": _word(rng, 10, 40)}
+                            for _ in range(8)
+                        ],
+                    }
+                )
+            ]
+        else:
+            raise ValueError(f"Unknown corpus kind: {kind!r}")
+
+        if filter_texts and rng.random() < 0.05:
+            content = f"{content} {rng.choice(filter_texts)}"
+
+        messages.append(StubMessage(i + 1, channel, author, content, embeds))
+
+    return messages
+
+
+def make_images(rng, count=8):
+    images = []
+    for _ in range(count):
+        image = Image.new("L", (64, 64))
+        image.putdata([rng.randrange(256) for _ in range(64 * 64)])
+        binio = BytesIO()
+        image.save(binio, format="PNG")
+        images.append(binio.getvalue())
+    return images
+
+
+def _percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def _timed_pass(items, func):
+    # As timeit does, so that collections don't land on whichever call is unlucky
+    gc.disable()
+    try:
+        latencies = []
+        start = time.perf_counter()
+        for item in items:
+            item_start = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - item_start)
+        return time.perf_counter() - start, latencies
+    finally:
+        gc.enable()
+
+
+def measure(cases, repeat=DEFAULT_REPEAT):
+    """
+    Runs each case's func over its items, timing each call, and keeps the
+    fastest of at least 'repeat' passes, as the slower ones were held up by
+    something else. The cases take turns, so that a slow patch on the machine
+    hits them all rather than whichever was running. Then each is run again
+    to measure peak memory (tracing slows down the calls it observes).
+    If given, a case's reset is called before each of its passes to clear
+    any caches. Returns a BenchResult per case.
+    """
+
+    # Warm up, so one-off costs like compiling patterns aren't counted
+    for case in cases:
+        case.func(case.items[0])
+
+    fastest = [None] * len(cases)
+    totals = [0.0] * len(cases)
+    rounds = 0
+    while rounds < repeat or min(totals) < MIN_MEASURE_TIME:
+        for i, case in enumerate(cases):
+            if rounds >= repeat and totals[i] >= MIN_MEASURE_TIME:
+                continue
+
+            if case.reset is not None:
+                case.reset()
+
+            timed = _timed_pass(case.items, case.func)
+            totals[i] += timed[0]
+            if fastest[i] is None or timed[0] < fastest[i][0]:
+                fastest[i] = timed
+        rounds += 1
+
+    results = []
+    for case, (elapsed, latencies) in zip(cases, fastest):
+        if case.reset is not None:
+            case.reset()
+
+        tracemalloc.start()
+        for item in case.items:
+            case.func(item)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append(
+            BenchResult(
+                key=case.key,
+                messages_per_sec=len(case.items) / elapsed,
+                p50_ms=statistics.median(latencies) * 1000,
+                p99_ms=_percentile(latencies, 0.99) * 1000,
+                peak_kib=peak / 1024,
+            )
+        )
+
+    return results
+
+
+def run_benchmarks(
+    sizes, message_count, seed=0, executor="thread", repeat=DEFAULT_REPEAT
+):
+    """
+    Runs every engine variant against each filter set size and corpus kind,
+    and returns a list of BenchResult.
+    """
+
+    rng = random.Random(seed)
+    loop = asyncio.new_event_loop()
+    run = loop.run_until_complete
+    results = []
+
+    guild = StubGuild()
+    channel = StubChannel(guild)
+    author = StubMember(guild, 3, "author")
+    images = make_images(rng)
+
+    for size in sizes:
+        filter_texts = make_filters(rng, size)
+
+        build_start = time.perf_counter()
+        filters = [Filter(text) for text in filter_texts]
+        build_time = time.perf_counter() - build_start
+        print(f"Built {size} filters in {build_time:.2f} seconds", file=sys.stderr)
+
+        patterns = tuple(filter.pattern for filter in filters)
+        regexes = [filter.regex for filter in filters]
+        cog = StubCog(StubConfig(executor), images)
+        for filter in filters:
+            cog.filters[guild][filter.text] = (filter, FilterType.FLAG)
+
+        # Measured together, as results are compared relative to each other
+        cases = []
+
+        for kind in ("chat", "code", "embed"):
+            corpus = make_corpus(
+                rng, kind, message_count, guild, channel, author, filter_texts
+            )
+            # Includes embed text, as the checks do
+            contents = [get_check_content(message) for message in corpus]
+
+            cases.append(
+                BenchCase(
+                    f"text/per-filter/{kind}/{size}",
+                    contents,
+                    lambda content: [f for f in filters if f.matches(content)],
+                )
+            )
+            cases.append(
+                BenchCase(
+                    f"text/batched/{kind}/{size}",
+                    contents,
+                    lambda content: find_matches(regexes, content),
+                )
+            )
+            cases.append(
+                BenchCase(
+                    f"text/combined/{kind}/{size}",
+                    contents,
+                    lambda content: find_matching_contents(patterns, [content]),
+                )
+            )
+            cases.append(
+                BenchCase(
+                    f"text/check/{kind}/{size}",
+                    corpus,
+                    lambda message: run(check_text_filter(cog, message)),
+                )
+            )
+
+        names = [
+            StubMember(guild, i, content[:32])
+            for i, content in enumerate(
+                message.content
+                for message in make_corpus(
+                    rng, "chat", message_count, guild, channel, author, filter_texts
+                )
+            )
+        ]
+        cases.append(
+            BenchCase(
+                f"name/check/chat/{size}",
+                names,
+                lambda member: run(
+                    check_name_filter(cog, member.name, NameType.USER, member)
+                ),
+            )
+        )
+
+        # Content filters for the file check, none of which match the images
+        cog.content_filters[guild] = {
+            sha1(text.encode()).digest(): (FilterType.FLAG, text)
+            for text in filter_texts
+        }
+        files = [
+            StubMessage(
+                i + 1, channel, author, f"https://example.com/{i}/{_word(rng)}.png"
+            )
+            for i in range(message_count)
+        ]
+        cases.append(
+            BenchCase(
+                f"file/check/links/{size}",
+                files,
+                lambda message: run(check_file_filter(cog, message)),
+                cog.digest_cache.flush,
+            )
+        )
+
+        results.extend(measure(cases, repeat))
+        cog.offloader.shutdown()
+
+    loop.close()
+
+    return results
+
+
+def reference_key(key):
+    """
+    Returns the key of the result this one is measured relative to.
+    """
+
+    area, _, kind, size = key.split("/")
+    if area != "text":
+        kind = "chat"
+    return f"text/per-filter/{kind}/{size}"
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of (key, baseline rate, current rate, baseline ratio,
+    current ratio) for every result whose throughput dropped by more than
+    the threshold, both outright and relative to its reference. A slower
+    machine only lowers the former, and noise in the reference only the
+    latter. References themselves, and results missing a reference in
+    either run, aren't compared.
+    """
+
+    rates = {result.key: result.messages_per_sec for result in results}
+    regressions = []
+    for result in results:
+        reference = reference_key(result.key)
+        if reference == result.key:
+            continue
+
+        try:
+            expected = baseline[result.key]
+            expected_ratio = expected / baseline[reference]
+            actual_ratio = result.messages_per_sec / rates[reference]
+        except KeyError:
+            continue
+
+        actual = result.messages_per_sec
+        if actual < expected * (1 - threshold) and actual_ratio < expected_ratio * (
+            1 - threshold
+        ):
+            regressions.append(
+                (result.key, expected, actual, expected_ratio, actual_ratio)
+            )
+
+    return regressions
+
+
+def print_results(results):
+    width = max(len(result.key) for result in results)
+    print(
+        f"{'benchmark':<{width}}  {'msg/s':>10}  {'p50 ms':>8}  {'p99 ms':>8}  {'peak KiB':>9}"
+    )
+    for result in results:
+        print(
+            f"{result.key:<{width}}  {result.messages_per_sec:>10.1f}  "
+            f"{result.p50_ms:>8.3f}  {result.p99_ms:>8.3f}  {result.peak_kib:>9.1f}"
+        )
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description="benchmark the filter engine")
+    argparser.add_argument(
+        "--sizes",
+        default=",".join(map(str, DEFAULT_SIZES)),
+        help="Comma-separated filter set sizes to benchmark.",
+    )
+    argparser.add_argument(
+        "--messages",
+        type=int,
+        default=DEFAULT_MESSAGES,
+        help="Number of messages in each corpus.",
+    )
+    argparser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help="Number of timed passes, of which the fastest is kept.",
+    )
+    argparser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    argparser.add_argument(
+        "--executor",
+        choices=("thread", "process"),
+        default="thread",
+        help="Type of worker pool used by the checks.",
+    )
+    argparser.add_argument(
+        "--baseline", default=BASELINE_PATH, help="Path of the baseline file."
+    )
+    argparser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save these results as the new baseline instead of comparing.",
+    )
+    argparser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Fraction of relative throughput which may be lost before failing.",
+    )
+    args = argparser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run_benchmarks(
+        sizes,
+        args.messages,
+        seed=args.seed,
+        executor=args.executor,
+        repeat=args.repeat,
+    )
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as fh:
+            json.dump(
+                {result.key: result.messages_per_sec for result in results},
+                fh,
+                indent=4,
+                sort_keys=True,
+            )
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, run with --save-baseline")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print(f"No regressions beyond {args.threshold:.0%} of the baseline")
+        return 0
+
+    print(f"{len(regressions)} regressions beyond {args.threshold:.0%}:")
+    for key, expected, actual, expected_ratio, actual_ratio in regressions:
+        print(
+            f"  {key}: {expected:.1f} -> {actual:.1f} msg/s, "
+            f"{expected_ratio:.3f} -> {actual_ratio:.3f}x {reference_key(key)}"
+        )
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
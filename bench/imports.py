@@ -0,0 +1,152 @@
+#
+# bench/imports.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Profiles how long importing the bot takes, using python -X importtime.
+
+By default this imports the client and every cog package, which is the
+import work done before on_ready can finish. Each run is a fresh
+interpreter, and the median of the runs is reported per module.
+
+Usage:
+    python -m bench.imports [--runs 5] [--top 25] [--module futaba.client ...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict, namedtuple
+
+__all__ = ["ImportTiming", "default_modules", "profile_imports"]
+
+COGS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "futaba", "cogs")
+
+ImportTiming = namedtuple("ImportTiming", ("module", "self_ms", "cumulative_ms"))
+
+
+def default_modules():
+    modules = ["futaba.client"]
+    for name in sorted(os.listdir(COGS_DIR)):
+        if not name.startswith("_") and os.path.isdir(os.path.join(COGS_DIR, name)):
+            modules.append(f"futaba.cogs.{name}")
+    return modules
+
+
+def _parse_importtime(output):
+    """
+    Parses the stderr of -X importtime into {module: (self us, cumulative us)}.
+    """
+
+    timings = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        timings[module.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def _run_once(modules):
+    code = "".join(f"import {module}\n" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return _parse_importtime(result.stderr)
+
+
+def profile_imports(modules, runs):
+    """
+    Returns the total import time in milliseconds, and a list of ImportTimings
+    with the median of each module over the runs, slowest cumulative first.
+    """
+
+    samples = defaultdict(list)
+    totals = []
+
+    for _ in range(runs):
+        timings = _run_once(modules)
+        totals.append(sum(self_us for self_us, _ in timings.values()) / 1000)
+        for module, (self_us, cumulative_us) in timings.items():
+            samples[module].append((self_us, cumulative_us))
+
+    results = [
+        ImportTiming(
+            module,
+            statistics.median(self_us for self_us, _ in values) / 1000,
+            statistics.median(cumulative_us for _, cumulative_us in values) / 1000,
+        )
+        for module, values in samples.items()
+    ]
+    results.sort(key=lambda timing: timing.cumulative_ms, reverse=True)
+    return statistics.median(totals), results
+
+
+def _top_level(results):
+    """
+    Sums self time by top-level package, such as "sqlalchemy" or "futaba".
+    """
+
+    packages = defaultdict(float)
+    for timing in results:
+        packages[timing.module.split(".")[0]] += timing.self_ms
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description="profile import times")
+    argparser.add_argument(
+        "--module",
+        action="append",
+        dest="modules",
+        help="Module to import, may be given more than once. "
+        "Defaults to the client and every cog.",
+    )
+    argparser.add_argument(
+        "--runs", type=int, default=5, help="Number of fresh interpreters to time."
+    )
+    argparser.add_argument(
+        "--top", type=int, default=25, help="Number of modules and packages shown."
+    )
+    args = argparser.parse_args(argv)
+
+    modules = args.modules or default_modules()
+    total, results = profile_imports(modules, args.runs)
+
+    packages = _top_level(results)[: args.top]
+    results = results[: args.top]
+    names = [timing.module for timing in results] + [name for name, _ in packages]
+    width = max(map(len, names))
+    print(f"{'module':<{width}}  {'self ms':>9}  {'cumul. ms':>9}")
+    for timing in results:
+        print(
+            f"{timing.module:<{width}}  {timing.self_ms:>9.2f}  {timing.cumulative_ms:>9.2f}"
+        )
+
+    print()
+    print(f"{'package':<{width}}  {'self ms':>9}")
+    for package, self_ms in packages:
+        print(f"{package:<{width}}  {self_ms:>9.2f}")
+
+    print()
+    print(f"Total import time: {total:.1f} ms (median of {args.runs} runs)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
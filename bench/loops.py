@@ -0,0 +1,222 @@
+#
+# bench/loops.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Compares event throughput on the asyncio and uvloop event loops, using
+workloads shaped like the bot's own. Runs offline; the stream workload
+only uses a socket on the loopback interface.
+
+    dispatch  a task per listener for each gateway event
+    queue     events passed through a queue to a consumer, like the journal
+    timers    timers scheduled then cancelled, like status reactions
+    stream    small messages echoed over a local TCP connection
+
+Usage:
+    python -m bench.loops [--loops asyncio,uvloop] [--events 20000] [--runs 5]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from collections import namedtuple
+
+from futaba.event_loop import LOOP_POLICIES, loop_policy
+
+__all__ = ["LoopResult", "WORKLOADS", "run_benchmarks"]
+
+DEFAULT_EVENTS = 20000
+DEFAULT_RUNS = 5
+
+# Listeners run for each dispatched event
+LISTENERS = 4
+
+# Events in flight at once, before waiting for them to finish
+BATCH_SIZE = 500
+
+LoopResult = namedtuple("LoopResult", ("workload", "loop", "events_per_sec"))
+
+
+async def _listener():
+    await asyncio.sleep(0)
+
+
+async def bench_dispatch(events):
+    loop = asyncio.get_event_loop()
+    for start in range(0, events, BATCH_SIZE):
+        tasks = [
+            loop.create_task(_listener())
+            for _ in range(min(BATCH_SIZE, events - start))
+            for _ in range(LISTENERS)
+        ]
+        await asyncio.gather(*tasks)
+
+
+async def bench_queue(events):
+    queue = asyncio.Queue(maxsize=BATCH_SIZE)
+
+    async def consume():
+        for _ in range(events):
+            await queue.get()
+            queue.task_done()
+
+    consumer = asyncio.ensure_future(consume())
+    for event in range(events):
+        await queue.put(event)
+    await consumer
+
+
+async def bench_timers(events):
+    loop = asyncio.get_event_loop()
+    for start in range(0, events, BATCH_SIZE):
+        handles = [
+            loop.call_later(1.0, lambda: None)
+            for _ in range(min(BATCH_SIZE, events - start))
+        ]
+        await asyncio.sleep(0)
+        for handle in handles:
+            handle.cancel()
+
+
+async def bench_stream(events):
+    finished = asyncio.get_event_loop().create_future()
+
+    async def echo(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            writer.write(line)
+        writer.close()
+        finished.set_result(None)
+
+    server = await asyncio.start_server(echo, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    payload = b'{"op":0,"t":"MESSAGE_CREATE","d":{"content":"hello"}}\n'
+    for start in range(0, events, BATCH_SIZE):
+        count = min(BATCH_SIZE, events - start)
+        writer.write(payload * count)
+        for _ in range(count):
+            await reader.readline()
+
+    # Wait for the server side to see the connection close
+    writer.close()
+    await finished
+    server.close()
+    await server.wait_closed()
+
+
+WORKLOADS = {
+    "dispatch": bench_dispatch,
+    "queue": bench_queue,
+    "timers": bench_timers,
+    "stream": bench_stream,
+}
+
+
+def run_benchmarks(loops, workloads, events, runs):
+    """
+    Runs each workload on each loop, and returns a list of LoopResult with
+    the median throughput over the runs. Each run gets a fresh loop.
+    """
+
+    results = []
+    for name in loops:
+        actual, policy = loop_policy(name)
+        if actual != name:
+            print(f"Skipping {name}, it is not installed", file=sys.stderr)
+            continue
+
+        for workload in workloads:
+            rates = []
+            for _ in range(runs):
+                loop = policy.new_event_loop()
+                asyncio.set_event_loop(loop)
+                try:
+                    start = time.perf_counter()
+                    loop.run_until_complete(WORKLOADS[workload](events))
+                    rates.append(events / (time.perf_counter() - start))
+                finally:
+                    asyncio.set_event_loop(None)
+                    loop.close()
+
+            results.append(LoopResult(workload, name, statistics.median(rates)))
+
+    return results
+
+
+def print_results(results, loops):
+    rates = {
+        (result.workload, result.loop): result.events_per_sec for result in results
+    }
+    workloads = list(dict.fromkeys(result.workload for result in results))
+    loops = [loop for loop in loops if any(result.loop == loop for result in results)]
+
+    header = f"{'workload':<10}" + "".join(f"  {loop + ' ev/s':>14}" for loop in loops)
+    if len(loops) > 1:
+        header += f"  {'speedup':>8}"
+    print(header)
+
+    for workload in workloads:
+        row = [rates[workload, loop] for loop in loops]
+        line = f"{workload:<10}" + "".join(f"  {rate:>14.1f}" for rate in row)
+        if len(loops) > 1:
+            line += f"  {row[-1] / row[0]:>7.2f}x"
+        print(line)
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description="compare event loop throughput")
+    argparser.add_argument(
+        "--loops",
+        default=",".join(LOOP_POLICIES),
+        help="Comma-separated event loops to compare.",
+    )
+    argparser.add_argument(
+        "--workloads",
+        default=",".join(WORKLOADS),
+        help="Comma-separated workloads to run.",
+    )
+    argparser.add_argument(
+        "--events",
+        type=int,
+        default=DEFAULT_EVENTS,
+        help="Number of events in each run.",
+    )
+    argparser.add_argument(
+        "--runs", type=int, default=DEFAULT_RUNS, help="Number of runs per workload."
+    )
+    args = argparser.parse_args(argv)
+
+    loops = args.loops.split(",")
+    workloads = args.workloads.split(",")
+    for loop in loops:
+        if loop not in LOOP_POLICIES:
+            argparser.error(f"unknown loop: {loop}")
+    for workload in workloads:
+        if workload not in WORKLOADS:
+            argparser.error(f"unknown workload: {workload}")
+
+    results = run_benchmarks(loops, workloads, args.events, args.runs)
+    if not results:
+        print("None of the selected loops are installed")
+        return 1
+
+    print_results(results, loops)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
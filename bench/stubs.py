@@ -0,0 +1,151 @@
+#
+# bench/stubs.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Minimal stand-ins for the discord.py objects and bot services which
+the filter checks touch, so that they can run without a connection.
+"""
+
+from collections import defaultdict
+from io import BytesIO
+
+from discord import MessageType
+
+from futaba.cogs.filter.check.digest import DigestCache
+from futaba.cogs.filter.check.immunity import ImmunityCache
+from futaba.cogs.filter.offload import FilterOffloader
+from futaba.sql.data import FilterSettingsData
+
+__all__ = [
+    "StubConfig",
+    "StubGuild",
+    "StubChannel",
+    "StubMember",
+    "StubEmbed",
+    "StubMessage",
+    "StubCog",
+]
+
+
+class StubConfig:
+    def __init__(self, executor="thread", workers=2):
+        self.filter_executor = executor
+        self.filter_workers = workers
+        self.filter_timeout = 60.0
+        self.filter_inline_chars = 2000
+        self.filter_inline_bytes = 65536
+
+
+class StubGuild:
+    def __init__(self, id=1):
+        self.id = id
+        self.name = "Benchmark"
+
+
+class StubChannel:
+    def __init__(self, guild, id=2):
+        self.id = id
+        self.name = "general"
+        self.guild = guild
+        self.mention = f"<#{id}>"
+
+
+class StubMember:
+    def __init__(self, guild, id, name):
+        self.id = id
+        self.name = name
+        self.nick = None
+        self.bot = False
+        self.guild = guild
+        self.mention = f"<@{id}>"
+
+
+class StubEmbed:
+    def __init__(self, data):
+        self.data = data
+
+    def to_dict(self):
+        return self.data
+
+
+class StubMessage:
+    def __init__(self, id, channel, author, content, embeds=()):
+        self.id = id
+        self.type = MessageType.default
+        self.guild = channel.guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.embeds = list(embeds)
+        self.attachments = []
+        self.jump_url = (
+            f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{id}"
+        )
+
+
+class _StubJournal:
+    def send(self, *args, **kwargs):
+        pass
+
+
+class _StubRoles:
+    jail = None
+
+
+class _StubSettings:
+    def get_special_roles(self, guild):
+        return _StubRoles()
+
+
+class _StubFilterSettings:
+    def get_settings(self, guild):
+        return FilterSettingsData()
+
+
+class _StubSql:
+    def __init__(self):
+        self.settings = _StubSettings()
+        self.filter = _StubFilterSettings()
+
+
+class _StubHttpPool:
+    """
+    Serves every URL from a fixed set of in-memory files.
+    """
+
+    def __init__(self, files):
+        self.files = files
+
+    async def download_link(self, url):
+        return BytesIO(self.files[hash(url) % len(self.files)])
+
+
+class _StubBot:
+    def __init__(self, files):
+        self.sql = _StubSql()
+        self.http_pool = _StubHttpPool(files)
+
+
+class StubCog:
+    """
+    Has the attributes of the Filtering cog which the checks read.
+    """
+
+    def __init__(self, config, files=(b"",)):
+        self.bot = _StubBot(files)
+        self.journal = _StubJournal()
+        self.filters = defaultdict(dict)
+        self.content_filters = defaultdict(dict)
+        self.perceptual_index = {}
+        self.digest_cache = DigestCache()
+        self.immunity_cache = ImmunityCache()
+        self.offloader = FilterOffloader(config)
@@ -19,6 +19,7 @@ fi
 rm -r "$dest_dir"
 mkdir -p "$dest_dir"
 cp -a "$repo_dir" "$dest_dir"
+git -C "$repo_dir" rev-parse --short HEAD > "$dest_dir/futaba/git-hash"
 install -m400 "$1" "$dest_dir/config.toml"
 chown -R futaba:futaba "$dest_dir"
 echo "Installed source code to '$dest_dir'"
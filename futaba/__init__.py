@@ -15,6 +15,8 @@ futaba - A Discord Mod bot for the Programming server
 """
 
 from . import (
+    audit_log,
+    bktree,
     client,
     config,
     converters,
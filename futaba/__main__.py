@@ -23,6 +23,7 @@ from toml import TomlDecodeError
 
 from . import client
 from .config import load_config
+from .event_loop import install_loop_policy
 
 LOG_FILE = "futaba.log"
 LOG_FILE_MODE = "w"
@@ -96,6 +97,9 @@ if __name__ == "__main__":
         logger.error("Error when processing configuration file: %s", error)
         sys.exit(1)
 
+    # Must be set before the client creates its loop
+    install_loop_policy(config.loop_policy)
+
     # Open and run client
     logger.info("Starting bot...")
     bot = client.Bot(config)
@@ -0,0 +1,349 @@
+#
+# archive.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Optional on-disk archive of message snapshots.
+
+discord.py only remembers a limited number of messages, so deletions and
+edits of older messages arrive as raw events without the original content.
+The archive keeps a compact snapshot of each tracked message so those events
+can still be resolved.
+
+Snapshots are partitioned into one pair of files per UTC day, by the day the
+message was created. The data file is a sequence of zlib-compressed blocks,
+each preceded by its length. The index file is a flat array of (message ID,
+block offset) pairs, appended to as blocks are written. All file access
+happens on a single worker thread, so no locking is needed.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import struct
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import discord
+
+from .lru import LruCache
+from .utils import user_discrim
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["ArchivedMessage", "MessageArchive"]
+
+# Seconds to wait for more snapshots before writing a partial batch
+FLUSH_INTERVAL = 5.0
+
+# Number of partition indexes kept in memory
+INDEX_CACHE_SIZE = 4
+
+BLOCK_HEADER = struct.Struct("<I")
+INDEX_ENTRY = struct.Struct("<QQ")
+
+
+class ArchivedMessage(
+    namedtuple(
+        "ArchivedMessage",
+        (
+            "id",
+            "guild_id",
+            "channel_id",
+            "author_id",
+            "author",
+            "content",
+            "attachments",
+            "edited_at",
+        ),
+    )
+):
+    """
+    A minimal snapshot of a message. The author is kept as "name#discrim",
+    and attachments as a list of URLs.
+    """
+
+    __slots__ = ()
+
+    @property
+    def created_at(self):
+        return discord.utils.snowflake_time(self.id)
+
+    @property
+    def jump_url(self):
+        return (
+            f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.id}"
+        )
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(
+            id=message.id,
+            guild_id=message.guild.id,
+            channel_id=message.channel.id,
+            author_id=message.author.id,
+            author=user_discrim(message.author),
+            content=message.content,
+            attachments=[attach.url for attach in message.attachments],
+            edited_at=message.edited_at,
+        )
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        Builds a snapshot from a raw gateway message payload.
+        Returns None if the payload is a partial update without content.
+        """
+
+        if "content" not in data or "author" not in data:
+            return None
+
+        author = data["author"]
+        return cls(
+            id=int(data["id"]),
+            guild_id=int(data["guild_id"]),
+            channel_id=int(data["channel_id"]),
+            author_id=int(author["id"]),
+            author=f"{author['username']}#{author['discriminator']}",
+            content=data["content"],
+            attachments=[attach["url"] for attach in data.get("attachments", ())],
+            edited_at=discord.utils.parse_time(data.get("edited_timestamp")),
+        )
+
+    def to_record(self):
+        edited_at = self.edited_at
+        if edited_at is not None:
+            edited_at = (edited_at - datetime(1970, 1, 1)).total_seconds()
+
+        return [
+            self.id,
+            self.guild_id,
+            self.channel_id,
+            self.author_id,
+            self.author,
+            self.content,
+            self.attachments,
+            edited_at,
+        ]
+
+    @classmethod
+    def from_record(cls, record):
+        archived = cls(*record)
+        if archived.edited_at is not None:
+            archived = archived._replace(
+                edited_at=datetime.utcfromtimestamp(archived.edited_at)
+            )
+        return archived
+
+
+def _partition(message_id):
+    return discord.utils.snowflake_time(message_id).strftime("%Y-%m-%d")
+
+
+class MessageArchive:
+    """
+    Buffers message snapshots and writes them to disk in batches,
+    and looks up the latest snapshot of a message by ID.
+    """
+
+    __slots__ = (
+        "path",
+        "retention",
+        "batch_size",
+        "pending",
+        "flush_handle",
+        "indexes",
+        "executor",
+        "pruned_on",
+    )
+
+    def __init__(self, path, retention_days, batch_size):
+        self.path = path
+        self.retention = timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self.pending = []
+        self.flush_handle = None
+        self.indexes = LruCache(INDEX_CACHE_SIZE)
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="futaba-archive"
+        )
+        self.pruned_on = None
+
+        os.makedirs(path, exist_ok=True)
+
+    def add(self, archived):
+        """
+        Queues a snapshot to be written. A later snapshot of the
+        same message replaces earlier ones when looked up.
+        """
+
+        self.pending.append(archived)
+
+        if len(self.pending) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+        elif self.flush_handle is None:
+            loop = asyncio.get_event_loop()
+            self.flush_handle = loop.call_later(
+                FLUSH_INTERVAL, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    async def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, []
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self._write, batch)
+
+    async def get(self, message_id):
+        """
+        Returns the latest archived snapshot of the given message, or None.
+        """
+
+        for archived in reversed(self.pending):
+            if archived.id == message_id:
+                return archived
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self._lookup, message_id)
+
+    async def close(self):
+        await self.flush()
+        self.executor.shutdown(wait=True)
+
+    def _files(self, partition):
+        base = os.path.join(self.path, partition)
+        return f"{base}.dat", f"{base}.idx"
+
+    def _write(self, batch):
+        partitions = {}
+        for archived in batch:
+            partitions.setdefault(_partition(archived.id), []).append(archived)
+
+        for partition, snapshots in partitions.items():
+            data_path, index_path = self._files(partition)
+            payload = "\n".join(
+                json.dumps(archived.to_record(), ensure_ascii=False)
+                for archived in snapshots
+            )
+            block = zlib.compress(payload.encode("utf-8"))
+
+            try:
+                with open(data_path, "ab") as fh:
+                    offset = fh.tell()
+                    fh.write(BLOCK_HEADER.pack(len(block)))
+                    fh.write(block)
+
+                with open(index_path, "ab") as fh:
+                    for archived in snapshots:
+                        fh.write(INDEX_ENTRY.pack(archived.id, offset))
+            except OSError as error:
+                logger.error(
+                    "Unable to write %d message snapshots to archive partition %s",
+                    len(snapshots),
+                    partition,
+                    exc_info=error,
+                )
+                continue
+
+            index = self.indexes.get(partition)
+            if index is not None:
+                for archived in snapshots:
+                    index[archived.id] = offset
+
+        logger.debug(
+            "Archived %d message snapshots in %d partitions",
+            len(batch),
+            len(partitions),
+        )
+        self._prune()
+
+    def _load_index(self, partition):
+        index = self.indexes.get(partition)
+        if index is not None:
+            return index
+
+        _, index_path = self._files(partition)
+        try:
+            with open(index_path, "rb") as fh:
+                raw = fh.read()
+        except FileNotFoundError:
+            return {}
+
+        # Drop any partial entry left by an interrupted write
+        raw = raw[: len(raw) - len(raw) % INDEX_ENTRY.size]
+        index = {
+            message_id: offset for message_id, offset in INDEX_ENTRY.iter_unpack(raw)
+        }
+        self.indexes[partition] = index
+        return index
+
+    def _lookup(self, message_id):
+        partition = _partition(message_id)
+        offset = self._load_index(partition).get(message_id)
+        if offset is None:
+            return None
+
+        data_path, _ = self._files(partition)
+        try:
+            with open(data_path, "rb") as fh:
+                fh.seek(offset)
+                (length,) = BLOCK_HEADER.unpack(fh.read(BLOCK_HEADER.size))
+                payload = zlib.decompress(fh.read(length)).decode("utf-8")
+
+            # Only split on newlines, content may hold other line breaks (U+2028)
+            records = [json.loads(line) for line in payload.split("\n")]
+        except (OSError, ValueError, struct.error, zlib.error) as error:
+            logger.error(
+                "Unable to read archived message %d from partition %s",
+                message_id,
+                partition,
+                exc_info=error,
+            )
+            return None
+
+        found = None
+        for record in records:
+            if record[0] == message_id:
+                found = record
+
+        return None if found is None else ArchivedMessage.from_record(found)
+
+    def _prune(self):
+        today = datetime.utcnow().date()
+        if self.pruned_on == today:
+            return
+
+        self.pruned_on = today
+        cutoff = (datetime.utcnow() - self.retention).strftime("%Y-%m-%d")
+
+        for filename in os.listdir(self.path):
+            partition, ext = os.path.splitext(filename)
+            if ext not in (".dat", ".idx") or partition >= cutoff:
+                continue
+
+            logger.info("Removing expired archive file %s", filename)
+            self.indexes.pop(partition, None)
+            try:
+                os.remove(os.path.join(self.path, filename))
+            except OSError as error:
+                logger.error(
+                    "Unable to remove expired archive file %s",
+                    filename,
+                    exc_info=error,
+                )
@@ -0,0 +1,301 @@
+#
+# audit_log.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Shared, incrementally-polled cache of each guild's audit log.
+
+Attributing a deletion, kick or role change means finding its audit
+log entry, which usually appears shortly after the gateway event. Rather
+than have each event fetch the audit log itself, waiters look up entries
+in this cache, and all waiters in a guild share one poll at a time.
+
+Discord merges repeated message deletions by the same moderator into one
+entry, keeping its ID and creation time and raising its count. So entries
+already seen are re-read, and one whose count went up is treated as new
+as of the poll that noticed it.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["AuditLogCache", "GuildAuditLog"]
+
+# Minimum time between audit log requests for a guild, in seconds
+POLL_INTERVAL = 1.0
+
+# Number of entries fetched on the first poll of a guild
+INITIAL_LIMIT = 50
+
+# Most entries fetched by later polls, one request's worth
+POLL_LIMIT = 100
+
+# Number of (action, target) keys indexed per guild
+MAX_KEYS = 1024
+
+# Number of entries kept per (action, target) key
+MAX_ENTRIES_PER_KEY = 8
+
+# How long to wait for an entry to show up by default, in seconds
+DEFAULT_TIMEOUT = 3.0
+
+
+def _target_id(entry):
+    return getattr(entry.target, "id", None)
+
+
+def _count(entry):
+    # Only set on entries Discord aggregates, such as message deletions
+    return getattr(entry.extra, "count", None)
+
+
+class GuildAuditLog:
+    """
+    The audit log entries seen so far in one guild, indexed by
+    (action, target ID), with the newest entries last.
+    """
+
+    __slots__ = (
+        "guild",
+        "index",
+        "updated_at",
+        "last_id",
+        "last_poll",
+        "polled_at",
+        "pending",
+    )
+
+    def __init__(self, guild):
+        self.guild = guild
+        self.index = OrderedDict()
+        self.updated_at = {}
+        self.last_id = None
+        self.last_poll = 0.0
+        self.polled_at = None
+        self.pending = None
+
+    def _forget(self, entries):
+        for entry in entries:
+            self.updated_at.pop(entry.id, None)
+
+    def find(self, entry):
+        """
+        Returns the cached entry with the same ID, or None.
+        """
+
+        for seen in self.index.get((entry.action, _target_id(entry)), ()):
+            if seen.id == entry.id:
+                return seen
+        return None
+
+    def add(self, entry, seen_at=None):
+        """
+        Adds a new entry, or replaces an aggregated one whose count changed.
+        seen_at is when the change was noticed, which lookups use in place of
+        the entry's creation time.
+        """
+
+        key = (entry.action, _target_id(entry))
+        entries = self.index.get(key)
+        if entries is None:
+            entries = self.index[key] = []
+            if len(self.index) > MAX_KEYS:
+                _, dropped = self.index.popitem(last=False)
+                self._forget(dropped)
+        else:
+            self.index.move_to_end(key)
+            for i, seen in enumerate(entries):
+                if seen.id == entry.id:
+                    if _count(seen) != _count(entry):
+                        entries[i] = entry
+                        if seen_at is not None:
+                            self.updated_at[entry.id] = seen_at
+                    return
+
+        entries.append(entry)
+        self._forget(entries[:-MAX_ENTRIES_PER_KEY])
+        del entries[:-MAX_ENTRIES_PER_KEY]
+
+        if self.last_id is None or entry.id > self.last_id:
+            self.last_id = entry.id
+
+    def happened_at(self, entry):
+        return self.updated_at.get(entry.id, entry.created_at)
+
+    def lookup(self, actions, target_id, since, window, check):
+        """
+        Returns the cached entries matching the given criteria, newest first.
+        A target ID of None matches any target.
+        """
+
+        if target_id is None:
+            candidates = [
+                entry
+                for (action, _), entries in self.index.items()
+                if action in actions
+                for entry in entries
+            ]
+        else:
+            candidates = [
+                entry
+                for action in actions
+                for entry in self.index.get((action, target_id), ())
+            ]
+
+        matches = [
+            entry
+            for entry in candidates
+            if abs(self.happened_at(entry) - since) < window
+            and (check is None or check(entry))
+        ]
+        matches.sort(key=lambda entry: entry.id, reverse=True)
+        return matches
+
+    async def refresh(self):
+        """
+        Fetches new entries. Concurrent callers share the same request.
+        """
+
+        if self.pending is None or self.pending.done():
+            self.pending = asyncio.ensure_future(self._poll())
+
+        await asyncio.shield(self.pending)
+
+    async def _poll(self):
+        loop = asyncio.get_event_loop()
+        delay = self.last_poll + POLL_INTERVAL - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        self.last_poll = loop.time()
+        started_at = datetime.utcnow()
+
+        # Read newest first, one request's worth. Passing "after" doesn't
+        # work, discord.py reads from the oldest entry then. Entries already
+        # seen are only kept if they were aggregated with a newer action.
+        last_id = self.last_id
+        limit = INITIAL_LIMIT if last_id is None else POLL_LIMIT
+
+        new_entries = []
+        updated_entries = []
+        try:
+            async for entry in self.guild.audit_logs(limit=limit):
+                if last_id is None or entry.id > last_id:
+                    new_entries.append(entry)
+                    continue
+
+                seen = self.find(entry)
+                if seen is not None and _count(seen) != _count(entry):
+                    updated_entries.append(entry)
+        except discord.HTTPException as error:
+            logger.warning(
+                "Unable to fetch audit log for guild '%s' (%d)",
+                self.guild.name,
+                self.guild.id,
+                exc_info=error,
+            )
+            return
+
+        # Oldest first, so the newest entries per key are the ones kept
+        for entry in reversed(new_entries):
+            self.add(entry)
+        for entry in updated_entries:
+            self.add(entry, seen_at=started_at)
+
+        self.polled_at = started_at
+
+        logger.debug(
+            "Fetched %d new and %d updated audit log entries for guild '%s' (%d)",
+            len(new_entries),
+            len(updated_entries),
+            self.guild.name,
+            self.guild.id,
+        )
+
+
+class AuditLogCache:
+    """
+    Holds the audit log state of every guild, and waits for entries on behalf
+    of the code which needs to attribute events to a moderator.
+    """
+
+    __slots__ = ("guilds",)
+
+    def __init__(self):
+        self.guilds = {}
+
+    def get(self, guild):
+        state = self.guilds.get(guild.id)
+        if state is None:
+            state = self.guilds[guild.id] = GuildAuditLog(guild)
+        return state
+
+    def forget(self, guild):
+        self.guilds.pop(guild.id, None)
+
+    async def wait_for_entries(
+        self,
+        guild,
+        actions,
+        target_id=None,
+        *,
+        since=None,
+        window=timedelta(seconds=3),
+        timeout=DEFAULT_TIMEOUT,
+        settle=None,
+        check=None,
+    ):
+        """
+        Waits up to 'timeout' seconds for audit log entries with one of the given
+        actions and the given target, created within 'window' of 'since' (a naive
+        UTC datetime, which defaults to now). Returns the matching entries, newest
+        first, or an empty list if none appeared in time.
+
+        If 'settle' is given, entries are expected to be visible that many seconds
+        after 'since', so once a poll made after then has found none, this stops
+        waiting. Events which may have no entry at all can then return early.
+        """
+
+        if not guild.me.guild_permissions.view_audit_log:
+            return []
+
+        if since is None:
+            since = datetime.utcnow()
+
+        state = self.get(guild)
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        settled_at = None if settle is None else since + timedelta(seconds=settle)
+
+        while True:
+            entries = state.lookup(actions, target_id, since, window, check)
+            if entries or loop.time() >= deadline:
+                return entries
+
+            if settled_at is not None and state.polled_at is not None:
+                if state.polled_at >= settled_at:
+                    return entries
+
+            await state.refresh()
+
+    async def wait_for_entry(self, guild, actions, target_id=None, **kwargs):
+        """
+        Like wait_for_entries(), but only returns the newest match, or None.
+        """
+
+        entries = await self.wait_for_entries(guild, actions, target_id, **kwargs)
+        return entries[0] if entries else None
@@ -0,0 +1,90 @@
+#
+# bktree.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+A Burkhard-Keller tree, for finding all items within a given distance
+of a query under a discrete metric, without comparing against every item.
+"""
+
+__all__ = ["hamming_distance", "BKTree"]
+
+
+def hamming_distance(x, y):
+    """ Gets the number of differing bits between two integers. """
+
+    return bin(x ^ y).count("1")
+
+
+class BKTree:
+    __slots__ = ("root", "size", "distance")
+
+    def __init__(self, items=(), distance=hamming_distance):
+        # Each node is a list of [item, {distance: child node}]
+        self.root = None
+        self.size = 0
+        self.distance = distance
+
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if self.root is None:
+            self.root = [item, {}]
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            parent, children = node
+            distance = self.distance(item, parent)
+            if distance == 0:
+                # Already present
+                return
+
+            child = children.get(distance)
+            if child is None:
+                children[distance] = [item, {}]
+                self.size += 1
+                return
+
+            node = child
+
+    def search(self, item, radius):
+        """
+        Returns a list of (distance, item) for every item within 'radius' of 'item'.
+        """
+
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+
+        while stack:
+            candidate, children = stack.pop()
+            distance = self.distance(item, candidate)
+            if distance <= radius:
+                results.append((distance, candidate))
+
+            # By the triangle inequality, only these subtrees can have matches
+            low, high = distance - radius, distance + radius
+            for child_distance, child in children.items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+
+        return results
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.root is not None
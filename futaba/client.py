@@ -18,21 +18,25 @@ import asyncio
 import logging
 import os
 import sys
+import time
 import traceback
-from collections import deque
 from datetime import datetime
+from functools import partial
 from io import BytesIO
 
 import aiohttp
 import discord
 from discord.ext import commands
 
+from .archive import ArchivedMessage, MessageArchive
+from .audit_log import AuditLogCache
 from .cogs.journal import Journal
 from .cogs.navi import Navi
 from .cogs.reloader import Reloader
 from .config import Configuration
 from .converters.annotations import ANNOTATIONS
 from .delayed import DelayedQueue
+from .download import HttpPool
 from .enums import Reactions
 from .exceptions import (
     CommandFailed,
@@ -42,15 +46,34 @@ from .exceptions import (
 )
 from .help import HelpCommand
 from .journal import Broadcaster, LoggingOutputListener
-from .lru import LruCache
+from .locks import KeyedLocks
+from .loop_monitor import LoopMonitor, callable_name
+from .message_cache import CompactMessageCache
+from .metrics import Counter, Gauge, MetricsRegistry, MetricsServer
+from .pipeline import MESSAGE, EventKind, EventPipeline
+from .profiler import PHASES, CommandProfile, current_profile, section
 from .punishment import PunishmentHandler
+from .reaction_state import ReactionTracker
 from .sql import SqlHandler
+from .startup import Startup, Step
 from .str_builder import StringBuilder
 from .unicode import unicode_repr
 from .utils import plural, user_discrim
 
 logger = logging.getLogger(__name__)
 
+# Rough memory cost of a full discord.Message, used to turn the
+# configured byte budget into a message count for discord.py
+FULL_MESSAGE_BYTES = 2048
+
+# Older messages can be looked up in the archive instead, if it is enabled
+MAX_MESSAGES_WITH_ARCHIVE = 10_000
+
+# In compact mode, full objects are still kept for the newest messages,
+# so that reactions and edits on them have their usual events. Edits of
+# older messages are still filtered, from the raw edit event
+COMPACT_MAX_MESSAGES = 1_000
+
 
 def ignore_command_hooks(ctx):
     if ctx.command.module == "discord.ext.commands.help":
@@ -70,8 +93,22 @@ class Bot(commands.AutoShardedBot):
         "punish",
         "error_channel",
         "message_locks",
-        "completed_commands",
+        "member_locks",
+        "reactions",
         "queue",
+        "http_pool",
+        "audit_log",
+        "archive",
+        "message_cache",
+        "pipeline",
+        "loop_monitor",
+        "startup",
+        "metrics",
+        "metrics_server",
+        "events_metric",
+        "commands_metric",
+        "command_time_metric",
+        "command_phase_metric",
     )
 
     def __init__(self, config: Configuration):
@@ -79,22 +116,117 @@ class Bot(commands.AutoShardedBot):
         self.start_time = datetime.utcnow()
         self.journal_cog = None
         self.reloader_cog = None
-        self.sql = SqlHandler(config.database_url)
+        self.startup = Startup()
+        self.metrics = MetricsRegistry(config.metrics_per_guild)
+        self.sql = SqlHandler(config.database_url, metrics=self.metrics)
         self.punish = PunishmentHandler(self)
         self.error_channel = None
-        self.message_locks = LruCache(20)
-        self.completed_commands = deque(maxlen=20)
-        self.queue = DelayedQueue(config)
+        self.message_locks = KeyedLocks("message", self.metrics)
+        self.member_locks = KeyedLocks("member", self.metrics)
+        self.queue = DelayedQueue(config, self.metrics)
+        self.http_pool = HttpPool(config)
+        self.audit_log = AuditLogCache()
+        self.pipeline = EventPipeline(self)
+        self.reactions = ReactionTracker(self)
+        self.loop_monitor = LoopMonitor(
+            self, config.monitor_lag_limit, config.monitor_slow_callback
+        )
+
+        if config.metrics_bind:
+            host, _, port = config.metrics_bind.rpartition(":")
+            self.metrics_server = MetricsServer(self.metrics, host, int(port))
+        else:
+            self.metrics_server = None
+
+        self.events_metric = self.metrics.counter(
+            "futaba_gateway_events_total", "Gateway events dispatched", ("event",)
+        )
+        self.commands_metric = self.metrics.counter(
+            "futaba_commands_total", "Commands invoked", ("command", "guild")
+        )
+        self.command_time_metric = self.metrics.histogram(
+            "futaba_command_seconds", "Time taken to run commands", ("command",)
+        )
+        self.command_phase_metric = self.metrics.histogram(
+            "futaba_command_phase_seconds",
+            "Time commands spent in converters, SQL and Discord API requests",
+            ("command", "phase"),
+        )
+
+        if config.message_cache_mode == "compact":
+            self.message_cache = CompactMessageCache(config.message_cache_bytes)
+            max_messages = COMPACT_MAX_MESSAGES
+        else:
+            self.message_cache = None
+            max_messages = config.message_cache_bytes // FULL_MESSAGE_BYTES
+
+        if config.archive_path:
+            self.archive = MessageArchive(
+                config.archive_path,
+                config.archive_retention_days,
+                config.archive_batch_size,
+            )
+            max_messages = min(max_messages, MAX_MESSAGES_WITH_ARCHIVE)
+        else:
+            self.archive = None
 
         super().__init__(
             command_prefix=self.my_command_prefix,
             description="futaba - A discord mod bot",
-            max_messages=100_000,
+            max_messages=max_messages,
             fetch_offline_members=True,
         )
 
         self.help_command = HelpCommand()
 
+        # Attribute Discord API time to the running command, if any
+        request = self.http.request
+
+        async def timed_request(*args, **kwargs):
+            with section("api"):
+                return await request(*args, **kwargs)
+
+        self.http.request = timed_request
+
+        self.add_listener(self.pipeline.on_message, "on_message")
+        self.add_listener(self.pipeline.on_member_update, "on_member_update")
+
+        if self.message_cache is not None:
+            self.pipeline.register(
+                MESSAGE, "cache", self.cache_message, 0, (EventKind.GUILD,)
+            )
+
+        self.metrics.register_callback(
+            Gauge,
+            "futaba_gateway_latency_seconds",
+            "Average heartbeat latency to Discord",
+            lambda: self.latency,
+        )
+        if self.message_cache is not None:
+            cache = self.message_cache
+            self.metrics.register_callback(
+                Gauge,
+                "futaba_message_cache_bytes",
+                "Estimated memory used by the compact message cache",
+                lambda: cache.bytes_used,
+            )
+            self.metrics.register_callback(
+                Counter,
+                "futaba_message_cache_hits_total",
+                "Compact message cache lookups which found the message",
+                lambda: cache.hits,
+            )
+            self.metrics.register_callback(
+                Counter,
+                "futaba_message_cache_misses_total",
+                "Compact message cache lookups which missed",
+                lambda: cache.misses,
+            )
+
+        self.metrics.register_callback(
+            Gauge, "futaba_guilds", "Guilds the bot is in", lambda: len(self.guilds)
+        )
+
     @staticmethod
     def my_command_prefix(bot, message):
         prefix = bot.prefix(message.guild)
@@ -127,28 +259,38 @@ class Bot(commands.AutoShardedBot):
         else:
             self.run(self.config.token)
 
+    async def close(self):
+        """
+        Releases the bot's own resources before disconnecting from Discord.
+        """
+
+        self.loop_monitor.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.http_pool.close()
+        if self.archive is not None:
+            await self.archive.close()
+        await super().close()
+
     async def on_ready(self):
         """
         After the bot has logged in and filled up its cache.
         Sets up the bot's state, loads cogs then prints a 'ready' message.
         """
 
+        # Also sent after reconnecting, but everything below only happens once
+        if self.startup.started:
+            logger.info("Reconnected, skipping startup")
+            return
+
+        self.startup.started = True
+
         # Get error channel
         if self.config.error_channel_id:
             channel = self.get_channel(self.config.error_channel_id)
             if isinstance(channel, discord.TextChannel):
                 self.error_channel = channel
 
-        # Setup mandatory cogs
-        self.add_cog(Journal(self))
-        logger.info("Loaded mandatory cog: Journal")
-
-        self.add_cog(Navi(self))
-        logger.info("Loaded mandatory cog: Navi")
-
-        self.add_cog(Reloader(self))
-        logger.info("Loaded mandatory cog: Reloader")
-
         def _cog_ok(cog):
             # Special files
             if cog.startswith("_"):
@@ -161,11 +303,7 @@ class Bot(commands.AutoShardedBot):
             # Cog is a directory
             return os.path.isdir(f"futaba/cogs/{cog}")
 
-        files = [cog for cog in os.listdir("futaba/cogs") if _cog_ok(cog)]
-        logger.info("Cogs found: %s", ", ".join(files))
-
-        # Load cogs
-        for file in files:
+        def _load_cog(file):
             try:
                 self.load_extension(f"futaba.cogs.{file}")
             except Exception as error:
@@ -176,19 +314,53 @@ class Bot(commands.AutoShardedBot):
             else:
                 logger.info("Loaded cog: %s", file)
 
+        def _add_cog(cls):
+            self.add_cog(cls(self))
+            logger.info("Loaded mandatory cog: %s", cls.__name__)
+
+        files = [cog for cog in os.listdir("futaba/cogs") if _cog_ok(cog)]
+        logger.info("Cogs found: %s", ", ".join(files))
+
+        # Every other cog needs the Journal for its broadcaster
+        steps = [Step("Journal", partial(_add_cog, Journal), ())]
+        for cls in (Navi, Reloader):
+            steps.append(Step(cls.__name__, partial(_add_cog, cls), ("Journal",)))
+        for file in files:
+            steps.append(Step(file, partial(_load_cog, file), ("Journal",)))
+        await self.startup.run_phase("cogs", steps)
+
         # Register logger to catch journal events
         listener = LoggingOutputListener(self.journal_cog.router, "/")
         self.journal_cog.router.register(listener)
 
         # Performing migrations
-        self.sql.guilds.migrate(self)
+        await self.startup.run_phase(
+            "database", [Step("migrate", partial(self.sql.guilds.migrate, self), ())]
+        )
 
-        # Initialize cog databases
-        for cog in self.get_cogs():
-            cog.setup()
+        # Initialize cog databases, each after the cogs it depends on
+        cogs = list(self.get_cogs())
+        await self.startup.run_phase(
+            "setup",
+            [Step(cog.qualified_name, cog.setup, cog.setup_after) for cog in cogs],
+        )
 
         # Start processing backlogged events
         self.queue.start(self.loop)
+        self.loop_monitor.start()
+
+        if self.metrics_server is not None:
+            try:
+                await self.metrics_server.start()
+            except OSError as error:
+                logger.error("Unable to start metrics server", exc_info=error)
+
+        self.startup.log_report()
+
+        # Non-critical work, such as refreshing caches, once the bot is up
+        self.startup.defer(
+            "warmup", [Step(cog.qualified_name, cog.warmup, ()) for cog in cogs]
+        )
 
         # Finished
         pyver = sys.version_info
@@ -202,6 +374,40 @@ class Bot(commands.AutoShardedBot):
         logger.info("------")
         logger.info("Ready!")
 
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        # Every listener is watched, so time spent blocking can be traced to it
+        name = f"{event_name}: {callable_name(coro)}"
+
+        def watched(*args, **kwargs):
+            return self.loop_monitor.watch("listener", name, coro(*args, **kwargs))
+
+        await super()._run_event(watched, event_name, *args, **kwargs)
+
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            await super().invoke(ctx)
+            return
+
+        name = ctx.command.qualified_name
+        self.commands_metric.inc(labels=(name, self.metrics.guild(ctx.guild)))
+
+        profile = CommandProfile(name)
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.loop_monitor.watch("command", name, super().invoke(ctx))
+        finally:
+            self.command_time_metric.observe(time.perf_counter() - start, (name,))
+            current_profile.reset(token)
+            profile.closed = True
+
+            for phase in PHASES:
+                self.command_phase_metric.observe(profile.phases[phase], (name, phase))
+
+    def dispatch(self, event_name, *args, **kwargs):
+        self.events_metric.inc(labels=(event_name,))
+        super().dispatch(event_name, *args, **kwargs)
+
     def get_broadcaster(self, root):
         """
         A utility method for instantiating a bound Broadcaster on the given path.
@@ -244,41 +450,42 @@ class Bot(commands.AutoShardedBot):
         with self.sql.transaction():
             self.sql.guilds.deactivate_guild(guild)
 
+    async def cache_message(self, event):
+        """
+        Keeps a compact snapshot of every guild message.
+        Edits are applied by the Tracker, which needs the previous content first.
+        """
+
+        self.message_cache.add(ArchivedMessage.from_message(event.message))
+
     def message_lock(self, message):
-        return self.message_locks.get_or_put(message, asyncio.Lock)
+        return self.message_locks(message.id)
+
+    def member_lock(self, member):
+        """
+        Serializes moderation actions on a member, such as punishments
+        which save and restore their other roles.
+        """
+
+        return self.member_locks((member.guild.id, member.id))
 
     async def on_command(self, ctx):
         """
-        Handles pre-command instructions, such as adding the "wait" reaction.
+        Handles pre-command instructions, such as scheduling the "wait" reaction.
         """
 
         if ignore_command_hooks(ctx):
             return
 
-        self.loop.create_task(self._add_waiting(ctx.message))
-
-    async def _add_waiting(self, message):
-        await asyncio.sleep(0.5)
-
-        async with self.message_lock(message):
-            if message not in self.completed_commands:
-                await Reactions.WAITING.add(message)
+        self.reactions.start(ctx.message)
 
     async def on_command_completion(self, ctx):
         """
         Handles successful commands.
-        Adds the success reaction and removes all others.
+        Adds the success reaction and removes any others the bot added.
         """
 
-        async with self.message_lock(ctx.message):
-            try:
-                if isinstance(ctx.channel, discord.abc.GuildChannel):
-                    await ctx.message.clear_reactions()
-
-                await Reactions.SUCCESS.add(ctx.message)
-                self.completed_commands.append(ctx.message)
-            except discord.NotFound:
-                pass
+        await self.reactions.finish(ctx.message, Reactions.SUCCESS)
 
     async def on_command_error(self, ctx, error):
         """
@@ -292,15 +499,12 @@ class Bot(commands.AutoShardedBot):
         if ignore_command_hooks(ctx):
             return
 
-        async with self.message_lock(ctx.message):
-            try:
-                if isinstance(ctx.channel, discord.abc.GuildChannel):
-                    await ctx.message.clear_reactions()
+        await self.reactions.finish(ctx.message)
 
-                await self.handle_error(ctx, error)
-                self.completed_commands.append(ctx.message)
-            except discord.NotFound:
-                pass
+        try:
+            await self.handle_error(ctx, error)
+        except discord.NotFound:
+            pass
 
     async def handle_error(self, ctx, error):
         if isinstance(error, commands.errors.CommandNotFound):
@@ -20,9 +20,20 @@ from discord.ext import commands
 class AbstractCog(commands.Cog):
     __slots__ = ("bot",)
 
+    # Names of cogs whose setup() must finish before this one's
+    setup_after = ()
+
     def __init__(self, bot):
         self.bot = bot
 
     @abstractmethod
     def setup(self):
-        pass
+        """
+        Loads the cog's state at startup. This may be a coroutine function,
+        in which case it runs alongside the setup of other cogs.
+        """
+
+    async def warmup(self):
+        """
+        Non-critical startup work, run in the background once the bot is ready.
+        """
@@ -16,15 +16,17 @@ Cog for authentication schemes and token generation
 
 import logging
 from datetime import datetime
-from jose import jwt
 
 import discord
 from discord.ext import commands
 
+from futaba.lazy import lazy_import
 from ..abc import AbstractCog
 
 logger = logging.getLogger(__name__)
 
+jwt = lazy_import("jose.jwt")
+
 __all__ = ["Authentication"]
 
 
@@ -11,6 +11,7 @@
 #
 
 from futaba.enums import FilterType
+from futaba.pipeline import MEMBER_UPDATE, MESSAGE, EventKind
 from futaba.utils import async_partial
 from .check import check_message, check_message_edit
 from .manage import add_filter, delete_filter, show_filter
@@ -24,10 +25,24 @@ def setup(bot):
 
 def setup_filtering(bot):
     cog = Filtering(bot)
-    bot.add_listener(cog.check_message, "on_message")
+    # Deleted messages are looked up in the cache, so it must have them first
+    bot.pipeline.register(
+        MESSAGE, "filter", cog.message_stage, 10, (EventKind.GUILD,), after=("cache",)
+    )
     bot.add_listener(cog.check_message_edit, "on_message_edit")
+    bot.add_listener(cog.check_raw_message_edit, "on_raw_message_edit")
     bot.add_listener(cog.check_member_join, "on_member_join")
-    bot.add_listener(cog.check_member_update, "on_member_update")
+    bot.pipeline.register(
+        MEMBER_UPDATE,
+        "filter",
+        cog.check_member_update,
+        10,
+        (EventKind.ROLES, EventKind.NAME, EventKind.NICK),
+    )
+    bot.add_listener(cog.member_remove, "on_member_remove")
+    bot.add_listener(cog.channel_update, "on_guild_channel_update")
+    bot.add_listener(cog.role_update, "on_guild_role_update")
+    bot.add_listener(cog.role_delete, "on_guild_role_delete")
     bot.add_cog(cog)
 
 
@@ -13,13 +13,18 @@
 import asyncio
 import logging
 import os
+import time
 
 import discord
 from discord import MessageType
 
 from futaba.enums import FilterType, LocationType, NameType
 from futaba.permissions import is_admin_perm
+from futaba.pipeline import EventKind
 from futaba.str_builder import StringBuilder
+from futaba.utils import escape_backticks, plural
+from ..filter import find_matching_strings
+from ..progress import ProgressReporter
 from .common import MASK_NICK
 from .file import FoundFileViolation, check_file_filter
 from .name import FoundNameViolation, check_name_filter
@@ -29,18 +34,41 @@ logger = logging.getLogger(__name__)
 
 __all__ = [
     "MASK_NICK",
+    "filter_immune",
     "check_message",
     "check_message_edit",
+    "check_raw_message_edit",
     "check_member_update",
     "check_all_members_on_filter",
 ]
 
+# Number of names matched per batch when re-scanning members
+NAME_SCAN_CHUNK = 2000
 
-def filter_immune(bot, guild, member, channel=None):
+# Delay between punishments when re-scanning members, in seconds
+ENFORCE_DELAY = 0.5
+
+
+def filter_immune(cog, guild, member, channel=None):
     """
     Checks for certain people who are not subject to the filter's effects.
+    Decisions are memoized in the cog's immunity cache.
     """
 
+    immune = cog.immunity_cache.get(guild, member, channel)
+    if immune is None:
+        immune = _filter_immune(cog.bot, guild, member, channel)
+        if immune is None:
+            # Couldn't be determined, so don't cache
+            return False
+
+        cog.immunity_cache.store(guild, member, channel, immune)
+
+    return immune
+
+
+def _filter_immune(bot, guild, member, channel):
+
     # This is a boolean function with lots of ifs/returns for readability
     # pylint: disable=too-many-return-statements
 
@@ -68,7 +96,7 @@ def filter_immune(bot, guild, member, channel=None):
         member = guild.get_member(id)
         if member is None:
             logger.warning("Cannot find member for user ID %d", id)
-            return False
+            return None
 
     # Fetch most specific permissions
     if channel is None:
@@ -107,7 +135,7 @@ async def check_message(cog, message):
         return
 
     # Check filter immunity
-    if filter_immune(cog.bot, message.guild, message.author, message.channel):
+    if filter_immune(cog, message.guild, message.author, message.channel):
         logger.debug("This user is immune to the filter")
         return
 
@@ -133,10 +161,113 @@ async def check_message_edit(cog, before, after):
     await check_message(cog, after)
 
 
-async def check_all_members_on_filter(cog, guild, filter):
+async def check_raw_message_edit(cog, payload):
+    """
+    Checks edits of messages which discord.py no longer has cached, and so
+    doesn't dispatch on_message_edit() for. The message is rebuilt from
+    the update's data.
+    """
+
+    # Cached messages are checked by check_message_edit()
+    if payload.cached_message is not None:
+        return
+
+    # Updates without content, such as link embeds being added, change nothing
+    data = payload.data
+    if "guild_id" not in data or "content" not in data or "author" not in data:
+        return
+
+    guild = cog.bot.get_guild(int(data["guild_id"]))
+    if guild is None:
+        return
+
+    channel = guild.get_channel(payload.channel_id)
+    if channel is None:
+        return
+
+    try:
+        message = discord.Message(state=channel._state, channel=channel, data=data)
+    except (KeyError, TypeError, ValueError) as error:
+        logger.debug(
+            "Unable to build edited message %d from its update",
+            payload.message_id,
+            exc_info=error,
+        )
+        return
+
+    # Immunity checks need the member, not just the user
+    if not isinstance(message.author, discord.Member):
+        member = guild.get_member(message.author.id)
+        if member is None:
+            return
+        message.author = member
+
+    logger.debug("Checking uncached message edit")
+    await check_message(cog, message)
+
+
+def _collect_names(guild):
+    names = []
+    for member in guild.members:
+        names.append((member, member.name, NameType.USER))
+        if member.nick is not None and member.nick != MASK_NICK:
+            names.append((member, member.nick, NameType.NICK))
+    return names
+
+
+async def _match_names(cog, filter, names, progress):
+    """
+    First phase of a member re-scan. Matches the filter against the
+    given names in batches, without making any API calls, and returns
+    the entries which matched along with how many names couldn't be checked.
+    """
+
+    hits = []
+    skipped = 0
+
+    for start in range(0, len(names), NAME_SCAN_CHUNK):
+        chunk = [name for _, name, _ in names[start : start + NAME_SCAN_CHUNK]]
+
+        try:
+            indices = await cog.offloader.run(
+                sum(map(len, chunk)),
+                cog.offloader.inline_chars,
+                find_matching_strings,
+                filter.pattern,
+                chunk,
+            )
+        except Exception as error:
+            logger.error(
+                "Unable to match %d names against filter %r",
+                len(chunk),
+                filter.text,
+                exc_info=error,
+            )
+            skipped += len(chunk)
+        else:
+            hits.extend(names[start + i] for i in indices)
+
+        await progress.update(
+            f"Matching names against filter `{escape_backticks(filter.text)}`: "
+            f"checked {min(start + NAME_SCAN_CHUNK, len(names))} of {len(names)}, "
+            f"{len(hits)} hit{plural(len(hits))} so far"
+        )
+
+        # Let other events through between batches
+        await asyncio.sleep(0)
+
+    return hits, skipped
+
+
+async def check_all_members_on_filter(cog, guild, filter, author=None):
     """
     Checks all members in the guild against the given filter.
     See also check_name_filter.
+
+    This runs in two phases: first every name is matched in bulk, and then
+    only the members who were hit are checked for immunity and punished,
+    with a delay between each to stay clear of rate limits. If an author is
+    given, they are sent a progress report which is updated as it runs.
     """
 
     logger.debug("Checking members against new filter: %r", filter.text)
@@ -148,25 +279,85 @@ async def check_all_members_on_filter(cog, guild, filter):
         )
         return
 
-    # Run filter checks on members, with delays
-    for member in guild.members:
+    progress = ProgressReporter(author)
+    escaped_filter_text = escape_backticks(filter.text)
+    names = _collect_names(guild)
+    start = time.perf_counter()
+    hits, skipped = await _match_names(cog, filter, names, progress)
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        "Matched %d names against filter %r in %.3f seconds, found %d hits",
+        len(names),
+        filter.text,
+        elapsed,
+        len(hits),
+    )
+
+    summary = StringBuilder(
+        f"Checked {len(names)} name{plural(len(names))} against filter "
+        f"`{escaped_filter_text}` in {elapsed:.2f} seconds, "
+        f"found {len(hits)} hit{plural(len(hits))}."
+    )
+    if skipped:
+        summary.write(f" {skipped} name{plural(skipped)} could not be checked.")
+
+    if not hits:
+        await progress.update(str(summary), final=True)
+        return
+
+    # Enforce only on the hits
+    renamed = set()
+    enforced = 0
+
+    for i, (member, name, name_type) in enumerate(hits, 1):
+        if filter.text not in cog.filters[guild]:
+            logger.info("Filter %r was removed, stopping member re-scan", filter.text)
+            summary.write(" The filter was removed before enforcement finished.")
+            break
+
+        # Skip anyone who left or changed names since they were matched
+        if guild.get_member(member.id) is None:
+            continue
+
+        current = member.name if name_type == NameType.USER else member.nick
+        if current != name or member.id in renamed:
+            continue
+
+        if filter_immune(cog, guild, member):
+            continue
+
         logger.debug(
             "Checking member '%s' (%d) against new filter", member.name, member.id
         )
 
-        if filter_immune(cog.bot, guild, member):
-            continue
+        try:
+            # We're using the existing functions to avoid duplicating functionality
+            removed = await check_name_filter(
+                cog, name, name_type, member, only_filter=filter
+            )
+        except discord.HTTPException as error:
+            logger.warning(
+                "Unable to enforce name filter on '%s' (%d)",
+                member.name,
+                member.id,
+                exc_info=error,
+            )
+        else:
+            enforced += 1
 
-        # We're using the existing functions to avoid duplicating functionality
-        await check_name_filter(
-            cog, member.name, NameType.USER, member, only_filter=filter
+            # Hiding the username masks the nickname, don't remove it again.
+            # Lower levels leave both names, so the nickname is still checked.
+            if removed and name_type == NameType.USER:
+                renamed.add(member.id)
+
+        await progress.update(
+            f"{summary} Enforcing: {i} of {len(hits)} hit{plural(len(hits))} processed."
         )
-        if member.nick is not None:
-            await check_name_filter(
-                cog, member.nick, NameType.NICK, member, only_filter=filter
-            )
+        await asyncio.sleep(ENFORCE_DELAY)
 
-        await asyncio.sleep(0.01)
+    summary.write(f" Enforced on {enforced} name{plural(enforced)}.")
+    await progress.update(str(summary), final=True)
 
 
 async def check_member_join(cog, member):
@@ -188,7 +379,7 @@ async def check_member_join(cog, member):
         return
 
     # Check filter immunity
-    if filter_immune(cog.bot, guild, member):
+    if filter_immune(cog, guild, member):
         return
 
     # Cannot be parallelized because we can only renick if the username is ok
@@ -197,15 +388,21 @@ async def check_member_join(cog, member):
         await check_name_filter(cog, member.nick, NameType.NICK, member)
 
 
-async def check_member_update(cog, before, after):
+async def check_member_update(cog, update):
     """
     Checks the member update against all text filters to ensure
     they didn't change their username or nickname to something
     inappropriate.
     """
 
+    guild = update.guild
+    before, after = update.before, update.after
+
+    # Immunity may depend on the member's roles
+    if EventKind.ROLES in update.kinds:
+        cog.immunity_cache.invalidate_member(guild, after)
+
     # Check that we actually have permissions to manage roles
-    guild = before.guild
     if not guild.me.guild_permissions.manage_roles:
         logger.debug(
             "Lacks permissions to manage roles in guild '%s' (%d)",
@@ -215,14 +412,14 @@ async def check_member_update(cog, before, after):
         return
 
     # Check filter immunity
-    if filter_immune(cog.bot, guild, after):
+    if filter_immune(cog, guild, after):
         return
 
     # Cannot be parallelized because we can only renick if the username is ok
-    if before.name != after.name:
+    if EventKind.NAME in update.kinds:
         await check_name_filter(cog, after.name, NameType.USER, after)
 
-    if before.nick != after.nick and after.nick is not None:
+    if EventKind.NICK in update.kinds and after.nick is not None:
         if after.nick == MASK_NICK:
             logger.debug("User has masked nickname, ignoring")
             return
@@ -10,15 +10,22 @@
 # WITHOUT ANY WARRANTY. See the LICENSE file for more details.
 #
 
+import asyncio
+import logging
 from collections import namedtuple
 
+import discord
+
 from futaba.enums import FilterType
 
+logger = logging.getLogger(__name__)
+
 __all__ = [
     "MASK_NICK",
     "JournalProperties",
     "journal_violation",
     "journal_name_violation",
+    "filter_check_failed",
 ]
 
 # The nickname to apply to cover up an offensive username
@@ -81,3 +88,42 @@ def journal_name_violation(
         filter_text=filter_text,
         flagged=flagged,
     )
+
+
+async def filter_check_failed(cog, head, message, error):
+    """
+    Handles a filter check which could not be completed, because the offloaded
+    job timed out or raised. Depending on the guild's policy, the message is
+    either let through (fail open) or deleted (fail closed).
+    """
+
+    settings = cog.bot.sql.filter.get_settings(message.guild)
+    reason = "timed out" if isinstance(error, asyncio.TimeoutError) else "failed"
+    policy = "deleted" if settings.fail_closed else "allowed"
+
+    logger.info(
+        "Filter check (%s) on message id %d %s, message %s",
+        head,
+        message.id,
+        reason,
+        policy,
+    )
+
+    content = (
+        f"Filter check for message {message.id} by {message.author.mention} "
+        f"in {message.channel.mention} {reason}, message was {policy}"
+    )
+    cog.journal.send(
+        f"{head}/failure",
+        message.guild,
+        content,
+        icon="warning",
+        message=message,
+        fail_closed=settings.fail_closed,
+    )
+
+    if settings.fail_closed:
+        try:
+            await message.delete()
+        except discord.NotFound:
+            pass
@@ -0,0 +1,166 @@
+#
+# cogs/filter/check/digest.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Caches the digests (SHA1 and perceptual hash) of previously downloaded
+files, so that reposted links and attachments (or edits of messages
+containing them) don't need to be fetched and hashed again.
+"""
+
+import asyncio
+import logging
+from collections import namedtuple
+from urllib.parse import urlsplit, urlunsplit
+
+from futaba.lru import LruCache
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["FileDigest", "DigestCache", "normalize_url", "attachment_key"]
+
+# Maximum number of URLs whose digests are remembered
+MAX_ENTRIES = 4096
+
+# How long a successfully computed digest is kept, in seconds
+DIGEST_TTL = 6 * 60 * 60
+
+# How long a failed or oversized download is remembered, in seconds
+NEGATIVE_TTL = 10 * 60
+
+_MISSING = object()
+
+DISCORD_CDN_HOSTS = frozenset(("cdn.discordapp.com", "media.discordapp.net"))
+
+# The perceptual hash is None if the file is not a decodable image
+FileDigest = namedtuple("FileDigest", ("sha1", "phash"))
+
+
+async def _none():
+    return None
+
+
+def attachment_key(attachment):
+    return f"attachment:{attachment.id}"
+
+
+def normalize_url(url):
+    """
+    Produces a cache key for the given URL. The scheme and hostname are
+    case-insensitive and fragments are never sent to the server, so both
+    are normalized away. Discord CDN attachment links are keyed by their
+    attachment ID, so that they share an entry with the attachment itself.
+    """
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+
+    if netloc in DISCORD_CDN_HOSTS:
+        path = parts.path.split("/")
+        # Format: /attachments/<channel id>/<attachment id>/<filename>
+        if len(path) >= 4 and path[1] == "attachments" and path[3].isdigit():
+            return f"attachment:{path[3]}"
+
+        # Query strings on the CDN are only resizing or signing parameters
+        return urlunsplit((scheme, netloc, parts.path, "", ""))
+
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+class DigestCache:
+    """
+    An LRU cache of URL keys to FileDigest objects, with expiry. Downloads
+    which failed or were too large are cached as None for a shorter period.
+    """
+
+    __slots__ = ("entries", "hits", "misses")
+
+    def __init__(self, max_size=MAX_ENTRIES):
+        self.entries = LruCache(max_size, ttl=DIGEST_TTL)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """
+        Returns a tuple of (found, digest). If the entry is a cached failure,
+        then found is True but the digest is None.
+        """
+
+        digest = self.entries.get(key, _MISSING)
+        if digest is _MISSING:
+            return False, None
+
+        return True, digest
+
+    def store(self, key, digest):
+        ttl = NEGATIVE_TTL if digest is None else DIGEST_TTL
+        self.entries.put(key, digest, ttl=ttl)
+
+    def flush(self):
+        logger.info("Flushing %d cached file digests", len(self.entries))
+        self.entries.clear()
+
+    async def get_digests(self, http_pool, targets, hasher):
+        """
+        Takes an iterable of (url, key) pairs, and returns a list of
+        (digest, binio) pairs in the same order. Only URLs not in the
+        cache are downloaded, so binio is None for cache hits and failures.
+
+        The hasher is a coroutine function which receives the downloaded
+        bytes and returns a FileDigest. If it raises for any file, the other
+        digests are still cached, and then the first exception is re-raised.
+        """
+
+        targets = list(targets)
+        results = [None] * len(targets)
+        to_fetch = {}
+
+        for i, (url, key) in enumerate(targets):
+            found, digest = self.lookup(key)
+            if found:
+                self.hits += 1
+                results[i] = (digest, None)
+            else:
+                self.misses += 1
+                to_fetch.setdefault(key, (url, []))[1].append(i)
+
+        if not to_fetch:
+            logger.debug("All %d file digests were cached", len(targets))
+            return results
+
+        fetch_items = list(to_fetch.items())
+        buffers = await asyncio.gather(
+            *[http_pool.download_link(url) for _, (url, _) in fetch_items]
+        )
+
+        digests = await asyncio.gather(
+            *[
+                hasher(binio.getvalue()) if binio is not None else _none()
+                for binio in buffers
+            ],
+            return_exceptions=True,
+        )
+
+        error = None
+        for (key, (_, indices)), binio, digest in zip(fetch_items, buffers, digests):
+            if isinstance(digest, BaseException):
+                error = error or digest
+                continue
+
+            self.store(key, digest)
+            for i in indices:
+                results[i] = (digest, binio)
+
+        if error is not None:
+            raise error
+
+        return results
@@ -14,20 +14,26 @@ import asyncio
 import logging
 import os
 from collections import namedtuple
-from hashlib import sha1
 from urllib.parse import urlparse
 
 import discord
 
-from futaba.download import download_links
 from futaba.enums import FilterType
 from futaba.str_builder import StringBuilder
-from futaba.utils import URL_REGEX
-from .common import journal_violation
+from futaba.utils import URL_REGEX, async_partial
+from .common import filter_check_failed, journal_violation
+from .digest import FileDigest, attachment_key, normalize_url
+from .phash import file_digests
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["FoundFileViolation", "check_file_filter"]
+__all__ = [
+    "FoundFileViolation",
+    "hash_file",
+    "get_file_targets",
+    "check_file_filter",
+    "find_file_violation",
+]
 
 
 FoundFileViolation = namedtuple(
@@ -36,22 +42,65 @@ FoundFileViolation = namedtuple(
 )
 
 
+async def hash_file(cog, data):
+    """
+    Computes the digests of a downloaded file. Large files are handled
+    in the worker pool, so that hashing and image decoding don't block
+    the event loop.
+    """
+
+    sha1_digest, phash = await cog.offloader.run_file(data, file_digests, data)
+    return FileDigest(sha1=sha1_digest, phash=phash)
+
+
+def get_file_targets(message):
+    """
+    Gets the (url, cache key) pairs of every file linked or attached to a message.
+    """
+
+    targets = [(url, normalize_url(url)) for url in URL_REGEX.findall(message.content)]
+    targets.extend(
+        (attach.url, attachment_key(attach)) for attach in message.attachments
+    )
+    return targets
+
+
 async def check_file_filter(cog, message):
-    file_urls = URL_REGEX.findall(message.content)
-    file_urls.extend(attach.url for attach in message.attachments)
+    targets = get_file_targets(message)
+    if not targets:
+        return
 
-    if not file_urls:
+    try:
+        results = await cog.digest_cache.get_digests(
+            cog.bot.http_pool, targets, async_partial(hash_file, cog)
+        )
+    except Exception as error:
+        await filter_check_failed(cog, "file", message, error)
         return
 
-    triggered = None
-    buffers = await download_links(file_urls)
+    triggered = find_file_violation(cog, message, targets, results)
+    if triggered is not None:
+        settings = cog.bot.sql.filter.get_settings(message.guild)
+        await found_file_violation(triggered, settings.reupload)
+
+
+def find_file_violation(cog, message, targets, results):
+    """
+    Finds the most severe file filter matched by a message, given the results
+    of DigestCache.get_digests() for its targets. Returns None if there are none.
+    """
+
     hashsums = {}
+    phashes = []
 
-    for binio, url in zip(buffers, file_urls):
-        if binio is not None:
-            digest = sha1(binio.getbuffer()).digest()
-            hashsums[digest] = (binio, url)
+    for (digest, binio), (url, _) in zip(results, targets):
+        if digest is not None:
+            hashsums[digest.sha1] = (binio, url)
+            if digest.phash is not None:
+                phashes.append((digest.phash, binio, url))
 
+    # Exact matches, by SHA1 digest
+    triggered = None
     for hashsum, (filter_type, _) in cog.content_filters[message.guild].items():
         try:
             binio, url = hashsums[hashsum]
@@ -59,7 +108,7 @@ async def check_file_filter(cog, message):
             # Hash sum not found, not a match
             continue
 
-        if triggered is None or filter_type.value > triggered.filter_type.value:
+        if triggered is None or filter_type.level > triggered.filter_type.level:
             triggered = FoundFileViolation(
                 bot=cog.bot,
                 journal=cog.journal,
@@ -70,9 +119,23 @@ async def check_file_filter(cog, message):
                 hashsum=hashsum,
             )
 
-    if triggered is not None:
-        settings = cog.bot.sql.filter.get_settings(message.guild)
-        await found_file_violation(triggered, settings.reupload)
+    # Near-duplicate matches, by perceptual hash
+    index = cog.perceptual_index.get(message.guild)
+    if index:
+        for phash, binio, url in phashes:
+            for match, filter_type in index.search(phash):
+                if triggered is None or filter_type.level > triggered.filter_type.level:
+                    triggered = FoundFileViolation(
+                        bot=cog.bot,
+                        journal=cog.journal,
+                        message=message,
+                        filter_type=filter_type,
+                        url=url,
+                        binio=binio,
+                        hashsum=match.to_bytes(8, "big"),
+                    )
+
+    return triggered
 
 
 async def found_file_violation(triggered, reupload):
@@ -98,9 +161,14 @@ async def found_file_violation(triggered, reupload):
         message.author.id,
     )
 
-    roles = bot.sql.get_special_roles(message.guild)
+    roles = bot.sql.settings.get_special_roles(message.guild)
     severity = filter_type.level
 
+    if reupload and binio is None and severity >= FilterType.BLOCK.level:
+        # The digest was cached, so we need to fetch the file itself now
+        binio = await bot.http_pool.download_link(url)
+        reupload = binio is not None
+
     async def message_violator():
         logger.debug("Sending message to user who violated the filter")
         response = StringBuilder()
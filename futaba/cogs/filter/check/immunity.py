@@ -0,0 +1,90 @@
+#
+# cogs/filter/check/immunity.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Memoizes filter immunity decisions, since computing channel permissions
+walks every role and overwrite of the member, and the result rarely changes.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["ImmunityCache"]
+
+
+class ImmunityCache:
+    """
+    Maps (guild ID, member ID) to a dictionary of channel ID to whether
+    that member is filter immune there. Guild-wide decisions are stored
+    under the channel ID None.
+
+    Entries must be invalidated whenever anything the decision depends on
+    changes: the member's roles, a channel's overwrites, a role's
+    permissions, the guild's filter settings, or its immunity list.
+    """
+
+    __slots__ = ("entries", "hits", "misses")
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, guild, member, channel):
+        """
+        Returns the cached decision, or None if it isn't present.
+        """
+
+        decisions = self.entries.get((guild.id, member.id))
+        if decisions is not None:
+            channel_id = None if channel is None else channel.id
+            immune = decisions.get(channel_id)
+            if immune is not None:
+                self.hits += 1
+                return immune
+
+        self.misses += 1
+        return None
+
+    def store(self, guild, member, channel, immune):
+        channel_id = None if channel is None else channel.id
+        self.entries.setdefault((guild.id, member.id), {})[channel_id] = immune
+
+    def invalidate_member(self, guild, member):
+        logger.debug(
+            "Invalidating filter immunity for member '%s' (%d)", member.name, member.id
+        )
+        self.entries.pop((guild.id, member.id), None)
+
+    def invalidate_channel(self, channel):
+        logger.debug(
+            "Invalidating filter immunity for channel #%s (%d)",
+            channel.name,
+            channel.id,
+        )
+
+        guild_id = channel.guild.id
+        for (entry_guild_id, _), decisions in self.entries.items():
+            if entry_guild_id == guild_id:
+                decisions.pop(channel.id, None)
+
+    def invalidate_guild(self, guild):
+        logger.debug(
+            "Invalidating filter immunity for guild '%s' (%d)", guild.name, guild.id
+        )
+
+        self.entries = {
+            key: decisions
+            for key, decisions in self.entries.items()
+            if key[0] != guild.id
+        }
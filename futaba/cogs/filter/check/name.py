@@ -29,6 +29,7 @@ FoundNameViolation = namedtuple("FoundNameViolation", ("filter_type", "filter_te
 async def check_name_filter(cog, name, name_type, member, only_filter=None):
     """
     Checks the given name against all filters, and enforces with a dunce.
+    Returns True if the name was removed from the member.
     """
 
     logger.debug("Checking name: %r", name)
@@ -54,7 +55,7 @@ async def check_name_filter(cog, name, name_type, member, only_filter=None):
 
     if triggered is None:
         logger.debug("No name violations found!")
-        return
+        return False
 
     filter_type = triggered.filter_type
     filter_text = triggered.filter_text
@@ -93,6 +94,7 @@ async def check_name_filter(cog, name, name_type, member, only_filter=None):
 
     severity = filter_type.level
     jail_anyways = False
+    removed = False
 
     if severity >= FilterType.FLAG.level:
         logger.info("Notifying staff of filter violation")
@@ -120,6 +122,7 @@ async def check_name_filter(cog, name, name_type, member, only_filter=None):
             )
         else:
             raise ValueError(f"Unknown value for NameType: {name_type!r}")
+        removed = True
 
     if severity >= FilterType.JAIL.level or jail_anyways:
         if roles.jail is None:
@@ -136,3 +139,5 @@ async def check_name_filter(cog, name, name_type, member, only_filter=None):
                     member.guild, member, "Jailed for violating name filter"
                 ),
             )
+
+    return removed
@@ -0,0 +1,124 @@
+#
+# cogs/filter/check/phash.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Perceptual image hashing, so that re-encoded, resized or slightly
+altered copies of a filtered image can still be matched.
+
+The hashing functions decode images, so anything but small files
+should be hashed through the filter worker pool (see offload.py).
+"""
+
+import logging
+from hashlib import sha1
+from io import BytesIO
+
+from PIL import Image
+
+from futaba.bktree import BKTree
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["PHASH_BITS", "MAX_THRESHOLD", "PerceptualIndex", "dhash", "file_digests"]
+
+# Width and height of the difference grid, giving a 64-bit hash
+HASH_SIZE = 8
+PHASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Largest Hamming distance a filter may be configured to accept
+MAX_THRESHOLD = 16
+
+# Magic numbers of the image formats we attempt to decode
+IMAGE_SIGNATURES = (
+    b"\x89PNG\r\n\x1a\n",
+    b"\xff\xd8\xff",
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",
+)
+
+
+def _is_image(data):
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return True
+
+    return any(data.startswith(signature) for signature in IMAGE_SIGNATURES)
+
+
+def dhash(data):
+    """
+    Computes the 64-bit difference hash of the given image bytes.
+    Returns None if the data could not be decoded as an image.
+    """
+
+    if not _is_image(data):
+        return None
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            # Lets the JPEG decoder downscale while decoding
+            image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+            image = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+            pixels = list(image.getdata())
+    except Exception as error:
+        logger.debug("Unable to decode image for perceptual hash", exc_info=error)
+        return None
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            left = pixels[offset + col]
+            right = pixels[offset + col + 1]
+            value = (value << 1) | (left > right)
+
+    return value
+
+
+def file_digests(data):
+    """
+    Computes both the SHA1 digest and the perceptual hash of a downloaded file.
+    """
+
+    return sha1(data).digest(), dhash(data)
+
+
+class PerceptualIndex:
+    """
+    Searchable index over a guild's perceptual filters, mapping
+    each hash to a tuple of (filter_type, threshold, description).
+    """
+
+    __slots__ = ("filters", "tree", "radius")
+
+    def __init__(self, filters):
+        self.filters = filters
+        self.tree = BKTree(filters.keys())
+        self.radius = max(
+            (threshold for _, threshold, _ in filters.values()), default=0
+        )
+
+    def search(self, phash):
+        """
+        Returns a list of (filtered hash, filter type) for each
+        filter the given hash is within the threshold of.
+        """
+
+        matches = []
+        for distance, match in self.tree.search(phash, self.radius):
+            filter_type, threshold, _ = self.filters[match]
+            if distance <= threshold:
+                matches.append((match, filter_type))
+        return matches
+
+    def __bool__(self):
+        return bool(self.tree)
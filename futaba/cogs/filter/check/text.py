@@ -19,11 +19,17 @@ import discord
 from futaba.enums import FilterType, LocationType
 from futaba.str_builder import StringBuilder
 from futaba.utils import escape_backticks
-from .common import journal_violation
+from ..filter import find_matches, find_pattern_matches
+from .common import filter_check_failed, journal_violation
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["FoundTextViolation", "check_text_filter"]
+__all__ = [
+    "FoundTextViolation",
+    "get_check_content",
+    "get_filter_candidates",
+    "check_text_filter",
+]
 
 FoundTextViolation = namedtuple(
     "FoundTextViolation",
@@ -39,8 +45,11 @@ FoundTextViolation = namedtuple(
 )
 
 
-async def check_text_filter(cog, message):
-    # Also check embed content
+def get_check_content(message):
+    """
+    Gets the text to validate for a message, which includes embed content.
+    """
+
     content = StringBuilder(message.content)
     for embed in message.embeds:
         embed_dict = embed.to_dict()
@@ -51,30 +60,62 @@ async def check_text_filter(cog, message):
             content.writeln(field.get("name", ""))
             content.writeln(field.get("value", ""))
 
+    return str(content)
+
+
+def get_filter_candidates(cog, channel):
+    """
+    Gathers all guild and channel filters which apply to the given channel,
+    as a list of (location_type, filter_text, filter, filter_type).
+    """
+
+    return [
+        (location_type, filter_text, filter, filter_type)
+        for location_type, all_filters in (
+            (LocationType.GUILD, cog.filters[channel.guild]),
+            (LocationType.CHANNEL, cog.filters[channel]),
+        )
+        for filter_text, (filter, filter_type) in all_filters.items()
+    ]
+
+
+async def check_text_filter(cog, message):
     # This is the string we will validate against
-    to_check = str(content)
+    to_check = get_check_content(message)
     logger.debug("Content to check: %r", to_check)
 
-    # Iterate through all guild filters
-    triggered = None
-    filter_groups = (
-        (LocationType.GUILD, cog.filters[message.guild]),
-        (LocationType.CHANNEL, cog.filters[message.channel]),
-    )
+    candidates = get_filter_candidates(cog, message.channel)
+    if not candidates:
+        return
 
-    for location_type, all_filters in filter_groups:
-        for filter_text, (filter, filter_type) in all_filters.items():
-            if filter.matches(to_check):
-                if triggered is None or filter_type.value > triggered.filter_type.value:
-                    triggered = FoundTextViolation(
-                        bot=cog.bot,
-                        journal=cog.journal,
-                        message=message,
-                        content=to_check,
-                        location_type=location_type,
-                        filter_type=filter_type,
-                        filter_text=filter_text,
-                    )
+    # Short content is matched inline with the compiled filters. Long content
+    # is matched in the worker pool, which is only sent the pattern strings.
+    try:
+        if len(to_check) <= cog.offloader.inline_chars:
+            regexes = [filter.regex for _, _, filter, _ in candidates]
+            matches = cog.offloader.run_inline(find_matches, regexes, to_check)
+        else:
+            patterns = tuple(filter.pattern for _, _, filter, _ in candidates)
+            matches = await cog.offloader.run_text(
+                to_check, find_pattern_matches, patterns, to_check
+            )
+    except Exception as error:
+        await filter_check_failed(cog, "text", message, error)
+        return
+
+    triggered = None
+    for i in matches:
+        location_type, filter_text, _, filter_type = candidates[i]
+        if triggered is None or filter_type.level > triggered.filter_type.level:
+            triggered = FoundTextViolation(
+                bot=cog.bot,
+                journal=cog.journal,
+                message=message,
+                content=to_check,
+                location_type=location_type,
+                filter_type=filter_type,
+                filter_text=filter_text,
+            )
 
     if triggered is not None:
         roles = cog.bot.sql.settings.get_special_roles(message.guild)
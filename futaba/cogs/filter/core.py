@@ -15,8 +15,11 @@ Cog to handle text filtering, including both hard and soft enforcement,
 similar unicode characters, and stripping unicode whitespace.
 """
 
+import asyncio
 import logging
+import re
 from collections import defaultdict
+from functools import partial
 
 import discord
 from discord.ext import commands
@@ -24,36 +27,89 @@ from discord.ext import commands
 from futaba import permissions
 from futaba.enums import FilterType
 from futaba.exceptions import CommandFailed, ManualCheckFailure, SendHelp
+from futaba.metrics import Counter
 from futaba.permissions import admin_perm
+from futaba.pipeline import MEMBER_UPDATE, MESSAGE
 from futaba.utils import async_partial, escape_backticks
 from .check import (
     check_message,
     check_message_edit,
+    check_raw_message_edit,
     check_member_join,
     check_member_update,
 )
-from .filter import Filter
+from .check.digest import DigestCache
+from .check.immunity import ImmunityCache
+from .check.phash import PerceptualIndex
+from .filter import Filter, build_pattern
 from .manage import add_filter, delete_filter, show_filter
+from .offload import FilterOffloader
+from .pattern_cache import PatternCache
+from .scan import MAX_SCAN_LIMIT, ScanJob, run_scan
 from .manage import (
     check_hashsums,
     add_content_filter,
     delete_content_filter,
     show_content_filter,
 )
+from .manage import (
+    resolve_phash,
+    check_threshold,
+    add_perceptual_filter,
+    delete_perceptual_filter,
+    show_perceptual_filter,
+)
 from ..abc import AbstractCog
 
 logger = logging.getLogger(__name__)
 
 __all__ = ["Filtering"]
 
+# (metric name, help text, cache attribute, counter attribute)
+CACHE_METRICS = (
+    (
+        "futaba_filter_digest_cache_hits_total",
+        "Attachment digest lookups served from cache",
+        "digest_cache",
+        "hits",
+    ),
+    (
+        "futaba_filter_digest_cache_misses_total",
+        "Attachment digest lookups which needed a download",
+        "digest_cache",
+        "misses",
+    ),
+    (
+        "futaba_filter_immunity_cache_hits_total",
+        "Filter immunity checks served from cache",
+        "immunity_cache",
+        "hits",
+    ),
+    (
+        "futaba_filter_immunity_cache_misses_total",
+        "Filter immunity checks which were recomputed",
+        "immunity_cache",
+        "misses",
+    ),
+)
+
 
 class Filtering(AbstractCog):
     __slots__ = (
         "journal",
         "filters",
         "content_filters",
+        "perceptual_filters",
+        "perceptual_index",
+        "digest_cache",
+        "immunity_cache",
+        "pattern_cache",
+        "stale_patterns",
+        "offloader",
+        "scan_jobs",
         "check_message",
         "check_message_edit",
+        "check_raw_message_edit",
         "check_member_join",
         "check_member_update",
     )
@@ -63,27 +119,56 @@ class Filtering(AbstractCog):
         self.journal = bot.get_broadcaster("/filter")
         self.filters = defaultdict(dict)
         self.content_filters = defaultdict(dict)
+        self.perceptual_filters = defaultdict(dict)
+        self.perceptual_index = {}
+        self.digest_cache = DigestCache()
+        self.immunity_cache = ImmunityCache()
+        self.pattern_cache = PatternCache(bot.config.filter_pattern_cache)
+        self.stale_patterns = []
+        self.offloader = FilterOffloader(bot.config)
+        self.scan_jobs = {}
         self.check_message = async_partial(check_message, self)
         self.check_message_edit = async_partial(check_message_edit, self)
+        self.check_raw_message_edit = async_partial(check_raw_message_edit, self)
         self.check_member_join = async_partial(check_member_join, self)
         self.check_member_update = async_partial(check_member_update, self)
 
-    def setup(self):
+        for name, help, cache, attr in CACHE_METRICS:
+            cache = getattr(self, cache)
+            bot.metrics.register_callback(
+                Counter, name, help, partial(getattr, cache, attr)
+            )
+
+    async def setup(self):
         logger.info("Fetching previously stored filters")
         sql = self.bot.sql.filter
+
+        # Reading the cache file doesn't use the database, so let other setups run
+        await self.bot.loop.run_in_executor(None, self.pattern_cache.load)
+        stale = self.stale_patterns
+
+        def load_filter(location, text, filter_type):
+            pattern = self.pattern_cache.get(text)
+            if pattern is None:
+                # Match the exact text until the full pattern is built
+                stale.append((location, text))
+                pattern = re.escape(text)
+
+            self.filters[location][text] = (Filter(text, pattern), filter_type)
+
         for guild in self.bot.guilds:
             # Get filter settings
             sql.fetch_settings(guild)
 
             # Guild text filters
             for text, filter_type in sql.get_filters(guild).items():
-                self.filters[guild][text] = (Filter(text), filter_type)
+                load_filter(guild, text, filter_type)
 
             # Channel text filters
             for channel in guild.channels:
                 if isinstance(channel, discord.TextChannel):
                     for text, filter_type in sql.get_filters(channel).items():
-                        self.filters[channel][text] = (Filter(text), filter_type)
+                        load_filter(channel, text, filter_type)
 
             # Guild content filters
             for hashsum, (filter_type, description) in sql.get_content_filters(
@@ -91,16 +176,90 @@ class Filtering(AbstractCog):
             ).items():
                 self.content_filters[guild][hashsum] = (filter_type, description)
 
+            # Guild perceptual content filters
+            self.perceptual_filters[guild].update(sql.get_perceptual_filters(guild))
+            self.update_perceptual_index(guild)
+
             # Guild filter-immune users
             sql.fetch_filter_immune_users(guild)
 
+    async def warmup(self):
+        stale, self.stale_patterns = self.stale_patterns, []
+        await self.rebuild_patterns(stale)
+
+    async def rebuild_patterns(self, stale):
+        """
+        Builds the full patterns of filters which weren't in the pattern cache,
+        then saves the cache with any filters that no longer exist pruned.
+        """
+
+        if stale:
+            logger.info("Building %d uncached filter patterns", len(stale))
+
+        loop = asyncio.get_event_loop()
+        for location, text in stale:
+            pattern = self.pattern_cache.get(text)
+            if pattern is None:
+                pattern = await loop.run_in_executor(
+                    self.offloader.executor, build_pattern, text
+                )
+                self.pattern_cache.store(text, pattern)
+
+            # Swap in the full filter, unless it was removed in the mean time
+            entry = self.filters[location].get(text)
+            if entry is not None:
+                self.filters[location][text] = (Filter(text, pattern), entry[1])
+
+        self.pattern_cache.retain(
+            {text for filters in self.filters.values() for text in filters}
+        )
+        self.pattern_cache.save()
+
+    def update_perceptual_index(self, guild):
+        logger.debug(
+            "Rebuilding perceptual hash index for guild '%s' (%d)", guild.name, guild.id
+        )
+        self.perceptual_index[guild] = PerceptualIndex(self.perceptual_filters[guild])
+
     def cog_unload(self):
         """
         Remove listeners when unloading the cog.
         """
 
-        self.bot.remove_listener(self.check_message, "on_message")
+        self.bot.pipeline.unregister(MESSAGE, "filter")
+        self.bot.pipeline.unregister(MEMBER_UPDATE, "filter")
+        for name, *_ in CACHE_METRICS:
+            self.bot.metrics.remove(name)
         self.bot.remove_listener(self.check_message_edit, "on_message_edit")
+        self.bot.remove_listener(self.check_raw_message_edit, "on_raw_message_edit")
+        self.bot.remove_listener(self.member_remove, "on_member_remove")
+        self.bot.remove_listener(self.channel_update, "on_guild_channel_update")
+        self.bot.remove_listener(self.role_update, "on_guild_role_update")
+        self.bot.remove_listener(self.role_delete, "on_guild_role_delete")
+
+        for job in self.scan_jobs.values():
+            if job.running:
+                job.task.cancel()
+
+        self.offloader.shutdown()
+
+    async def message_stage(self, event):
+        await self.check_message(event.message)
+
+    async def member_remove(self, member):
+        self.immunity_cache.invalidate_member(member.guild, member)
+
+    async def channel_update(self, before, after):
+        if before.overwrites != after.overwrites:
+            self.immunity_cache.invalidate_channel(after)
+
+    async def role_update(self, before, after):
+        if before.permissions != after.permissions:
+            self.immunity_cache.invalidate_guild(after.guild)
+
+    async def role_delete(self, role):
+        # Members don't get an update event when a role is deleted
+        self.immunity_cache.invalidate_guild(role.guild)
 
     @commands.group(name="filter")
     @commands.guild_only()
@@ -162,6 +321,7 @@ class Filtering(AbstractCog):
             hashsum,
             description,
         )
+        self.digest_cache.flush()
 
     @ffilter.command(name="block", aliases=["deny", "autoremove", "add"])
     @commands.guild_only()
@@ -185,6 +345,7 @@ class Filtering(AbstractCog):
             hashsum,
             description,
         )
+        self.digest_cache.flush()
 
     @ffilter.command(name="jail", aliases=["dunce", "punish", "mute"])
     @commands.guild_only()
@@ -208,6 +369,7 @@ class Filtering(AbstractCog):
             hashsum,
             description,
         )
+        self.digest_cache.flush()
 
     @ffilter.command(name="remove", aliases=["rm", "delete", "del"])
     @commands.guild_only()
@@ -225,6 +387,122 @@ class Filtering(AbstractCog):
             "content/remove", ctx.guild, content, icon="filter", hashsums=hashsums
         )
         await delete_content_filter(self.bot, ctx.guild, self.content_filters, hashsums)
+        self.digest_cache.flush()
+
+    @ffilter.group(name="similar", aliases=["phash", "perceptual", "near"])
+    @commands.guild_only()
+    async def ffilter_similar(self, ctx):
+        """
+        Adds, removes, or lists perceptual image hashes in the content filter.
+        These also match resized, re-encoded or slightly altered copies of an image.
+        """
+
+        if ctx.subcommand_passed in ("similar", "phash", "perceptual", "near"):
+            raise SendHelp()
+
+    @ffilter_similar.command(name="show", aliases=["display", "list"])
+    @commands.guild_only()
+    async def ffilter_similar_show(self, ctx):
+        """
+        List all currently filtered perceptual hashes in the guild's filter.
+        """
+
+        await show_perceptual_filter(self.perceptual_filters[ctx.guild], ctx.message)
+
+    async def _add_similar(self, ctx, level, threshold, source, description):
+        await check_threshold(threshold)
+        phash = await resolve_phash(self, source)
+        content = (
+            f"Added perceptual content {level.value} filter for `{phash:016x}` "
+            f"(distance {threshold}): {description}"
+        )
+        self.journal.send(
+            f"content/new/{level.value}",
+            ctx.guild,
+            content,
+            icon="filter",
+            phash=phash,
+            threshold=threshold,
+            description=description,
+            cause=ctx.author,
+        )
+        await add_perceptual_filter(
+            self, ctx.guild, level, phash, threshold, description
+        )
+        self.digest_cache.flush()
+
+    @ffilter_similar.command(name="flag", aliases=["warn", "alert", "notice"])
+    @commands.guild_only()
+    @permissions.check_mod()
+    async def ffilter_similar_flag(
+        self, ctx, threshold: int, source: str, *, description: str
+    ):
+        """
+        Adds an image to the guild's perceptual flagging filter, which notifies staff when posted.
+        The image is given as either a 16 digit hex perceptual hash, or a URL to the image.
+
+        The threshold is how many bits (out of 64) may differ for a posted image to match.
+        You must specify a description of the file being filtered.
+        """
+
+        await self._add_similar(ctx, FilterType.FLAG, threshold, source, description)
+
+    @ffilter_similar.command(name="block", aliases=["deny", "autoremove", "add"])
+    @commands.guild_only()
+    @permissions.check_mod()
+    async def ffilter_similar_block(
+        self, ctx, threshold: int, source: str, *, description: str
+    ):
+        """
+        Adds an image to the guild's perceptual blocking filter, automatically deleting any messages.
+        The image is given as either a 16 digit hex perceptual hash, or a URL to the image.
+
+        The threshold is how many bits (out of 64) may differ for a posted image to match.
+        You must specify a description of the file being filtered.
+        """
+
+        await self._add_similar(ctx, FilterType.BLOCK, threshold, source, description)
+
+    @ffilter_similar.command(name="jail", aliases=["dunce", "punish", "mute"])
+    @commands.guild_only()
+    @permissions.check_mod()
+    async def ffilter_similar_jail(
+        self, ctx, threshold: int, source: str, *, description: str
+    ):
+        """
+        Adds an image to the guild's perceptual jailing filter, which will automatically jail users.
+        The image is given as either a 16 digit hex perceptual hash, or a URL to the image.
+
+        The threshold is how many bits (out of 64) may differ for a posted image to match.
+        You must specify a description of the file being filtered.
+        """
+
+        await self._add_similar(ctx, FilterType.JAIL, threshold, source, description)
+
+    @ffilter_similar.command(name="remove", aliases=["rm", "delete", "del"])
+    @commands.guild_only()
+    @permissions.check_mod()
+    async def ffilter_similar_remove(self, ctx, *phashes: str):
+        """
+        Removes the given perceptual hashes from the guild filter.
+        You don't need to specify which filter level they were for.
+        """
+
+        if not phashes or not all(len(phash) == 16 for phash in phashes):
+            raise CommandFailed(content="Perceptual hashes are 16 hex digits long.")
+
+        try:
+            values = [int(phash, 16) for phash in phashes]
+        except ValueError:
+            raise CommandFailed(content="Perceptual hashes are 16 hex digits long.")
+
+        str_phashes = " ".join(f"`{phash}`" for phash in phashes)
+        content = f"Removed perceptual content filter for {str_phashes}"
+        self.journal.send(
+            "content/remove", ctx.guild, content, icon="filter", phashes=phashes
+        )
+        await delete_perceptual_filter(self, ctx.guild, values)
+        self.digest_cache.flush()
 
     @filter.group(name="immune", aliases=["imm", "ignore", "ign"])
     @commands.guild_only()
@@ -265,6 +543,7 @@ class Filtering(AbstractCog):
                     member.id,
                 )
                 self.bot.sql.filter.add_filter_immune_user(ctx.guild, member)
+                self.immunity_cache.invalidate_member(ctx.guild, member)
 
         for member in members:
             content = (
@@ -308,6 +587,7 @@ class Filtering(AbstractCog):
                     member.id,
                 )
                 self.bot.sql.filter.remove_filter_immune_user(ctx.guild, member)
+                self.immunity_cache.invalidate_member(ctx.guild, member)
 
         for member in members:
             content = f"Removed {member.name}#{member.discriminator} from filter immunity list"
@@ -361,6 +641,8 @@ class Filtering(AbstractCog):
                     ctx.guild, manage_messages_immune=value
                 )
 
+            self.immunity_cache.invalidate_guild(ctx.guild)
+
             embed = discord.Embed(colour=discord.Colour.teal())
             embed.description = (
                 f"Set filter immunity for those with manage messages to `{value}`"
@@ -368,6 +650,228 @@ class Filtering(AbstractCog):
 
         await ctx.send(embed=embed)
 
+    @filter.command(name="failmode", aliases=["failpolicy"])
+    @commands.guild_only()
+    async def filter_fail_mode(self, ctx, value: str = None):
+        """
+        Gets the current policy for messages whose filter check times out or fails.
+        If "closed", such messages are deleted. If "open", they are let through.
+        If you're an administrator, you can change this value.
+        """
+
+        if value is None:
+            filter_settings = self.bot.sql.filter.get_settings(ctx.guild)
+            policy = "closed" if filter_settings.fail_closed else "open"
+
+            embed = discord.Embed(colour=discord.Colour.dark_teal())
+            embed.description = f"Failed filter checks currently fail **{policy}**."
+        elif not admin_perm(ctx):
+            embed = discord.Embed(colour=discord.Colour.red())
+            embed.description = (
+                "You do not have permission to change the filter failure policy"
+            )
+            raise ManualCheckFailure(embed=embed)
+        elif value.lower() not in ("open", "closed"):
+            embed = discord.Embed(colour=discord.Colour.red())
+            embed.description = "The failure policy must be either `open` or `closed`"
+            raise CommandFailed(embed=embed)
+        else:
+            fail_closed = value.lower() == "closed"
+            with self.bot.sql.transaction():
+                self.bot.sql.filter.set_fail_closed(ctx.guild, fail_closed)
+
+            embed = discord.Embed(colour=discord.Colour.teal())
+            embed.description = f"Set failed filter checks to fail `{value.lower()}`"
+
+        await ctx.send(embed=embed)
+
+    @filter.group(name="scan", aliases=["history"])
+    @commands.guild_only()
+    async def filter_scan(self, ctx):
+        """
+        Checks past messages in this server's channels against the current filters.
+        """
+
+        if ctx.subcommand_passed in ("scan", "history"):
+            raise SendHelp()
+
+    @filter_scan.command(name="report", aliases=["check", "dry"])
+    @commands.guild_only()
+    @permissions.check_mod()
+    async def filter_scan_report(self, ctx, limit: int, *channels: discord.TextChannel):
+        """
+        Scans up to 'limit' past messages in each given channel (or all channels),
+        and sends you a list of the ones which violate a filter. Nothing is enforced.
+        """
+
+        await self.start_scan(ctx, limit, channels, enforce=False)
+
+    @filter_scan.command(name="enforce", aliases=["apply", "run"])
+    @commands.guild_only()
+    @permissions.check_mod()
+    async def filter_scan_enforce(
+        self, ctx, limit: int, *channels: discord.TextChannel
+    ):
+        """
+        Scans up to 'limit' past messages in each given channel (or all channels),
+        and enforces the filters on the ones which violate them, as if they were just posted.
+        """
+
+        await self.start_scan(ctx, limit, channels, enforce=True)
+
+    async def start_scan(self, ctx, limit, channels, enforce):
+        job = self.scan_jobs.get(ctx.guild)
+        if job is not None and job.running:
+            embed = discord.Embed(colour=discord.Colour.red())
+            embed.description = "A filter scan is already running in this server."
+            raise CommandFailed(embed=embed)
+
+        if not 0 < limit <= MAX_SCAN_LIMIT:
+            embed = discord.Embed(colour=discord.Colour.red())
+            embed.description = (
+                f"The message limit must be between 1 and {MAX_SCAN_LIMIT}."
+            )
+            raise CommandFailed(embed=embed)
+
+        channels = [
+            channel
+            for channel in (channels or ctx.guild.text_channels)
+            if channel.permissions_for(ctx.guild.me).read_message_history
+        ]
+
+        if not channels:
+            embed = discord.Embed(colour=discord.Colour.red())
+            embed.description = "I cannot read the history of any of those channels."
+            raise CommandFailed(embed=embed)
+
+        job = ScanJob(ctx.guild, ctx.author, channels, limit, enforce)
+        self.scan_jobs[ctx.guild] = job
+
+        mode = "enforcing" if enforce else "reporting"
+        content = f"Started filter scan of {limit} messages in {len(channels)} channels ({mode})"
+        self.journal.send(
+            "scan/start",
+            ctx.guild,
+            content,
+            icon="filter",
+            channels=channels,
+            limit=limit,
+            enforce=enforce,
+            cause=ctx.author,
+        )
+        job.task = self.bot.loop.create_task(run_scan(self, job))
+
+    @filter_scan.command(name="stop", aliases=["cancel", "pause"])
+    @commands.guild_only()
+    @permissions.check_mod()
+    async def filter_scan_stop(self, ctx):
+        """
+        Stops the running filter scan. It can be continued with 'resume'.
+        """
+
+        job = self.scan_jobs.get(ctx.guild)
+        if job is None or not job.running:
+            embed = discord.Embed(colour=discord.Colour.red())
+            embed.description = "There is no filter scan running in this server."
+            raise CommandFailed(embed=embed)
+
+        job.task.cancel()
+        self.journal.send(
+            "scan/stop",
+            ctx.guild,
+            "Stopped filter scan",
+            icon="filter",
+            cause=ctx.author,
+        )
+
+    @filter_scan.command(name="resume", aliases=["continue"])
+    @commands.guild_only()
+    @permissions.check_mod()
+    async def filter_scan_resume(self, ctx):
+        """
+        Continues the last stopped filter scan from where it left off.
+        """
+
+        job = self.scan_jobs.get(ctx.guild)
+        if job is None or job.running or job.finished:
+            embed = discord.Embed(colour=discord.Colour.red())
+            embed.description = "There is no stopped filter scan in this server."
+            raise CommandFailed(embed=embed)
+
+        job.author = ctx.author
+        self.journal.send(
+            "scan/resume",
+            ctx.guild,
+            "Resumed filter scan",
+            icon="filter",
+            cause=ctx.author,
+        )
+        job.task = self.bot.loop.create_task(run_scan(self, job))
+
+    @filter_scan.command(name="status", aliases=["progress", "show"])
+    @commands.guild_only()
+    @permissions.check_mod()
+    async def filter_scan_status(self, ctx):
+        """
+        Shows the progress of the latest filter scan in this server.
+        """
+
+        job = self.scan_jobs.get(ctx.guild)
+        if job is None:
+            embed = discord.Embed(colour=discord.Colour.dark_purple())
+            embed.description = "No filter scan has been run in this server."
+        else:
+            if job.running:
+                state = "Running"
+            elif job.finished:
+                state = "Finished"
+            else:
+                state = "Stopped"
+
+            embed = discord.Embed(colour=discord.Colour.dark_teal())
+            embed.set_author(name=f"Filter scan: {state}")
+            embed.description = f"{job.status()}."
+
+        await ctx.send(embed=embed)
+
+    @filter.command(name="stats", aliases=["perf"], hidden=True)
+    @permissions.check_admin()
+    async def filter_stats(self, ctx):
+        """
+        Displays how much filter work has been run inline or in the worker pool.
+        """
+
+        stats = self.offloader.stats
+        embed = discord.Embed(colour=discord.Colour.teal())
+        embed.set_author(name="Filter worker statistics")
+        embed.add_field(
+            name="Inline",
+            value=f"{stats.inline_jobs} jobs, {stats.inline_time * 1000:.1f} ms",
+        )
+        embed.add_field(
+            name="Offloaded",
+            value=f"{stats.offloaded_jobs} jobs, {stats.offloaded_time * 1000:.1f} ms",
+        )
+        embed.add_field(
+            name="Timeouts / failures", value=f"{stats.timeouts} / {stats.failures}"
+        )
+        embed.add_field(
+            name="Timed out, still running", value=str(self.offloader.running_timeouts)
+        )
+        embed.add_field(
+            name="Digest cache",
+            value=f"{self.digest_cache.hits} hits, {self.digest_cache.misses} misses",
+        )
+        embed.add_field(
+            name="Immunity cache",
+            value=f"{self.immunity_cache.hits} hits, {self.immunity_cache.misses} misses",
+        )
+        embed.description = (
+            f"Offloading has saved `{stats.offloaded_time * 1000:.1f} ms` "
+            "of event loop blocking."
+        )
+        await ctx.send(embed=embed)
+
     @filter.group(name="server", aliases=["srv", "s", "guild", "g"])
     @commands.guild_only()
     async def filter_guild(self, ctx):
@@ -408,7 +912,9 @@ class Filtering(AbstractCog):
             text=text,
             cause=ctx.author,
         )
-        await add_filter(self, self.filters, ctx.guild, FilterType.FLAG, text)
+        await add_filter(
+            self, self.filters, ctx.guild, FilterType.FLAG, text, ctx.author
+        )
 
     @filter_guild.command(name="block", aliases=["deny", "autoremove", "add"])
     @commands.guild_only()
@@ -424,7 +930,9 @@ class Filtering(AbstractCog):
 
         content = f"Added guild block filter for `{escape_backticks(text)}`"
         self.journal.send("guild/new/block", ctx.guild, content, icon="filter")
-        await add_filter(self, self.filters, ctx.guild, FilterType.BLOCK, text)
+        await add_filter(
+            self, self.filters, ctx.guild, FilterType.BLOCK, text, ctx.author
+        )
 
     @filter_guild.command(name="jail", aliases=["dunce", "punish", "mute"])
     @commands.guild_only()
@@ -440,7 +948,9 @@ class Filtering(AbstractCog):
 
         content = f"Added guild jail filter for `{escape_backticks(text)}`"
         self.journal.send("guild/new/jail", ctx.guild, content, icon="filter")
-        await add_filter(self, self.filters, ctx.guild, FilterType.JAIL, text)
+        await add_filter(
+            self, self.filters, ctx.guild, FilterType.JAIL, text, ctx.author
+        )
 
     @filter_guild.command(name="remove", aliases=["rm", "delete", "del"])
     @commands.guild_only()
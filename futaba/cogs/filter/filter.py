@@ -19,7 +19,16 @@ from futaba.str_builder import StringBuilder
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["UNICODE_SPACES_REGEX", "Filter"]
+__all__ = [
+    "UNICODE_SPACES_REGEX",
+    "Filter",
+    "build_pattern",
+    "find_matches",
+    "find_pattern_matches",
+    "find_matching_strings",
+    "forget_pattern",
+    "find_matching_contents",
+]
 
 UNICODE_SPACES_REGEX = re.compile(
     "".join(
@@ -38,42 +47,128 @@ UNICODE_SPACES_REGEX = re.compile(
 )
 
 
-class Filter:
-    __slots__ = ("text", "regex")
+# Compiled expressions by pattern. Not bounded, as every message is
+# matched against every filter, which would cycle through any LRU limit.
+_regexes = {}
+
+
+def _compile(pattern):
+    regex = _regexes.get(pattern)
+    if regex is None:
+        regex = _regexes[pattern] = re.compile(pattern, re.IGNORECASE)
+    return regex
+
+
+def forget_pattern(pattern):
+    """
+    Drops the compiled expression for a pattern, once its filter is deleted.
+    """
+
+    _regexes.pop(pattern, None)
+
+
+def find_matches(regexes, content):
+    """
+    Returns the indices of each compiled expression in 'regexes' which
+    matches the content.
+    """
+
+    contents = (content, UNICODE_SPACES_REGEX.sub("", content))
+    return [i for i, regex in enumerate(regexes) if any(map(regex.search, contents))]
+
+
+def find_pattern_matches(patterns, content):
+    """
+    Like find_matches(), but takes pattern strings, which are cheap to send to
+    a worker process unlike compiled expressions. They are compiled once per
+    worker and cached there.
+    """
+
+    return find_matches([_compile(pattern) for pattern in patterns], content)
+
+
+def _search_strings(regex, strings):
+    search = regex.search
+    return [
+        i
+        for i, string in enumerate(strings)
+        if search(string) or search(UNICODE_SPACES_REGEX.sub("", string))
+    ]
+
+
+def find_matching_strings(pattern, strings):
+    """
+    The converse of find_matches(), returning the indices of each string
+    in 'strings' which is matched by the given pattern.
+    """
 
-    def __init__(self, text):
-        logger.info("Creating filter regular expression from %r", text)
-        groups = confusables.is_confusable(text, greedy=True)
-        if groups:
-            pattern = Filter.build_regex(text, groups)
-        else:
-            pattern = re.escape(text)
+    return _search_strings(_compile(pattern), strings)
+
+
+def build_pattern(text):
+    """
+    Builds the regular expression matching the given text, and any strings
+    which look similar to it. This is slow for long filters, so the results
+    are persisted by the pattern cache (see pattern_cache.py).
+    """
+
+    logger.info("Creating filter regular expression from %r", text)
+    groups = confusables.is_confusable(text, greedy=True)
+    if groups:
+        pattern = _build_confusable_pattern(text, groups)
+    else:
+        pattern = re.escape(text)
+
+    logger.debug("Generated pattern: %r", pattern)
+    return pattern
+
+
+def _build_confusable_pattern(text, groups):
+    # Build similar character tree
+    chars = {}
+    pattern = StringBuilder()
+    for group in groups:
+        pattern.write("[")
+        char = group["character"]
+        pattern.write(re.escape(char))
+        for homoglyph in group["homoglyphs"]:
+            pattern.write(re.escape(homoglyph["c"]))
+        pattern.write("]")
+        chars[char] = str(pattern)
+        pattern.clear()
+
+    # Create pattern
+    for char in text:
+        pattern.write(chars.get(char, char))
+
+    return str(pattern)
+
+
+def find_matching_contents(patterns, contents):
+    """
+    Returns the indices of each string in 'contents' which is matched by any
+    of the patterns. This is for bulk scanning, where all the patterns are
+    combined into one expression and which filter matched is found later.
+    """
+
+    if not patterns:
+        return []
+
+    # Not kept in _regexes, the combination changes whenever a filter does
+    combined = "|".join(f"(?:{pattern})" for pattern in patterns)
+    return _search_strings(re.compile(combined, re.IGNORECASE), contents)
+
+
+class Filter:
+    __slots__ = ("text", "pattern", "regex")
 
-        logger.debug("Generated pattern: %r", pattern)
+    def __init__(self, text, pattern=None):
+        if pattern is None:
+            pattern = build_pattern(text)
 
         self.text = text
-        self.regex = re.compile(pattern, re.IGNORECASE)
-
-    @staticmethod
-    def build_regex(text, groups):
-        # Build similar character tree
-        chars = {}
-        pattern = StringBuilder()
-        for group in groups:
-            pattern.write("[")
-            char = group["character"]
-            pattern.write(re.escape(char))
-            for homoglyph in group["homoglyphs"]:
-                pattern.write(re.escape(homoglyph["c"]))
-            pattern.write("]")
-            chars[char] = str(pattern)
-            pattern.clear()
-
-        # Create pattern
-        for char in text:
-            pattern.write(chars.get(char, char))
-
-        return str(pattern)
+        self.pattern = pattern
+        self.regex = _compile(pattern)
 
     def matches(self, content):
         contents = (content, UNICODE_SPACES_REGEX.sub("", content))
@@ -20,10 +20,13 @@ from futaba.enums import FilterType
 from futaba.exceptions import CommandFailed
 from futaba.str_builder import StringBuilder
 from futaba.unicode import READABLE_CHAR_SET, unicode_repr
+from futaba.utils import URL_REGEX
 from .check import check_all_members_on_filter
-from .filter import Filter
+from .check.phash import MAX_THRESHOLD, dhash
+from .filter import Filter, forget_pattern
 
 HEXADECIMAL_REGEX = re.compile(r"[A-Fa-f0-9]+")
+PHASH_REGEX = re.compile(r"[A-Fa-f0-9]{16}")
 
 """
 Helper module to do the management of adding and removing filters.
@@ -39,10 +42,15 @@ __all__ = [
     "add_content_filter",
     "delete_content_filter",
     "show_content_filter",
+    "resolve_phash",
+    "check_threshold",
+    "add_perceptual_filter",
+    "delete_perceptual_filter",
+    "show_perceptual_filter",
 ]
 
 
-async def add_filter(cog, filters, location, level, text):
+async def add_filter(cog, filters, location, level, text, author=None):
     logger.info(
         "Adding %r to server filter '%s' for '%s' (%d)",
         text,
@@ -61,12 +69,16 @@ async def add_filter(cog, filters, location, level, text):
         logger.error("Error adding filter", exc_info=error)
         raise CommandFailed()
     else:
-        filter = Filter(text)
+        filter = Filter(text, cog.pattern_cache.get(text))
         filters[location][text] = (filter, level)
+        cog.pattern_cache.store(text, filter.pattern)
+        cog.pattern_cache.save()
 
     if isinstance(location, discord.Guild):
         logger.debug("Checking all members against new guild text filter")
-        cog.bot.loop.create_task(check_all_members_on_filter(cog, location, filter))
+        cog.bot.loop.create_task(
+            check_all_members_on_filter(cog, location, filter, author)
+        )
 
 
 async def delete_filter(bot, filters, location, text):
@@ -77,7 +89,9 @@ async def delete_filter(bot, filters, location, text):
     try:
         with bot.sql.transaction():
             if bot.sql.filter.delete_filter(location, text):
-                filters[location].pop(text, None)
+                entry = filters[location].pop(text, None)
+                if entry is not None:
+                    forget_pattern(entry[0].pattern)
                 logger.debug("Succesfully removed filter")
             else:
                 logger.debug("Filter was not present, deletion failed")
@@ -223,3 +237,137 @@ async def show_content_filter(all_filters, message):
 
     for content in contents:
         await message.author.send(content=content)
+
+
+async def resolve_phash(cog, source):
+    """
+    Gets a perceptual hash, either given directly as hex digits,
+    or by downloading and hashing the image at the given URL.
+    """
+
+    if PHASH_REGEX.fullmatch(source):
+        return int(source, 16)
+
+    match = URL_REGEX.match(source)
+    if match is None:
+        raise CommandFailed(
+            content="Perceptual hashes are 16 hex digits long, or pass an image URL."
+        )
+
+    binio = await cog.bot.http_pool.download_link(match[1])
+    if binio is None:
+        raise CommandFailed(content="Unable to download the image.")
+
+    data = binio.getvalue()
+    phash = await cog.offloader.run_file(data, dhash, data)
+    if phash is None:
+        raise CommandFailed(content="The file is not an image that can be hashed.")
+
+    return phash
+
+
+async def check_threshold(threshold):
+    if not 0 <= threshold <= MAX_THRESHOLD:
+        raise CommandFailed(
+            content=f"The Hamming threshold must be between 0 and {MAX_THRESHOLD}."
+        )
+
+
+async def add_perceptual_filter(cog, guild, level, phash, threshold, description):
+    logger.info(
+        "Adding perceptual hash to guild content filter '%s': %016x (threshold %d)",
+        level.value,
+        phash,
+        threshold,
+    )
+
+    try:
+        with cog.bot.sql.transaction():
+            if phash in cog.perceptual_filters[guild]:
+                logger.debug("Updating existing perceptual filter")
+                cog.bot.sql.filter.update_perceptual_filter(
+                    guild, level, phash, threshold, description
+                )
+            else:
+                logger.debug("Adding new perceptual filter")
+                cog.bot.sql.filter.add_perceptual_filter(
+                    guild, level, phash, threshold, description
+                )
+
+        cog.perceptual_filters[guild][phash] = (level, threshold, description)
+    except Exception as error:
+        logger.error("Error adding perceptual filter", exc_info=error)
+        raise CommandFailed()
+
+    cog.update_perceptual_index(guild)
+
+
+async def delete_perceptual_filter(cog, guild, phashes):
+    logger.info(
+        "Removing perceptual hashes from guild content filter: %s",
+        ", ".join(f"{phash:016x}" for phash in phashes),
+    )
+
+    try:
+        with cog.bot.sql.transaction():
+            for phash in phashes:
+                if phash in cog.perceptual_filters[guild]:
+                    cog.bot.sql.filter.delete_perceptual_filter(guild, phash)
+                    cog.perceptual_filters[guild].pop(phash, None)
+                    logger.debug("Succesfully removed perceptual hash from filter")
+                else:
+                    logger.debug("Filter was not present, not deleting")
+    except Exception as error:
+        logger.error("Error deleting perceptual filter(s)", exc_info=error)
+        raise CommandFailed()
+
+    cog.update_perceptual_index(guild)
+
+
+async def show_perceptual_filter(all_filters, message):
+    if all_filters:
+        contents = []
+        content = StringBuilder()
+        content.writeln(f"**Filtered perceptual hashes for {message.guild.name}:**")
+
+        # Set up filter list
+        filters = {filter_type: [] for filter_type in FilterType}
+        for phash, (filter_type, threshold, description) in all_filters.items():
+            filters[filter_type].append((f"{phash:016x}", threshold, description))
+
+        # Iterate through filters
+        for filter_type in FilterType:
+            filter_list = filters[filter_type]
+            filter_list.sort()
+
+            content.writeln(
+                f"{filter_type.emoji} {filter_type.description} hashes {filter_type.emoji}"
+            )
+            content.writeln("```")
+
+            if not filter_list:
+                content.writeln("(none)")
+                content.writeln("```")
+                continue
+
+            for hexsum, threshold, description in filter_list:
+                content.writeln(f"{hexsum} (distance {threshold}) {description}")
+
+                if len(content) > 1900:
+                    content.writeln("```")
+                    contents.append(str(content))
+                    content.clear()
+                    content.writeln("```")
+
+            if len(content) > 4:
+                content.writeln("```")
+            else:
+                content.clear()
+
+        if content:
+            contents.append(str(content))
+    else:
+        contents = (f"**No filtered perceptual hashes for {message.guild.name}**",)
+
+    for content in contents:
+        await message.author.send(content=content)
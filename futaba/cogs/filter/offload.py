@@ -0,0 +1,182 @@
+#
+# cogs/filter/offload.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Runs expensive filter work (regular expressions over long messages,
+hashing and decoding large files) in a thread or process pool, so that
+it doesn't block the event loop and stall the gateway connection.
+
+A job which times out can't be interrupted, and keeps its worker busy.
+So after a timeout the pool is replaced, and in a process pool the old
+workers are terminated. Threads can't be stopped, so a runaway job in a
+thread pool keeps running (and holding the GIL) until it finishes.
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["OffloadStats", "FilterOffloader"]
+
+
+def _timed(func, *args):
+    # Module-level so that it can be pickled for process pools
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+class OffloadStats:
+    __slots__ = (
+        "inline_jobs",
+        "inline_time",
+        "offloaded_jobs",
+        "offloaded_time",
+        "timeouts",
+        "failures",
+    )
+
+    def __init__(self):
+        self.inline_jobs = 0
+        self.inline_time = 0.0
+        self.offloaded_jobs = 0
+        self.offloaded_time = 0.0
+        self.timeouts = 0
+        self.failures = 0
+
+
+class FilterOffloader:
+    """
+    Decides whether a filter job runs inline or in the worker pool,
+    and enforces a timeout on offloaded jobs.
+
+    The time offloaded jobs spent running is the time the event loop
+    would otherwise have been blocked for.
+    """
+
+    __slots__ = (
+        "kind",
+        "workers",
+        "executor",
+        "abandoned",
+        "timeout",
+        "inline_chars",
+        "inline_bytes",
+        "stats",
+    )
+
+    def __init__(self, config):
+        self.kind = config.filter_executor
+        self.workers = config.filter_workers
+        self.executor = self._make_executor()
+        self.abandoned = set()
+        self.timeout = config.filter_timeout
+        self.inline_chars = config.filter_inline_chars
+        self.inline_bytes = config.filter_inline_bytes
+        self.stats = OffloadStats()
+
+        logger.info(
+            "Created filter %s pool with %d workers",
+            config.filter_executor,
+            config.filter_workers,
+        )
+
+    def _make_executor(self):
+        if self.kind == "process":
+            return ProcessPoolExecutor(max_workers=self.workers)
+
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="filter")
+
+    @property
+    def running_timeouts(self):
+        """
+        The number of timed out jobs which haven't finished or been stopped.
+        """
+
+        return len(self.abandoned)
+
+    def _replace_executor(self, executor):
+        # Another timeout may have replaced it already
+        if executor is not self.executor:
+            return
+
+        logger.info("Replacing filter %s pool after a timeout", self.kind)
+        self.executor = self._make_executor()
+
+        # There's no public way to stop a running job, so stop its process.
+        # Taken before shutdown(), which drops the pool's list of processes.
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False)
+        for process in processes:
+            process.terminate()
+
+    def run_inline(self, func, *args):
+        """
+        Runs func(*args) on the event loop, counting it in the stats.
+        """
+
+        elapsed, result = _timed(func, *args)
+        self.stats.inline_jobs += 1
+        self.stats.inline_time += elapsed
+        return result
+
+    async def run(self, size, limit, func, *args):
+        """
+        Runs func(*args), offloading it if 'size' exceeds 'limit'.
+        Raises asyncio.TimeoutError if the offloaded job takes too long.
+        """
+
+        if size <= limit:
+            return self.run_inline(func, *args)
+
+        executor = self.executor
+        job = executor.submit(_timed, func, *args)
+
+        try:
+            elapsed, result = await asyncio.wait_for(
+                asyncio.wrap_future(job), self.timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Offloaded filter job %s timed out after %.1f seconds",
+                func.__name__,
+                self.timeout,
+            )
+            self.stats.timeouts += 1
+
+            if not job.done():
+                self.abandoned.add(job)
+                job.add_done_callback(self.abandoned.discard)
+            self._replace_executor(executor)
+            raise
+        except Exception as error:
+            logger.error(
+                "Offloaded filter job %s failed", func.__name__, exc_info=error
+            )
+            self.stats.failures += 1
+            raise
+
+        self.stats.offloaded_jobs += 1
+        self.stats.offloaded_time += elapsed
+        return result
+
+    async def run_text(self, content, func, *args):
+        return await self.run(len(content), self.inline_chars, func, *args)
+
+    async def run_file(self, data, func, *args):
+        return await self.run(len(data), self.inline_bytes, func, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,125 @@
+#
+# cogs/filter/pattern_cache.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Persists the expanded regular expressions generated for each filter,
+so that restarting the bot doesn't need to search for confusable
+characters in every filter again.
+
+Compiled regular expressions can't be saved, but compiling the expanded
+pattern is cheap compared to generating it. The file is discarded if it
+was written by a different format version or confusables database.
+"""
+
+import json
+import logging
+import os
+
+import confusable_homoglyphs
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["PatternCache"]
+
+# Increment when the file format or pattern generation changes
+CACHE_VERSION = 1
+
+
+class PatternCache:
+    """
+    Maps filter text to its generated pattern, backed by a JSON file.
+    If no path is configured, patterns are only kept in memory.
+    """
+
+    __slots__ = ("path", "patterns", "dirty")
+
+    def __init__(self, path):
+        self.path = path or None
+        self.patterns = {}
+        self.dirty = False
+
+    @staticmethod
+    def _library_version():
+        return confusable_homoglyphs.__version__
+
+    def load(self):
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path) as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            logger.info("No filter pattern cache at '%s'", self.path)
+            return
+        except (OSError, ValueError) as error:
+            logger.warning(
+                "Unable to read filter pattern cache at '%s'", self.path, exc_info=error
+            )
+            return
+
+        if not isinstance(data, dict) or (
+            data.get("version"),
+            data.get("library"),
+        ) != (CACHE_VERSION, self._library_version()):
+            logger.info("Filter pattern cache at '%s' is stale, ignoring", self.path)
+            return
+
+        self.patterns = data.get("patterns", {})
+        logger.info("Loaded %d cached filter patterns", len(self.patterns))
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+
+        data = {
+            "version": CACHE_VERSION,
+            "library": self._library_version(),
+            "patterns": self.patterns,
+        }
+
+        # Write to a temporary file first, so a crash can't leave it truncated
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as fh:
+                json.dump(data, fh)
+            os.replace(temp_path, self.path)
+        except OSError as error:
+            logger.warning(
+                "Unable to write filter pattern cache to '%s'",
+                self.path,
+                exc_info=error,
+            )
+        else:
+            logger.debug("Saved %d filter patterns", len(self.patterns))
+            self.dirty = False
+
+    def retain(self, texts):
+        """
+        Drops the patterns of any filter text not in the given set.
+        """
+
+        removed = self.patterns.keys() - texts
+        for text in removed:
+            del self.patterns[text]
+
+        if removed:
+            logger.debug("Dropped %d unused filter patterns", len(removed))
+            self.dirty = True
+
+    def get(self, text):
+        return self.patterns.get(text)
+
+    def store(self, text, pattern):
+        if self.patterns.get(text) != pattern:
+            self.patterns[text] = pattern
+            self.dirty = True
@@ -0,0 +1,65 @@
+#
+# cogs/filter/progress.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Reports the progress of long-running filter jobs to the moderator
+who started them, by editing a single message in place.
+"""
+
+import logging
+import time
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["ProgressReporter"]
+
+# Minimum number of seconds between progress message edits
+UPDATE_INTERVAL = 5.0
+
+
+class ProgressReporter:
+    """
+    Sends a progress message to 'destination' (anything with a send()
+    coroutine, such as a user or channel), and edits it as the job
+    advances. Edits are rate limited, except for the final one.
+
+    If the destination is None, or the message cannot be sent
+    (e.g. the moderator has DMs disabled), reports are silently dropped.
+    """
+
+    __slots__ = ("destination", "message", "last_update")
+
+    def __init__(self, destination):
+        self.destination = destination
+        self.message = None
+        self.last_update = 0.0
+
+    async def update(self, content, final=False):
+        if self.destination is None:
+            return
+
+        now = time.monotonic()
+        if not final and now - self.last_update < UPDATE_INTERVAL:
+            return
+
+        self.last_update = now
+
+        try:
+            if self.message is None:
+                self.message = await self.destination.send(content=content)
+            else:
+                await self.message.edit(content=content)
+        except discord.HTTPException as error:
+            logger.info("Unable to report job progress, giving up", exc_info=error)
+            self.destination = None
@@ -0,0 +1,306 @@
+#
+# cogs/filter/scan.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Retroactively scans channel history against the current filters.
+
+Each page of history is matched in bulk: all text filters at once through
+the worker pool, and all linked files with one batch of downloads through
+the digest cache. Only the messages which were hit go through the regular
+per-message checks, so enforcement behaves exactly as it does for new
+messages. Scans run in the background, and can be stopped and resumed.
+"""
+
+import asyncio
+import logging
+from collections import namedtuple
+
+import discord
+from discord import MessageType
+
+from futaba.str_builder import StringBuilder
+from futaba.utils import async_partial, plural
+from .check import check_message, filter_immune
+from .check.file import find_file_violation, get_file_targets, hash_file
+from .check.text import get_check_content, get_filter_candidates
+from .filter import find_matching_contents
+from .progress import ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["MAX_SCAN_LIMIT", "ScanHit", "ScanJob", "run_scan"]
+
+# Maximum number of messages which may be scanned per channel
+MAX_SCAN_LIMIT = 10000
+
+# Number of messages fetched per history request (the API maximum)
+PAGE_SIZE = 100
+
+# Number of channels whose history is fetched at once
+CHANNEL_CONCURRENCY = 3
+
+# Delay between history requests in a channel, in seconds
+PAGE_DELAY = 1.0
+
+# Delay between punishments, in seconds
+ENFORCE_DELAY = 0.5
+
+ScanHit = namedtuple("ScanHit", ("channel", "message_id", "author", "jump_url"))
+
+
+class ScanJob:
+    """
+    The state of a history scan, which is kept after the scan is stopped
+    so that it can be resumed where it left off.
+
+    Each channel's cursor is the ID of the oldest message scanned so far,
+    and channels whose history ran out before the limit are exhausted.
+    """
+
+    __slots__ = (
+        "guild",
+        "author",
+        "channels",
+        "limit",
+        "enforce",
+        "cursors",
+        "scanned",
+        "exhausted",
+        "hits",
+        "errors",
+        "task",
+    )
+
+    def __init__(self, guild, author, channels, limit, enforce):
+        self.guild = guild
+        self.author = author
+        self.channels = channels
+        self.limit = limit
+        self.enforce = enforce
+        self.cursors = {}
+        self.scanned = dict.fromkeys((channel.id for channel in channels), 0)
+        self.exhausted = set()
+        self.hits = []
+        self.errors = 0
+        self.task = None
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    @property
+    def finished(self):
+        return all(self.remaining(channel) == 0 for channel in self.channels)
+
+    @property
+    def total_scanned(self):
+        return sum(self.scanned.values())
+
+    def remaining(self, channel):
+        if channel.id in self.exhausted:
+            return 0
+
+        return self.limit - self.scanned[channel.id]
+
+    def status(self):
+        mode = "enforcing" if self.enforce else "reporting"
+        return (
+            f"Scanned {self.total_scanned} of {self.limit * len(self.channels)} messages "
+            f"in {len(self.channels)} channel{plural(len(self.channels))} ({mode}), "
+            f"{len(self.hits)} hit{plural(len(self.hits))}"
+        )
+
+
+async def _find_hits(cog, channel, messages):
+    """
+    Matches a page of messages against all filters in bulk,
+    and returns the messages which violate any of them.
+    """
+
+    guild = channel.guild
+    hits = set()
+
+    candidates = get_filter_candidates(cog, channel)
+    if candidates:
+        contents = [get_check_content(message) for message in messages]
+        patterns = tuple(filter.pattern for _, _, filter, _ in candidates)
+        hits.update(
+            await cog.offloader.run(
+                sum(map(len, contents)),
+                cog.offloader.inline_chars,
+                find_matching_contents,
+                patterns,
+                contents,
+            )
+        )
+
+    if cog.content_filters[guild] or cog.perceptual_index.get(guild):
+        message_targets = [
+            (i, targets)
+            for i, targets in enumerate(map(get_file_targets, messages))
+            if targets
+        ]
+        all_targets = [target for _, targets in message_targets for target in targets]
+
+        if all_targets:
+            results = await cog.digest_cache.get_digests(
+                cog.bot.http_pool, all_targets, async_partial(hash_file, cog)
+            )
+
+            offset = 0
+            for i, targets in message_targets:
+                end = offset + len(targets)
+                if find_file_violation(cog, messages[i], targets, results[offset:end]):
+                    hits.add(i)
+                offset = end
+
+    return [messages[i] for i in sorted(hits)]
+
+
+async def _scan_channel(cog, job, channel, progress):
+    while job.remaining(channel) > 0:
+        cursor = job.cursors.get(channel.id)
+        before = None if cursor is None else discord.Object(id=cursor)
+        messages = await channel.history(
+            limit=min(PAGE_SIZE, job.remaining(channel)), before=before
+        ).flatten()
+
+        if not messages:
+            # Reached the start of the channel
+            job.exhausted.add(channel.id)
+            break
+
+        to_check = [
+            message for message in messages if message.type == MessageType.default
+        ]
+
+        try:
+            hits = await _find_hits(cog, channel, to_check)
+        except Exception as error:
+            logger.error(
+                "Unable to scan page of #%s (%d)",
+                channel.name,
+                channel.id,
+                exc_info=error,
+            )
+            job.errors += 1
+            hits = []
+
+        for message in hits:
+            if filter_immune(cog, job.guild, message.author, channel):
+                continue
+
+            job.hits.append(
+                ScanHit(
+                    channel=channel,
+                    message_id=message.id,
+                    author=message.author,
+                    jump_url=message.jump_url,
+                )
+            )
+
+            if job.enforce:
+                try:
+                    await check_message(cog, message)
+                except discord.HTTPException as error:
+                    logger.warning(
+                        "Unable to enforce filter on message %d",
+                        message.id,
+                        exc_info=error,
+                    )
+
+                await asyncio.sleep(ENFORCE_DELAY)
+
+        # Only advance once the page is fully handled, so a stopped scan redoes it
+        job.cursors[channel.id] = messages[-1].id
+        job.scanned[channel.id] += len(messages)
+        await progress.update(f"{job.status()}...")
+        await asyncio.sleep(PAGE_DELAY)
+
+
+async def _report(job, progress, content):
+    await progress.update(content, final=True)
+
+    if not job.hits or job.author is None:
+        return
+
+    report = StringBuilder()
+    for hit in job.hits:
+        report.writeln(
+            f"#{hit.channel.name}: {hit.author} ({hit.author.id}) - {hit.jump_url}"
+        )
+
+    try:
+        if len(report) > 1900:
+            await job.author.send(
+                content="Messages found by the filter scan:",
+                file=discord.File(report.bytes_io(), filename="filter-scan.txt"),
+            )
+        else:
+            await job.author.send(content=f"```\n{report}```")
+    except discord.HTTPException as error:
+        logger.info("Unable to send filter scan report", exc_info=error)
+
+
+async def run_scan(cog, job):
+    """
+    Runs (or resumes) the given scan job. Progress is reported to the job's
+    author, and the list of hits is sent to them when it finishes.
+    """
+
+    logger.info(
+        "Scanning history of %d channels in guild '%s' (%d)",
+        len(job.channels),
+        job.guild.name,
+        job.guild.id,
+    )
+
+    progress = ProgressReporter(job.author)
+    semaphore = asyncio.Semaphore(CHANNEL_CONCURRENCY)
+
+    async def scan(channel):
+        async with semaphore:
+            try:
+                await _scan_channel(cog, job, channel, progress)
+            except discord.HTTPException as error:
+                logger.warning(
+                    "Unable to read history of #%s (%d)",
+                    channel.name,
+                    channel.id,
+                    exc_info=error,
+                )
+                job.errors += 1
+
+    try:
+        await asyncio.gather(
+            *[scan(channel) for channel in job.channels if job.remaining(channel) > 0]
+        )
+    except asyncio.CancelledError:
+        logger.info(
+            "Filter scan in guild '%s' (%d) stopped", job.guild.name, job.guild.id
+        )
+        await _report(job, progress, f"Scan stopped. {job.status()}.")
+        raise
+
+    content = StringBuilder(f"Scan finished. {job.status()}.")
+    if job.errors:
+        content.write(f" {job.errors} page{plural(job.errors)} could not be checked.")
+
+    cog.journal.send(
+        "scan/finish",
+        job.guild,
+        str(content),
+        icon="filter",
+        hits=len(job.hits),
+        cause=job.author,
+    )
+    await _report(job, progress, str(content))
@@ -10,6 +10,7 @@
 # WITHOUT ANY WARRANTY. See the LICENSE file for more details.
 #
 
+from futaba.pipeline import MEMBER_UPDATE, EventKind
 from .alias import Alias
 from .core import Info
 
@@ -26,7 +27,13 @@ def setup_info(bot):
 
 def setup_alias(bot):
     cog = Alias(bot)
-    bot.add_listener(cog.member_update, "on_member_update")
+    bot.pipeline.register(
+        MEMBER_UPDATE,
+        "alias",
+        cog.member_update,
+        40,
+        (EventKind.AVATAR, EventKind.NAME, EventKind.NICK),
+    )
     bot.add_cog(cog)
 
 
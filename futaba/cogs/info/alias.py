@@ -17,7 +17,6 @@ Tracking for aliases of members, storing previous usernames, nicknames, and avat
 import logging
 import re
 from datetime import datetime
-from io import BytesIO
 
 import discord
 from discord.ext import commands
@@ -25,6 +24,7 @@ from discord.ext import commands
 from futaba import permissions
 from futaba.converters import UserConv
 from futaba.exceptions import CommandFailed, SendHelp
+from futaba.pipeline import MEMBER_UPDATE, EventKind
 from futaba.str_builder import StringBuilder
 from futaba.utils import fancy_timedelta, user_discrim
 from ..abc import AbstractCog
@@ -65,13 +65,21 @@ class Alias(AbstractCog):
     def setup(self):
         pass
 
-    async def member_update(self, before, after):
+    def cog_unload(self):
+        """
+        Remove pipeline stages when unloading the cog.
+        """
+
+        self.bot.pipeline.unregister(MEMBER_UPDATE, "alias")
+
+    async def member_update(self, update):
         """ Handles update of member information. """
 
+        before, after = update.before, update.after
         changes = MemberChanges()
         timestamp = datetime.now()
 
-        if before.avatar != after.avatar:
+        if EventKind.AVATAR in update.kinds:
             logger.info(
                 "Member '%s' (%d) has changed their profile picture (%s)",
                 before.name,
@@ -80,7 +88,7 @@ class Alias(AbstractCog):
             )
             changes.avatar_url = after.avatar_url
 
-        if before.name != after.name:
+        if EventKind.NAME in update.kinds:
             logger.info(
                 "Member '%s' (%d) has changed name to '%s'",
                 before.name,
@@ -89,7 +97,7 @@ class Alias(AbstractCog):
             )
             changes.username = after.name
 
-        if before.nick != after.nick and after.nick is not None:
+        if EventKind.NICK in update.kinds and after.nick is not None:
             logger.info(
                 "Member '%s' (%d) has changed nick to '%s'",
                 before.display_name,
@@ -102,11 +110,16 @@ class Alias(AbstractCog):
         if not changes:
             return
 
+        # A failed download only loses the avatar, not the other changes
+        avatar = None
+        if changes.avatar_url is not None:
+            avatar = await self._download_avatar(changes.avatar_url)
+
         attrs = StringBuilder(sep=", ")
         with self.bot.sql.transaction():
             if changes.avatar_url is not None:
-                avatar, avatar_ext = await self._download_avatar(changes.avatar_url)
-                self.bot.sql.alias.add_avatar(before, timestamp, avatar, avatar_ext)
+                if avatar is not None:
+                    self.bot.sql.alias.add_avatar(before, timestamp, *avatar)
                 attrs.write(f"avatar: {changes.avatar_url}")
             if changes.username is not None:
                 self.bot.sql.alias.add_username(before, timestamp, changes.username)
@@ -127,13 +140,20 @@ class Alias(AbstractCog):
         )
 
     async def _download_avatar(self, asset):
-        avatar = BytesIO()
-        avatar_url = str(asset)
-        await asset.save(avatar)
+        """
+        Returns the avatar and its extension, or None if it can't be stored.
+        """
 
+        avatar_url = str(asset)
         match = EXTENSION_REGEX.findall(avatar_url)
         if not match:
-            raise ValueError(f"Avatar URL does not match extension regex: {avatar_url}")
+            logger.error("Avatar URL does not match extension regex: %s", avatar_url)
+            return None
+
+        avatar = await self.bot.http_pool.download_link(avatar_url)
+        if avatar is None:
+            logger.error("Unable to download avatar: %s", avatar_url)
+            return None
 
         avatar_ext = match[0]
         return avatar, avatar_ext
@@ -37,9 +37,9 @@ from futaba.permissions import mod_perm
 from futaba.similar import similar_users
 from futaba.str_builder import StringBuilder
 from futaba.utils import (
-    GIT_HASH,
     escape_backticks,
     fancy_timedelta,
+    git_hash,
     lowerbool,
     plural,
     user_discrim,
@@ -79,7 +79,7 @@ class Info(AbstractCog):
 
         embed = discord.Embed()
         embed.set_thumbnail(url=self.bot.user.avatar_url)
-        embed.set_author(name=f"Futaba v{__version__} [{GIT_HASH}]")
+        embed.set_author(name=f"Futaba v{__version__} [{git_hash()}]")
         embed.add_field(name="Running for", value=fancy_timedelta(self.bot.uptime))
         embed.add_field(
             name="Created by",
@@ -10,6 +10,7 @@
 # WITHOUT ANY WARRANTY. See the LICENSE file for more details.
 #
 
+from futaba.pipeline import MEMBER_UPDATE, EventKind
 from .core import Miscellaneous
 from .debug import Debugging
 from .mentionable import Mentionable
@@ -34,7 +35,13 @@ def setup_debugging(bot):
 def setup_mentionable(bot):
     cog = Mentionable(bot)
     bot.add_listener(cog.member_join, "on_member_join")
-    bot.add_listener(cog.member_update, "on_member_update")
+    bot.pipeline.register(
+        MEMBER_UPDATE,
+        "mentionable",
+        cog.member_update,
+        20,
+        (EventKind.NAME, EventKind.NICK, EventKind.ROLES),
+    )
     bot.add_cog(cog)
 
 
@@ -22,7 +22,6 @@ from hashlib import sha1
 import discord
 from discord.ext import commands
 
-from futaba.download import download_links
 from futaba.exceptions import CommandFailed
 from futaba.str_builder import StringBuilder
 from futaba.unicode import unicode_repr
@@ -114,7 +113,7 @@ class Miscellaneous(AbstractCog):
         # Download and check files
         contents = []
         content = StringBuilder("Hashes:\n```")
-        buffers = await download_links(links)
+        buffers = await self.bot.http_pool.download_links(links)
         for i, binio in enumerate(buffers):
             if binio is None:
                 hashsum = SHA1_ERROR_MESSAGE
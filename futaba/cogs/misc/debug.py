@@ -13,8 +13,14 @@
 """ Cog for miscellaneous owner-only debugging commands. """
 
 import asyncio
+import cProfile
+import copy
+import io
 import logging
+import marshal
+import pstats
 import sys
+from datetime import datetime
 
 import aiohttp
 import discord
@@ -22,6 +28,9 @@ from discord.ext import commands
 
 from futaba import permissions
 from futaba.enums import Reactions
+from futaba.exceptions import CommandFailed
+from futaba.profiler import PHASES
+from futaba.str_builder import StringBuilder
 from futaba.utils import plural
 from ..abc import AbstractCog
 
@@ -54,6 +63,200 @@ class Debugging(AbstractCog):
         )
         await ctx.send(embed=embed)
 
+    @commands.command(name="httpstats", aliases=["netstats"], hidden=True)
+    @permissions.check_owner()
+    async def http_stats(self, ctx):
+        """ Displays per-host transfer statistics for the shared HTTP client. """
+
+        stats = self.bot.http_pool.stats
+        embed = discord.Embed(colour=discord.Colour.teal())
+        embed.set_author(name="HTTP download statistics")
+
+        if not stats:
+            embed.colour = discord.Colour.dark_purple()
+            embed.description = "No files have been downloaded yet."
+            await ctx.send(embed=embed)
+            return
+
+        descr = StringBuilder("```\n")
+        hosts = sorted(stats.items(), key=lambda item: item[1].bytes, reverse=True)
+        for host, host_stats in hosts[:20]:
+            descr.writeln(
+                f"{host or '(none)'}: {host_stats.requests} req, "
+                f"{host_stats.failures} failed, {host_stats.bytes} bytes, "
+                f"{host_stats.mean_time * 1000:.1f} ms avg, "
+                f"{host_stats.max_time * 1000:.1f} ms max"
+            )
+        descr.writeln("```")
+        embed.description = str(descr)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="pipelinestats", aliases=["stagestats"], hidden=True)
+    @permissions.check_owner()
+    async def pipeline_stats(self, ctx):
+        """ Displays how long each event pipeline stage has taken. """
+
+        embed = discord.Embed(colour=discord.Colour.teal())
+        embed.set_author(name="Event pipeline stages")
+
+        descr = StringBuilder("```\n")
+        for event, stages in self.bot.pipeline.stages.items():
+            descr.writeln(f"{event}:")
+            for stage in stages:
+                timing = self.bot.pipeline.timings[(event, stage.name)]
+                descr.writeln(
+                    f"  {stage.order:>3} {stage.name}: {timing.calls} run, "
+                    f"{timing.skips} skipped, {timing.mean * 1000:.2f} ms avg, "
+                    f"{timing.max * 1000:.1f} ms max"
+                )
+                if stage.after:
+                    descr.writeln(f"      (after {', '.join(stage.after)})")
+        descr.writeln("```")
+        embed.description = str(descr)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="loopstats", aliases=["lagstats"], hidden=True)
+    @permissions.check_owner()
+    async def loop_stats(self, ctx):
+        """ Displays event loop lag, and what has been blocking the loop. """
+
+        monitor = self.bot.loop_monitor
+        p50, p90, p99 = monitor.percentiles()
+        peak = max(monitor.samples, default=0.0)
+
+        embed = discord.Embed(colour=discord.Colour.teal())
+        embed.set_author(name="Event loop lag")
+        embed.description = (
+            f"Over the last `{len(monitor.samples)}` samples: "
+            f"p50 `{p50 * 1000:.1f}` ms, p90 `{p90 * 1000:.1f}` ms, "
+            f"p99 `{p99 * 1000:.1f}` ms, max `{peak * 1000:.1f}` ms"
+        )
+
+        offenders = monitor.worst_offenders()
+        if offenders:
+            descr = StringBuilder("```\n")
+            for (kind, name), stats in offenders:
+                descr.writeln(
+                    f"{kind} {name[:40]}: {stats.count}x, "
+                    f"{stats.max_blocked * 1000:.1f} ms max, "
+                    f"{stats.total_blocked / stats.count * 1000:.1f} ms avg"
+                )
+            descr.writeln("```")
+            embed.add_field(name="Worst offenders", value=str(descr), inline=False)
+        else:
+            embed.add_field(
+                name="Worst offenders",
+                value=f"Nothing has blocked for more than `{monitor.slow_threshold}` seconds.",
+                inline=False,
+            )
+
+        await ctx.send(embed=embed)
+
+    @commands.command(name="lockstats", hidden=True)
+    @permissions.check_owner()
+    async def lock_stats(self, ctx):
+        """ Displays contention on the bot's message and member locks. """
+
+        embed = discord.Embed(colour=discord.Colour.teal())
+        embed.set_author(name="Keyed locks")
+
+        descr = StringBuilder("```\n")
+        for locks in (self.bot.message_locks, self.bot.member_locks):
+            stats = locks.stats
+            descr.writeln(
+                f"{locks.name}: {len(locks)} held, {locks.waiters} waiting, "
+                f"{stats.acquisitions} acquired, {stats.contended} contended, "
+                f"{stats.mean_wait * 1000:.1f} ms avg wait, "
+                f"{stats.max_wait * 1000:.1f} ms max wait"
+            )
+        descr.writeln("```")
+        embed.description = str(descr)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="commandstats", aliases=["cmdstats"], hidden=True)
+    @permissions.check_owner()
+    async def command_stats(self, ctx):
+        """ Displays how long commands have taken, and where that time went. """
+
+        timings = self.bot.command_time_metric
+        phases = self.bot.command_phase_metric
+
+        embed = discord.Embed(colour=discord.Colour.teal())
+        embed.set_author(name="Command timings")
+
+        if not timings.values:
+            embed.colour = discord.Colour.dark_purple()
+            embed.description = "No commands have been run yet."
+            await ctx.send(embed=embed)
+            return
+
+        commands_run = []
+        for (name,) in timings.values:
+            count, total = timings.summary((name,))
+            commands_run.append((total / count, name, count))
+        commands_run.sort(reverse=True)
+
+        descr = StringBuilder("```\n")
+        for mean, name, count in commands_run[:20]:
+            descr.write(f"{name[:24]}: {count}x, {mean * 1000:.1f} ms avg")
+            for phase in PHASES:
+                _, total = phases.summary((name, phase))
+                descr.write(f", {phase} {total / count * 1000:.1f}")
+            descr.writeln()
+        descr.writeln("```")
+        embed.description = str(descr)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="profile", hidden=True)
+    @permissions.check_owner()
+    async def profile(self, ctx, *, command: str):
+        """
+        Runs a command under cProfile, and uploads the stats to the error channel.
+        Other work on the event loop during the command is included in the profile.
+        """
+
+        if self.bot.error_channel is None:
+            embed = discord.Embed(colour=discord.Colour.red())
+            embed.description = "No error channel is configured to upload results to."
+            raise CommandFailed(embed=embed)
+
+        message = copy.copy(ctx.message)
+        message.content = f"{ctx.prefix}{command}"
+        new_ctx = await self.bot.get_context(message)
+        if new_ctx.command is None:
+            embed = discord.Embed(colour=discord.Colour.red())
+            embed.description = f"No such command: `{command}`"
+            raise CommandFailed(embed=embed)
+
+        logger.info("Profiling command '%s'", new_ctx.command.qualified_name)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.bot.invoke(new_ctx)
+        finally:
+            profiler.disable()
+
+        profiler.create_stats()
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats("cumulative").print_stats(40)
+
+        unix_time = int(datetime.now().timestamp())
+        name = new_ctx.command.qualified_name.replace(" ", "-")
+        files = [
+            discord.File(
+                fp=io.BytesIO(marshal.dumps(profiler.stats)),
+                filename=f"futaba-profile-{name}-{unix_time}.prof",
+            ),
+            discord.File(
+                fp=io.BytesIO(summary.getvalue().encode("utf-8")),
+                filename=f"futaba-profile-{name}-{unix_time}.txt",
+            ),
+        ]
+        await self.bot.error_channel.send(
+            content=f"Profile of `{command}`, run by {ctx.author.mention}", files=files
+        )
+
     @commands.command(name="testlong", aliases=["testwait"], hidden=True)
     @permissions.check_owner()
     async def test_long_command(self, ctx, delay: float = 4.0):
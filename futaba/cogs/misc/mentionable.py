@@ -23,6 +23,7 @@ import discord
 from discord.ext import commands
 
 from futaba import permissions
+from futaba.pipeline import MEMBER_UPDATE, EventKind
 from futaba.utils import plural, user_discrim
 from ..abc import AbstractCog
 
@@ -45,6 +46,13 @@ class Mentionable(AbstractCog):
     def setup(self):
         pass
 
+    def cog_unload(self):
+        """
+        Remove pipeline stages when unloading the cog.
+        """
+
+        self.bot.pipeline.unregister(MEMBER_UPDATE, "mentionable")
+
     @staticmethod
     def invalid_name(prefix, name):
         # Ignore if no nickname is set
@@ -121,8 +129,13 @@ class Mentionable(AbstractCog):
     async def member_join(self, member):
         await self.enforce_mentionable_name(member)
 
-    async def member_update(self, before, after):
-        await self.enforce_mentionable_name(after)
+    async def member_update(self, update):
+        # Role changes only matter if they could move the member below the bot
+        if update.kinds == {EventKind.ROLES}:
+            if update.before.top_role == update.after.top_role:
+                return
+
+        await self.enforce_mentionable_name(update.after)
 
     @commands.command(name="ensurementionable", aliases=["ensuremention", "fmention"])
     @commands.guild_only()
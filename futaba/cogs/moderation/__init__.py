@@ -10,6 +10,7 @@
 # WITHOUT ANY WARRANTY. See the LICENSE file for more details.
 #
 
+from futaba.pipeline import MEMBER_UPDATE, EventKind
 from .cleanup import Cleanup
 from .core import Moderation
 from .manual_mod_action_warn import ManualModActionWarn
@@ -33,7 +34,9 @@ def setup_moderation(bot):
 
 def setup_manualmodactionwarn(bot):
     cog = ManualModActionWarn(bot)
-    bot.add_listener(cog.member_update, "on_member_update")
+    bot.pipeline.register(
+        MEMBER_UPDATE, "manualmodactionwarn", cog.member_update, 50, (EventKind.ROLES,),
+    )
     bot.add_listener(cog.member_remove, "on_member_remove")
     bot.add_cog(cog)
 
@@ -21,7 +21,7 @@ import discord
 from discord.ext import commands
 
 from futaba import permissions
-from futaba.dict_convert import message_dict
+from futaba.dict_convert import to_dict
 from futaba.exceptions import CommandFailed
 from futaba.str_builder import StringBuilder
 from futaba.unicode import normalize_caseless
@@ -88,7 +88,7 @@ class Cleanup(AbstractCog):
     @staticmethod
     def dump_messages(messages):
         buffer = StringBuilder()
-        obj = list(map(message_dict, reversed(messages)))
+        obj = list(map(to_dict, reversed(messages)))
         json.dump(obj, buffer, ensure_ascii=True, indent=4)
         return obj, discord.File(buffer.bytes_io(), filename="deleted-messages.json")
 
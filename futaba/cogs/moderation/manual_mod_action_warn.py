@@ -20,6 +20,7 @@ from discord import AuditLogAction
 
 from futaba.cogs.tracker import get_removal_cause
 from futaba.enums import ManualModActionType, MemberLeaveType
+from futaba.pipeline import MEMBER_UPDATE
 from ..abc import AbstractCog
 
 logger = logging.getLogger(__name__)
@@ -43,6 +44,13 @@ class ManualModActionWarn(AbstractCog):
     def setup(self):
         pass
 
+    def cog_unload(self):
+        """
+        Remove pipeline stages when unloading the cog.
+        """
+
+        self.bot.pipeline.unregister(MEMBER_UPDATE, "manualmodactionwarn")
+
     async def dispatch_manual_action_warning(
         self, guild, action, moderator, target_member, **kwargs
     ):
@@ -104,21 +112,16 @@ class ManualModActionWarn(AbstractCog):
 
         roles = set(roles)
         updated_roles = []
-        utc_now = datetime.utcnow()
-
-        async for entry in member.guild.audit_logs(
-            limit=20, action=AuditLogAction.member_role_update
-        ):
-            if entry.target != member:
-                continue
 
-            if entry.user == self.bot.user:
-                continue
-
-            if (utc_now - entry.created_at) >= timedelta(seconds=5):
-                # Gone back too far, no more events are relevant
-                break
+        entries = await self.bot.audit_log.wait_for_entries(
+            member.guild,
+            (AuditLogAction.member_role_update,),
+            member.id,
+            window=timedelta(seconds=5),
+            check=lambda entry: entry.user != self.bot.user,
+        )
 
+        for entry in entries:
             roles_updated_here = roles & (
                 frozenset(entry.before.roles) | frozenset(entry.after.roles)
             )
@@ -128,21 +131,14 @@ class ManualModActionWarn(AbstractCog):
 
         return updated_roles
 
-    async def member_update(self, before, after):
-        member = after
-        after_roles = frozenset(after.roles)
-        before_roles = frozenset(before.roles)
-
-        roles_updated = after_roles ^ before_roles
-
-        if not roles_updated:
-            return
+    async def member_update(self, update):
+        member = update.after
 
         if not self.bot.sql.settings.get_warn_manual_mod_action(member.guild):
             return
 
-        special_roles = self.bot.sql.settings.get_special_roles(member.guild)
-        roles_to_check = roles_updated & frozenset(special_roles)
+        special_roles = update.special_roles
+        roles_to_check = update.roles_changed & frozenset(special_roles)
 
         if not roles_to_check:
             return
@@ -173,7 +169,7 @@ class ManualModActionWarn(AbstractCog):
         if not self.bot.sql.settings.get_warn_manual_mod_action(member.guild):
             return
 
-        leave_reason = await get_removal_cause(member, datetime.now())
+        leave_reason = await get_removal_cause(self.bot, member, datetime.utcnow())
 
         if leave_reason.type not in (MemberLeaveType.KICKED, MemberLeaveType.BANNED):
             return
@@ -18,11 +18,11 @@ persistently storing and managing scheduled tasks.
 import logging
 from datetime import datetime
 
-import dateparser
 import discord
 from discord.ext import commands
 
 from futaba.exceptions import CommandFailed
+from futaba.lazy import lazy_import
 from futaba.navi import SendMessageTask, build_navi_task
 from futaba.str_builder import StringBuilder
 from futaba.utils import escape_backticks, fancy_timedelta
@@ -30,10 +30,15 @@ from ..abc import AbstractCog
 
 logger = logging.getLogger(__name__)
 
+dateparser = lazy_import("dateparser")
+
 
 class Navi(AbstractCog):
     __slots__ = ("journal",)
 
+    # Overdue tasks run right away, and may journal or use special roles
+    setup_after = ("Journal", "Settings")
+
     def __init__(self, bot):
         super().__init__(bot)
         self.journal = bot.get_broadcaster("/navi")
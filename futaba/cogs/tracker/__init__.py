@@ -10,6 +10,7 @@
 # WITHOUT ANY WARRANTY. See the LICENSE file for more details.
 #
 
+from futaba.pipeline import MESSAGE, EventKind
 from .core import Tracker, LISTENERS, get_removal_cause
 
 # Setup for when cog is loaded
@@ -21,6 +22,7 @@ def setup_tracker(bot):
     cog = Tracker(bot)
     for listener in LISTENERS:
         bot.add_listener(getattr(cog, listener), listener)
+    bot.pipeline.register(MESSAGE, "tracker", cog.new_message, 20, (EventKind.GUILD,))
     bot.add_cog(cog)
 
 
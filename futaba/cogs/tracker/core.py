@@ -15,6 +15,7 @@ Cog for journaling live API events such as username changes, users joining and l
 """
 
 import asyncio
+import json
 import logging
 from collections import deque, namedtuple
 from datetime import datetime, timedelta
@@ -22,8 +23,12 @@ from datetime import datetime, timedelta
 import discord
 from discord import AuditLogAction
 
+from futaba.archive import ArchivedMessage
+from futaba.dict_convert import to_dict
 from futaba.enums import MemberLeaveType
-from futaba.utils import user_discrim
+from futaba.pipeline import MESSAGE, EventKind
+from futaba.str_builder import StringBuilder
+from futaba.utils import plural, user_discrim
 from ..abc import AbstractCog
 
 logger = logging.getLogger(__name__)
@@ -41,9 +46,11 @@ MemberLeaveReason = namedtuple(
 )
 
 LISTENERS = (
-    "on_message",
     "on_message_edit",
     "on_message_delete",
+    "on_raw_message_delete",
+    "on_raw_message_edit",
+    "on_raw_bulk_message_delete",
     "on_reaction_add",
     "on_reaction_remove",
     "on_reaction_clear",
@@ -54,43 +61,68 @@ LISTENERS = (
 )
 
 
-async def get_removal_cause(member, timestamp):
-    async for entry in member.guild.audit_logs(limit=20):
-        if abs(timestamp - entry.created_at) < timedelta(seconds=3):
-            if entry.action == AuditLogAction.kick:
-                if entry.target == member:
-                    return MemberLeaveReason(
-                        type=MemberLeaveType.KICKED,
-                        member=member,
-                        cause=entry.user,
-                        reason=entry.reason,
-                        left_at=entry.created_at,
-                        audit_log_entry=entry,
-                    )
-            elif entry.action == AuditLogAction.ban:
-                if entry.target == member:
-                    return MemberLeaveReason(
-                        type=MemberLeaveType.BANNED,
-                        member=member,
-                        cause=entry.user,
-                        reason=entry.reason,
-                        left_at=entry.created_at,
-                        audit_log_entry=entry,
-                    )
-            elif entry.action == AuditLogAction.member_prune:
-                # Unfortunately the audit log entry doesn't
-                # tell us enough to determine if this member was part of
-                # the prune, so we'll just take a leap of faith and say
-                # it was so.
-
-                return MemberLeaveReason(
-                    type=MemberLeaveType.PRUNED,
-                    member=member,
-                    cause=entry.user,
-                    reason=entry.reason,
-                    left_at=entry.created_at,
-                    audit_log_entry=entry,
-                )
+# How long deletions in a channel are collected before being journaled, in seconds
+DELETE_COALESCE_WINDOW = 2.0
+
+# Seconds after a deletion by which its audit log entry, if any, is visible.
+# Self-deletes have no entry, so once the audit log has been read after
+# this, the author is the only one who could have deleted the message.
+DELETE_AUDIT_SETTLE = 1.0
+
+LEAVE_TYPES = {
+    AuditLogAction.kick: MemberLeaveType.KICKED,
+    AuditLogAction.ban: MemberLeaveType.BANNED,
+    AuditLogAction.member_prune: MemberLeaveType.PRUNED,
+}
+
+
+def dump_deleted_messages(messages, message_ids):
+    """
+    Produces an NDJSON file with a line for each deleted message, oldest first.
+    Messages may be full objects or compact snapshots, and those which
+    weren't in either cache only have their ID.
+    """
+
+    by_id = {message.id: message for message in messages}
+    buffer = StringBuilder()
+    for message_id in sorted(message_ids):
+        message = by_id.get(message_id)
+        obj = {"id": str(message_id)} if message is None else to_dict(message)
+        buffer.writeln(json.dumps(obj, ensure_ascii=True))
+
+    return discord.File(buffer.bytes_io(), filename="deleted-messages.ndjson")
+
+
+async def get_removal_cause(bot, member, timestamp):
+    """
+    Determines why a member left, from the guild's shared audit log cache.
+    The timestamp is when they left, as a naive UTC datetime.
+    """
+
+    def check(entry):
+        # Unfortunately the audit log entry for a prune doesn't
+        # tell us enough to determine if this member was part of
+        # the prune, so we'll just take a leap of faith and say
+        # it was so.
+
+        if entry.action == AuditLogAction.member_prune:
+            return True
+
+        return getattr(entry.target, "id", None) == member.id
+
+    entry = await bot.audit_log.wait_for_entry(
+        member.guild, tuple(LEAVE_TYPES), since=timestamp, check=check
+    )
+
+    if entry is not None:
+        return MemberLeaveReason(
+            type=LEAVE_TYPES[entry.action],
+            member=member,
+            cause=entry.user,
+            reason=entry.reason,
+            left_at=entry.created_at,
+            audit_log_entry=entry,
+        )
 
     # Couldn't find anything, must be a voluntary departure
     return MemberLeaveReason(
@@ -109,6 +141,7 @@ class Tracker(AbstractCog):
         "new_messages",
         "edited_messages",
         "deleted_messages",
+        "pending_deletes",
         "members_joined",
         "members_left",
         "reactions",
@@ -120,6 +153,7 @@ class Tracker(AbstractCog):
         self.new_messages = deque(maxlen=20)
         self.edited_messages = deque(maxlen=20)
         self.deleted_messages = deque(maxlen=20)
+        self.pending_deletes = {}
         self.members_joined = deque(maxlen=20)
         self.members_left = deque(maxlen=20)
         self.reactions = deque(maxlen=20)
@@ -135,6 +169,8 @@ class Tracker(AbstractCog):
         for listener in LISTENERS:
             self.bot.remove_listener(getattr(self, listener), listener)
 
+        self.bot.pipeline.unregister(MESSAGE, "tracker")
+
     @staticmethod
     def build_embed(message):
         embed = discord.Embed(description=message.content)
@@ -153,20 +189,33 @@ class Tracker(AbstractCog):
 
         return embed
 
-    async def on_message(self, message):
-        if message in self.new_messages:
+    def is_blacklisted(self, guild, channel=None, user=None):
+        """
+        Checks the guild's tracking blacklist for the given channel and user.
+        Handlers call this before building anything to journal.
+        """
+
+        blacklist = self.bot.sql.settings.get_tracking_blacklist(guild)
+        return blacklist.blocks(getattr(channel, "id", None), getattr(user, "id", None))
+
+    def archive_message(self, message):
+        if self.bot.archive is not None:
+            self.bot.archive.add(ArchivedMessage.from_message(message))
+
+    async def new_message(self, event):
+        message = event.message
+        if EventKind.OWN in event.kinds:
             return
-        else:
-            self.new_messages.append(message)
 
-        if message.guild is None or message.author == self.bot.user:
+        if self.is_blacklisted(message.guild, message.channel, message.author):
             return
 
-        blacklist = self.bot.sql.settings.get_tracking_blacklist(message.guild)
-        if blacklist.is_blocked(message.channel) or blacklist.is_blocked(
-            message.author
-        ):
+        if message in self.new_messages:
             return
+        else:
+            self.new_messages.append(message)
+
+        self.archive_message(message)
 
         logger.debug(
             "Received message from %s (%d) in #%s (%d)",
@@ -197,17 +246,18 @@ class Tracker(AbstractCog):
         )
 
     async def on_message_edit(self, before, after):
-        if after in self.edited_messages:
+        if after.guild is None or after.author == self.bot.user:
             return
-        else:
-            self.edited_messages.append(after)
 
-        if after.guild is None or after.author == self.bot.user:
+        if self.is_blacklisted(after.guild, after.channel, after.author):
             return
 
-        blacklist = self.bot.sql.settings.get_tracking_blacklist(after.guild)
-        if blacklist.is_blocked(after.channel) or blacklist.is_blocked(after.author):
+        if after in self.edited_messages:
             return
+        else:
+            self.edited_messages.append(after)
+
+        self.archive_message(after)
 
         logger.debug(
             "Message %d by %s (%d) in #%s (%d) was edited",
@@ -245,20 +295,29 @@ class Tracker(AbstractCog):
             embed=self.build_embed(after),
         )
 
-    async def get_deletion_reason(self, message, timestamp):
-        async for entry in message.guild.audit_logs(
-            limit=20, action=AuditLogAction.message_delete
-        ):
-            if entry.after.id == message.id:
-                if abs(timestamp - entry.created_at) < timedelta(seconds=3):
-                    return MessageDeletionReason(
-                        message=message,
-                        cause=entry.user,
-                        count=entry.extra.count,
-                        reason=entry.reason,
-                        deleted_at=timestamp,
-                        audit_log_entry=entry,
-                    )
+    async def get_deletion_reason(
+        self, message, timestamp, window=timedelta(seconds=3)
+    ):
+        # The entry is for the message's author, not the message itself
+        entry = await self.bot.audit_log.wait_for_entry(
+            message.guild,
+            (AuditLogAction.message_delete,),
+            message.author.id,
+            since=timestamp,
+            window=window,
+            settle=DELETE_AUDIT_SETTLE,
+            check=lambda entry: entry.extra.channel.id == message.channel.id,
+        )
+
+        if entry is not None:
+            return MessageDeletionReason(
+                message=message,
+                cause=entry.user,
+                count=entry.extra.count,
+                reason=entry.reason,
+                deleted_at=timestamp,
+                audit_log_entry=entry,
+            )
 
         # Couldn't find anything, must be a self-delete.
         return MessageDeletionReason(
@@ -271,19 +330,16 @@ class Tracker(AbstractCog):
         )
 
     async def on_message_delete(self, message):
-        if message in self.deleted_messages:
+        if message.guild is None:
             return
-        else:
-            self.deleted_messages.append(message)
 
-        if message.guild is None:
+        if self.is_blacklisted(message.guild, message.channel, message.author):
             return
 
-        blacklist = self.bot.sql.settings.get_tracking_blacklist(message.guild)
-        if blacklist.is_blocked(message.channel) or blacklist.is_blocked(
-            message.author
-        ):
+        if message in self.deleted_messages:
             return
+        else:
+            self.deleted_messages.append(message)
 
         logger.debug(
             "Message %d by %s (%d) was deleted",
@@ -292,10 +348,256 @@ class Tracker(AbstractCog):
             message.author.id,
         )
 
-        # Wait for a bit so we can catch the audit log entry
-        timestamp = datetime.now()
-        await asyncio.sleep(1)
-        cause = await get_removal_cause(message, timestamp)
+        # Deletions in quick succession are journaled together
+        batch = self.pending_deletes.get(message.channel.id)
+        if batch is not None:
+            batch.append(message)
+            return
+
+        batch = self.pending_deletes[message.channel.id] = [message]
+        timestamp = datetime.utcnow()
+        await asyncio.sleep(DELETE_COALESCE_WINDOW)
+        del self.pending_deletes[message.channel.id]
+
+        if len(batch) == 1:
+            await self.journal_message_delete(message, timestamp)
+        else:
+            await self.journal_bulk_delete(
+                message.channel,
+                batch,
+                [message.id for message in batch],
+                timestamp,
+                bulk=False,
+            )
+
+    async def find_snapshot(self, message_id):
+        """
+        Looks up a message which discord.py no longer has cached,
+        first in the compact message cache, then in the archive.
+        """
+
+        if self.bot.message_cache is not None:
+            archived = self.bot.message_cache.get(message_id)
+            if archived is not None:
+                return archived
+
+        if self.bot.archive is not None:
+            return await self.bot.archive.get(message_id)
+
+        return None
+
+    async def on_raw_message_delete(self, payload):
+        # Cached messages are handled by on_message_delete()
+        if payload.cached_message is not None or payload.guild_id is None:
+            return
+
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+
+        channel = guild.get_channel(payload.channel_id)
+        if channel is None or self.is_blacklisted(guild, channel):
+            return
+
+        archived = await self.find_snapshot(payload.message_id)
+        if archived is None:
+            return
+
+        author = guild.get_member(archived.author_id) or discord.Object(
+            archived.author_id
+        )
+        if self.is_blacklisted(guild, user=author):
+            return
+
+        logger.debug(
+            "Archived message %d by %s (%d) was deleted",
+            archived.id,
+            archived.author,
+            archived.author_id,
+        )
+
+        timestamp = datetime.utcnow()
+        entry = await self.bot.audit_log.wait_for_entry(
+            guild,
+            (AuditLogAction.message_delete,),
+            archived.author_id,
+            since=timestamp,
+            check=lambda entry: entry.extra.channel.id == channel.id,
+        )
+        cause = MessageDeletionReason(
+            message=None,
+            cause=author if entry is None else entry.user,
+            count=1 if entry is None else entry.extra.count,
+            reason=None if entry is None else entry.reason,
+            deleted_at=timestamp,
+            audit_log_entry=entry,
+        )
+
+        content = f"Message {archived.id} by {archived.author} in {channel.mention} was deleted (not cached)"
+        self.journal.send(
+            "message/delete/archived",
+            guild,
+            content,
+            icon="delete",
+            channel=channel,
+            archived=archived,
+            cause=cause,
+        )
+
+    async def on_raw_message_edit(self, payload):
+        if "guild_id" not in payload.data:
+            return
+
+        after = ArchivedMessage.from_data(payload.data)
+        if after is None:
+            return
+
+        # Cached messages are handled by on_message_edit(),
+        # but their compact snapshot still needs updating
+        if payload.cached_message is not None:
+            if self.bot.message_cache is not None:
+                self.bot.message_cache.add(after)
+            return
+
+        before = await self.find_snapshot(after.id)
+        if self.bot.message_cache is not None:
+            self.bot.message_cache.add(after)
+
+        if after.author_id == self.bot.user.id:
+            return
+
+        guild = self.bot.get_guild(after.guild_id)
+        if guild is None:
+            return
+
+        channel = guild.get_channel(after.channel_id)
+        if channel is None or self.is_blacklisted(
+            guild, channel, discord.Object(after.author_id)
+        ):
+            return
+
+        if self.bot.archive is not None:
+            self.bot.archive.add(after)
+
+        if before is None or before.content == after.content:
+            return
+
+        logger.debug(
+            "Archived message %d by %s (%d) was edited",
+            after.id,
+            after.author,
+            after.author_id,
+        )
+
+        content = f"{after.author} edited message {after.id} in {channel.mention} (not cached)"
+        self.journal.send(
+            "message/edit/archived",
+            guild,
+            content,
+            icon="edit",
+            channel=channel,
+            before=before,
+            after=after,
+        )
+
+    async def on_raw_bulk_message_delete(self, payload):
+        if payload.guild_id is None:
+            return
+
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+
+        channel = guild.get_channel(payload.channel_id)
+        if channel is None:
+            return
+
+        blacklist = self.bot.sql.settings.get_tracking_blacklist(guild)
+        if blacklist.blocks(channel.id, None):
+            return
+
+        # Uncached messages are kept, since their authors are unknown
+        messages = []
+        message_ids = set(payload.message_ids)
+        for message in payload.cached_messages:
+            if blacklist.blocks(None, message.author.id):
+                message_ids.discard(message.id)
+            else:
+                messages.append(message)
+
+        # Fill in what we can from the compact message cache
+        snapshots = []
+        if self.bot.message_cache is not None:
+            cached_ids = {message.id for message in messages}
+            for message_id in message_ids - cached_ids:
+                archived = self.bot.message_cache.get(message_id)
+                if archived is None:
+                    continue
+
+                if blacklist.blocks(None, archived.author_id):
+                    message_ids.discard(message_id)
+                else:
+                    snapshots.append(archived)
+
+        if not message_ids:
+            return
+
+        logger.debug(
+            "%d messages were bulk deleted in #%s (%d)",
+            len(message_ids),
+            channel.name,
+            channel.id,
+        )
+
+        await self.journal_bulk_delete(
+            channel,
+            messages,
+            message_ids,
+            datetime.utcnow(),
+            bulk=True,
+            snapshots=snapshots,
+        )
+
+    async def get_bulk_deletion_reason(self, channel, count, timestamp):
+        entry = await self.bot.audit_log.wait_for_entry(
+            channel.guild,
+            (AuditLogAction.message_bulk_delete,),
+            channel.id,
+            since=timestamp,
+        )
+
+        return MessageDeletionReason(
+            message=None,
+            cause=None if entry is None else entry.user,
+            count=count,
+            reason=None if entry is None else entry.reason,
+            deleted_at=timestamp,
+            audit_log_entry=entry,
+        )
+
+    async def get_coalesced_deletion_causes(self, messages, timestamp):
+        """
+        Attributes a run of single deletions per author, since a deletion's
+        audit log entry only covers messages by its target.
+        Returns a dictionary of author ID to MessageDeletionReason.
+        """
+
+        by_author = {}
+        for message in messages:
+            by_author.setdefault(message.author.id, message)
+
+        window = timedelta(seconds=DELETE_COALESCE_WINDOW + 3)
+        reasons = await asyncio.gather(
+            *[
+                self.get_deletion_reason(message, timestamp, window)
+                for message in by_author.values()
+            ]
+        )
+        return dict(zip(by_author, reasons))
+
+    async def journal_message_delete(self, message, timestamp):
+        # Waits for the audit log entry, if there is one
+        cause = await self.get_deletion_reason(message, timestamp)
 
         content = f"Message {message.id} by {user_discrim(message.author)} was deleted"
         self.journal.send(
@@ -323,6 +625,62 @@ class Tracker(AbstractCog):
             embed=self.build_embed(message),
         )
 
+    async def journal_bulk_delete(
+        self, channel, messages, message_ids, timestamp, bulk, snapshots=()
+    ):
+        """
+        Journals a single event for many deleted messages. A bulk deletion is
+        attributed once, a run of single deletions is attributed per author.
+        Snapshots are compact copies of deleted messages discord.py didn't have.
+        """
+
+        count = len(message_ids)
+        if bulk:
+            cause = await self.get_bulk_deletion_reason(channel, count, timestamp)
+            causes = deleters = {}
+        else:
+            causes = await self.get_coalesced_deletion_causes(messages, timestamp)
+            deleters = {reason.cause.id: reason for reason in causes.values()}
+
+            # Only attributed as a whole if every message had the same deleter
+            if len(deleters) == 1:
+                (shared,) = deleters.values()
+                cause = shared._replace(count=count)
+            else:
+                cause = MessageDeletionReason(
+                    message=None,
+                    cause=None,
+                    count=count,
+                    reason=None,
+                    deleted_at=timestamp,
+                    audit_log_entry=None,
+                )
+
+        content = StringBuilder(
+            f"{count} message{plural(count)} in {channel.mention} were deleted"
+        )
+        if cause.cause is not None:
+            content.write(f" by {user_discrim(cause.cause)}")
+        elif deleters:
+            content.write(f" by {len(deleters)} different users")
+        uncached = count - len(messages) - len(snapshots)
+        if uncached:
+            content.write(f" ({uncached} not cached)")
+
+        self.journal.send(
+            "message/delete/bulk",
+            channel.guild,
+            str(content),
+            icon="delete",
+            channel=channel,
+            messages=messages,
+            message_ids=sorted(message_ids),
+            snapshots=snapshots,
+            cause=cause,
+            causes=causes,
+            file=dump_deleted_messages([*messages, *snapshots], message_ids),
+        )
+
     async def on_reaction_add(self, reaction, user):
         if (reaction, user) in self.reactions:
             return
@@ -336,8 +694,7 @@ class Tracker(AbstractCog):
         if message.guild is None or user == self.bot.user:
             return
 
-        blacklist = self.bot.sql.settings.get_tracking_blacklist(message.guild)
-        if blacklist.is_blocked(message.channel) or blacklist.is_blocked(user):
+        if self.is_blacklisted(message.guild, channel, user):
             logger.debug(
                 "Ignoring reaction %s added to message %d by %s (%d) due to "
                 "the channel or user adding the reaction being blacklisted",
@@ -383,8 +740,7 @@ class Tracker(AbstractCog):
         if message.guild is None or user == self.bot.user:
             return
 
-        blacklist = self.bot.sql.settings.get_tracking_blacklist(message.guild)
-        if blacklist.is_blocked(message.channel) or blacklist.is_blocked(user):
+        if self.is_blacklisted(message.guild, channel, user):
             logger.debug(
                 "Ignoring reaction %s removed from message %d by %s (%d) due to "
                 "the channel or user adding the reaction being blacklisted",
@@ -423,8 +779,7 @@ class Tracker(AbstractCog):
         if message.guild is None:
             return
 
-        blacklist = self.bot.sql.settings.get_tracking_blacklist(message.guild)
-        if blacklist.is_blocked(message.channel):
+        if self.is_blacklisted(message.guild, message.channel):
             logger.debug(
                 "Ignoring all reactions from message %d being removed due to the channel being blacklisted",
                 message.id,
@@ -469,8 +824,7 @@ class Tracker(AbstractCog):
         else:
             self.members_joined.append(member)
 
-        blacklist = self.bot.sql.settings.get_tracking_blacklist(member.guild)
-        if blacklist.is_blocked(member):
+        if self.is_blacklisted(member.guild, user=member):
             logger.debug(
                 "Ignoring member %s (%d) joining guild '%s' (%d) due to the user being blacklisted",
                 member.name,
@@ -502,8 +856,7 @@ class Tracker(AbstractCog):
         else:
             self.members_left.append(member)
 
-        blacklist = self.bot.sql.settings.get_tracking_blacklist(member.guild)
-        if blacklist.is_blocked(member):
+        if self.is_blacklisted(member.guild, user=member):
             logger.debug(
                 "Ignoring member %s (%d) leaving guild '%s' (%d) due to the user being blacklisted",
                 member.name,
@@ -521,10 +874,9 @@ class Tracker(AbstractCog):
             member.guild.id,
         )
 
-        # Wait for a bit so we can catch the audit log entry
-        timestamp = datetime.now()
-        await asyncio.sleep(2)
-        cause = await get_removal_cause(member, timestamp)
+        # Waits for the audit log entry, if there is one
+        timestamp = datetime.utcnow()
+        cause = await get_removal_cause(self.bot, member, timestamp)
 
         content = f"Member {member.mention} ({user_discrim(member)}) left"
         self.journal.send(
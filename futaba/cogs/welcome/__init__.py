@@ -10,6 +10,7 @@
 # WITHOUT ANY WARRANTY. See the LICENSE file for more details.
 #
 
+from futaba.pipeline import MEMBER_UPDATE, EventKind
 from .alert import Alert
 from .core import Welcome
 from .prune import Prune
@@ -30,7 +31,9 @@ def setup_alert(bot):
 def setup_welcome(bot):
     cog = Welcome(bot)
     bot.add_listener(cog.member_join, "on_member_join")
-    bot.add_listener(cog.member_update, "on_member_update")
+    bot.pipeline.register(
+        MEMBER_UPDATE, "welcome", cog.member_update, 30, (EventKind.ROLES,)
+    )
     bot.add_listener(cog.member_leave, "on_member_remove")
     bot.add_cog(cog)
 
@@ -26,6 +26,7 @@ from discord.ext import commands
 from futaba import permissions
 from futaba.exceptions import CommandFailed, InvalidCommandContext, SendHelp
 from futaba.journal import ModerationListener
+from futaba.pipeline import MEMBER_UPDATE
 from futaba.utils import plural, user_discrim
 from .role_reapplication import RoleReapplication
 from ..abc import AbstractCog
@@ -99,6 +100,13 @@ class Welcome(AbstractCog):
         for guild in self.bot.guilds:
             self.bot.sql.welcome.get_welcome(guild)
 
+    def cog_unload(self):
+        """
+        Remove pipeline stages when unloading the cog.
+        """
+
+        self.bot.pipeline.unregister(MEMBER_UPDATE, "welcome")
+
     def add_listener(self):
         # Check if a moderation listener is already in place
         router = self.journal.router
@@ -165,14 +173,14 @@ class Welcome(AbstractCog):
             )
             await member.add_roles(roles.guest, reason="New user joined")
 
-    async def member_update(self, before, after):
+    async def member_update(self, update):
         for (member, time) in self.recently_saved_roles:
-            if member == after:
+            if member == update.after:
                 if datetime.now() - time < timedelta(microseconds=50000):
                     return
 
-        self.recently_saved_roles.append((after, datetime.now()))
-        await self.roles.member_update(before, after)
+        self.recently_saved_roles.append((update.after, datetime.now()))
+        await self.roles.member_update(update)
 
     async def member_leave(self, member):
         logger.info(
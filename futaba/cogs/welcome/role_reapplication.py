@@ -59,24 +59,24 @@ class RoleReapplication(AbstractCog):
                         await asyncio.sleep(0.2)
 
     def setup(self):
-        logger.info("Running member role update in background")
-        self.bot.loop.create_task(self.bg_setup())
+        pass
 
-    async def member_update(self, before, after):
-        if before.roles == after.roles:
-            return
+    async def warmup(self):
+        logger.info("Running member role update in background")
+        await self.bg_setup()
 
-        entry = (before, after)
+    async def member_update(self, update):
+        # Called by Welcome, which only passes on role changes
+        entry = (update.before, update.after)
         if entry in self.recent_updates:
             return
         else:
             self.recent_updates.append(entry)
 
-        special_roles = self.bot.sql.settings.get_special_roles(after.guild)
-        if special_roles.guest_role in after.roles:
+        if update.special_roles.guest_role in update.after.roles:
             return
 
-        await self.save_roles(after)
+        await self.save_roles(update.after)
 
     def get_reapply_roles(self, guild):
         logger.debug(
@@ -17,7 +17,7 @@ Loads configuration files from disk
 from collections import namedtuple
 
 import toml
-from schema import Schema, And, Or
+from schema import Schema, And, Or, Optional
 
 from futaba.converters import ID_REGEX
 
@@ -35,6 +35,15 @@ def _check_gtz(type):
     return wrapper
 
 
+# Helper function to check a "host:port" address, or "" if disabled
+def _check_bind(value):
+    if not value:
+        return True
+
+    host, sep, port = value.rpartition(":")
+    return bool(host and sep and port.isdigit() and 0 < int(port) < 65536)
+
+
 ConfigurationSchema = Schema(
     {
         "bot": {
@@ -56,6 +65,38 @@ ConfigurationSchema = Schema(
         },
         "database": {"url": And(str, len)},
         "jwt": {"secret": And(str, len)},
+        Optional("filter"): {
+            Optional("executor"): Or("thread", "process"),
+            Optional("workers"): And(str, _check_gtz(int)),
+            Optional("timeout"): And(str, _check_gtz(float)),
+            Optional("inline-chars"): And(str, _check_gtz(int)),
+            Optional("inline-bytes"): And(str, _check_gtz(int)),
+            Optional("pattern-cache"): str,
+        },
+        Optional("http"): {
+            Optional("max-connections"): And(str, _check_gtz(int)),
+            Optional("max-per-host"): And(str, _check_gtz(int)),
+            Optional("max-concurrent"): And(str, _check_gtz(int)),
+            Optional("dns-cache-ttl"): And(str, _check_gtz(int)),
+        },
+        Optional("monitor"): {
+            Optional("lag-limit"): And(str, _check_gtz(float)),
+            Optional("slow-callback"): And(str, _check_gtz(float)),
+        },
+        Optional("cache"): {
+            Optional("messages"): Or("full", "compact"),
+            Optional("max-bytes"): And(str, _check_gtz(int)),
+        },
+        Optional("archive"): {
+            Optional("path"): str,
+            Optional("retention-days"): And(str, _check_gtz(int)),
+            Optional("batch-size"): And(str, _check_gtz(int)),
+        },
+        Optional("metrics"): {
+            Optional("bind"): And(str, _check_bind),
+            Optional("per-guild"): Or("true", "false"),
+        },
+        Optional("loop"): {Optional("policy"): Or("asyncio", "uvloop")},
     }
 )
 
@@ -75,6 +116,26 @@ Configuration = namedtuple(
         "discord_py_emoji_id",
         "database_url",
         "jwt_secret",
+        "http_max_connections",
+        "http_max_per_host",
+        "http_max_concurrent",
+        "http_dns_cache_ttl",
+        "filter_executor",
+        "filter_workers",
+        "filter_timeout",
+        "filter_inline_chars",
+        "filter_inline_bytes",
+        "filter_pattern_cache",
+        "monitor_lag_limit",
+        "monitor_slow_callback",
+        "message_cache_mode",
+        "message_cache_bytes",
+        "archive_path",
+        "archive_retention_days",
+        "archive_batch_size",
+        "metrics_bind",
+        "metrics_per_guild",
+        "loop_policy",
     ),
 )
 
@@ -84,10 +145,17 @@ def load_config(path):
         config = toml.load(fh)
 
     ConfigurationSchema.validate(config)
+    http = config.get("http", {})
+    filter_conf = config.get("filter", {})
+    monitor = config.get("monitor", {})
+    cache = config.get("cache", {})
+    archive = config.get("archive", {})
+    metrics = config.get("metrics", {})
+    loop = config.get("loop", {})
 
     return Configuration(
         token=config["bot"]["token"],
-        owner_ids=[int(id) for id in config["bot"]["owners"]],
+        owner_ids=frozenset(int(id) for id in config["bot"]["owners"]),
         default_prefix=config["bot"]["prefix"],
         error_channel_id=int(config["bot"]["error-channel-id"]),
         optional_cogs=config["cogs"],
@@ -99,4 +167,24 @@ def load_config(path):
         discord_py_emoji_id=int(config["emojis"]["discordpy"]),
         database_url=config["database"]["url"],
         jwt_secret=config["jwt"]["secret"],
+        http_max_connections=int(http.get("max-connections", "100")),
+        http_max_per_host=int(http.get("max-per-host", "8")),
+        http_max_concurrent=int(http.get("max-concurrent", "32")),
+        http_dns_cache_ttl=int(http.get("dns-cache-ttl", "300")),
+        filter_executor=filter_conf.get("executor", "process"),
+        filter_workers=int(filter_conf.get("workers", "2")),
+        filter_timeout=float(filter_conf.get("timeout", "5")),
+        filter_inline_chars=int(filter_conf.get("inline-chars", "2000")),
+        filter_inline_bytes=int(filter_conf.get("inline-bytes", "65536")),
+        filter_pattern_cache=filter_conf.get("pattern-cache", "filter-patterns.json"),
+        monitor_lag_limit=float(monitor.get("lag-limit", "0.25")),
+        monitor_slow_callback=float(monitor.get("slow-callback", "0.05")),
+        message_cache_mode=cache.get("messages", "full"),
+        message_cache_bytes=int(cache.get("max-bytes", "209715200")),
+        archive_path=archive.get("path", ""),
+        archive_retention_days=int(archive.get("retention-days", "30")),
+        archive_batch_size=int(archive.get("batch-size", "100")),
+        metrics_bind=metrics.get("bind", ""),
+        metrics_per_guild=metrics.get("per-guild", "false") == "true",
+        loop_policy=loop.get("policy", "asyncio"),
     )
@@ -16,6 +16,7 @@ import re
 import discord
 from discord.ext.commands import BadArgument, Converter
 
+from futaba.profiler import profiled
 from futaba.unicode import normalize_caseless
 
 from .utils import DUAL_ID_REGEX, ID_REGEX
@@ -61,6 +62,7 @@ async def get_channel(bot, argument):
 
 
 class TextChannelConv(Converter):
+    @profiled("converter")
     async def convert(self, ctx, argument) -> discord.TextChannel:
         chan = await get_channel(ctx.bot, argument)
         if not isinstance(chan, discord.TextChannel):
@@ -71,6 +73,7 @@ class TextChannelConv(Converter):
 
 
 class GuildChannelConv(Converter):
+    @profiled("converter")
     async def convert(self, ctx, argument) -> discord.abc.GuildChannel:
         chan = await get_channel(ctx.bot, argument)
         if not isinstance(chan, discord.abc.GuildChannel):
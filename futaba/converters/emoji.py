@@ -18,6 +18,7 @@ from typing import Union
 import discord
 from discord.ext.commands import BadArgument, Converter
 
+from futaba.profiler import profiled
 from futaba.unicode import normalize_caseless
 
 from .utils import ID_REGEX
@@ -30,6 +31,7 @@ EMOJI_REGEX = re.compile(r"<:([A-Za-z0-9_\-]+(?:~[0-9]+)?):([0-9]+)>")
 
 
 class EmojiConv(Converter):
+    @profiled("converter")
     async def convert(self, ctx, argument) -> Union[discord.Emoji, str]:
         # Checking if it's not ASCII
         if not any(map(lambda c: ord(c) < 127, argument)):
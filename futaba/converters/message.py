@@ -17,6 +17,7 @@ import re
 import discord
 from discord.ext.commands import BadArgument, Converter
 
+from futaba.profiler import profiled
 from futaba.utils import first
 
 from .utils import DUAL_ID_REGEX, ID_REGEX
@@ -48,7 +49,17 @@ class MessageConv(Converter):
         # Checking if it's an id
         match = ID_REGEX.match(argument)
         if match is not None:
-            return ctx.guild.text_channels, int(match[1])
+            message_id = int(match[1])
+
+            # The compact cache knows which channel it was sent in
+            if ctx.bot.message_cache is not None:
+                archived = ctx.bot.message_cache.get(message_id)
+                if archived is not None:
+                    channel = ctx.guild.get_channel(archived.channel_id)
+                    if channel is not None:
+                        return [channel], message_id
+
+            return ctx.guild.text_channels, message_id
 
         # Checking if it's a jump link
         match = JUMP_LINK_REGEX.match(argument)
@@ -80,6 +91,7 @@ class MessageConv(Converter):
         except discord.NotFound:
             return None
 
+    @profiled("converter")
     async def convert(self, ctx, argument) -> discord.Message:
         if ctx.guild is None:
             raise BadArgument("Refusing to find message because we are not in a guild")
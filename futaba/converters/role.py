@@ -16,6 +16,7 @@ import re
 import discord
 from discord.ext.commands import BadArgument, Converter
 
+from futaba.profiler import profiled
 from futaba.unicode import normalize_caseless
 
 from .utils import ID_REGEX
@@ -28,6 +29,7 @@ ROLE_MENTION_REGEX = re.compile(r"<@&([0-9]+)>")
 
 
 class RoleConv(Converter):
+    @profiled("converter")
     async def convert(self, ctx, argument) -> discord.Role:
         if ctx.guild is None:
             raise BadArgument("Unable to find role because we are not in a guild")
@@ -19,6 +19,7 @@ import textdistance
 import discord
 from discord.ext.commands import BadArgument, Converter
 
+from futaba.profiler import profiled
 from futaba.unicode import normalize_caseless
 
 from .utils import ID_REGEX
@@ -136,6 +137,7 @@ def get_member_if_exists(guild, user):
 
 
 class UserConv(Converter):
+    @profiled("converter")
     async def convert(self, ctx, argument) -> discord.User:
         user_list = tuple(chain(ctx.guild.members, ctx.bot.users))
         user = await get_user(ctx.bot, argument, user_list)
@@ -144,6 +146,7 @@ class UserConv(Converter):
 
 
 class MemberConv(Converter):
+    @profiled("converter")
     async def convert(self, ctx, argument) -> discord.Member:
         user = await get_user(ctx.bot, argument, ctx.guild.members)
         user = get_member_if_exists(ctx.guild, user)
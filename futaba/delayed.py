@@ -21,15 +21,31 @@ import inspect
 import itertools
 import logging
 
+from .metrics import Gauge
+
 logger = logging.getLogger(__name__)
 
 
 class DelayedQueue:
-    __slots__ = ("config", "queue")
+    __slots__ = ("config", "queue", "processed")
 
-    def __init__(self, config):
+    def __init__(self, config, metrics=None):
         self.config = config
         self.queue = asyncio.Queue()
+        self.processed = None
+
+        if metrics is not None:
+            self.processed = metrics.counter(
+                "futaba_delayed_events_total",
+                "Delayed events processed, by outcome",
+                ("outcome",),
+            )
+            metrics.register_callback(
+                Gauge,
+                "futaba_delayed_queue_depth",
+                "Delayed events waiting to be processed",
+                self.queue.qsize,
+            )
 
     def start(self, eventloop):
         eventloop.create_task(self.main_loop())
@@ -43,10 +59,15 @@ class DelayedQueue:
             coro = await self.queue.get()
 
             logger.debug("Got event #%d for processing", i)
+            outcome = "ok"
             try:
                 await coro
             except Exception as error:
                 logger.error("Error awaiting delayed event", exc_info=error)
+                outcome = "error"
+
+            if self.processed is not None:
+                self.processed.inc(labels=(outcome,))
 
             if i % self.config.delay_chunk_size == 0:
                 logger.debug(
@@ -14,6 +14,7 @@
 
 import discord
 
+from futaba.archive import ArchivedMessage
 from futaba.utils import map_or
 
 __all__ = [
@@ -25,6 +26,7 @@ __all__ = [
     "attachment_dict",
     "emoji_dict",
     "message_dict",
+    "archived_message_dict",
     "to_dict",
 ]
 
@@ -136,6 +138,19 @@ def message_dict(message: discord.Message):
     }
 
 
+def archived_message_dict(archived: ArchivedMessage):
+    return {
+        "id": str(archived.id),
+        "author": {"id": str(archived.author_id), "name": archived.author},
+        "content": archived.content,
+        "channel_id": str(archived.channel_id),
+        "guild_id": str(archived.guild_id),
+        "attachments": archived.attachments,
+        "created_at": archived.created_at.isoformat(),
+        "edited_at": map_or(lambda d: d.isoformat(), archived.edited_at),
+    }
+
+
 def to_dict(obj):
     if isinstance(obj, discord.User):
         return user_dict(obj)
@@ -149,6 +164,8 @@ def to_dict(obj):
         return emoji_dict(obj)
     elif isinstance(obj, discord.Message):
         return message_dict(obj)
+    elif isinstance(obj, ArchivedMessage):
+        return archived_message_dict(obj)
     elif isinstance(obj, discord.Embed):
         return obj.to_dict()
     else:
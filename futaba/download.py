@@ -10,16 +10,25 @@
 # WITHOUT ANY WARRANTY. See the LICENSE file for more details.
 #
 
+"""
+A single, long-lived HTTP client shared by everything in the bot that
+needs to fetch foreign files. Connections are pooled and kept alive,
+DNS lookups are cached, and per-host transfer statistics are recorded.
+"""
+
 import asyncio
 import logging
+import time
+from collections import defaultdict
 from io import BytesIO
 from ssl import SSLError
+from urllib.parse import urlparse
 
 import aiohttp
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["MAXIMUM_FILE_SIZE", "download_links", "download_link"]
+__all__ = ["MAXIMUM_FILE_SIZE", "HostStats", "HttpPool"]
 
 # Maximum size to download from foreign sites
 MAXIMUM_FILE_SIZE = 24 * 1024 * 1024
@@ -30,45 +39,141 @@ CHUNK_SIZE = 4 * 1024
 # Prevent connections from hanging for too long
 TIMEOUT = aiohttp.ClientTimeout(total=45, sock_read=5)
 
+# How long idle connections are kept open for reuse
+KEEPALIVE_TIMEOUT = 30
+
+
+class HostStats:
+    """
+    Running transfer statistics for a single remote host.
+    """
+
+    __slots__ = ("requests", "failures", "bytes", "total_time", "max_time")
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.bytes = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed, size):
+        self.requests += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+        if size is None:
+            self.failures += 1
+        else:
+            self.bytes += size
+
+    @property
+    def mean_time(self):
+        if not self.requests:
+            return 0.0
+
+        return self.total_time / self.requests
+
+
+class HttpPool:
+    """
+    Owns the bot's aiohttp session. The session and its connector are created
+    lazily on first use, since they must be bound to the running event loop.
+    """
+
+    __slots__ = (
+        "max_connections",
+        "max_per_host",
+        "max_concurrent",
+        "dns_cache_ttl",
+        "session",
+        "semaphore",
+        "stats",
+    )
+
+    def __init__(self, config):
+        self.max_connections = config.http_max_connections
+        self.max_per_host = config.http_max_per_host
+        self.max_concurrent = config.http_max_concurrent
+        self.dns_cache_ttl = config.http_dns_cache_ttl
+        self.session = None
+        self.semaphore = None
+        self.stats = defaultdict(HostStats)
 
-async def download_links(urls):
-    async with aiohttp.ClientSession(timeout=TIMEOUT, trust_env=True) as session:
-        buffers = await asyncio.gather(*[download(session, url) for url in urls])
-    return buffers
-
-
-async def download_link(url):
-    async with aiohttp.ClientSession(timeout=TIMEOUT, trust_env=True) as session:
-        return await download(session, url)
-
-
-async def download(session, url):
-    binio = BytesIO()
-    try:
-        async with session.get(url) as response:
-            if response.content_length is not None:
-                if response.content_length > MAXIMUM_FILE_SIZE:
-                    logger.info(
-                        "File is reportedly too large (%d bytes > %d bytes)",
-                        response.content_length,
-                        MAXIMUM_FILE_SIZE,
-                    )
-                    return None
-
-            while len(binio.getbuffer()) < MAXIMUM_FILE_SIZE:
-                chunk = await response.content.read(CHUNK_SIZE)
-                if chunk:
-                    binio.write(chunk)
-                else:
-                    return binio
+    def get_session(self):
+        if self.session is None or self.session.closed:
             logger.info(
-                "File was too large, bailing out (max file size: %d bytes)",
-                MAXIMUM_FILE_SIZE,
+                "Creating pooled HTTP session (%d connections, %d per host)",
+                self.max_connections,
+                self.max_per_host,
             )
+
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=TIMEOUT, trust_env=True
+            )
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            logger.info("Closing pooled HTTP session")
+            await self.session.close()
+
+        self.session = None
+        self.semaphore = None
+
+    async def download_links(self, urls):
+        return await asyncio.gather(*[self.download_link(url) for url in urls])
+
+    async def download_link(self, url):
+        session = self.get_session()
+        host = urlparse(url).hostname or ""
+
+        async with self.semaphore:
+            start = time.monotonic()
+            binio = await self._download(session, url)
+            elapsed = time.monotonic() - start
+
+        size = None if binio is None else len(binio.getbuffer())
+        self.stats[host].record(elapsed, size)
+        return binio
+
+    @staticmethod
+    async def _download(session, url):
+        binio = BytesIO()
+        try:
+            async with session.get(url) as response:
+                if response.content_length is not None:
+                    if response.content_length > MAXIMUM_FILE_SIZE:
+                        logger.info(
+                            "File is reportedly too large (%d bytes > %d bytes)",
+                            response.content_length,
+                            MAXIMUM_FILE_SIZE,
+                        )
+                        return None
+
+                while len(binio.getbuffer()) < MAXIMUM_FILE_SIZE:
+                    chunk = await response.content.read(CHUNK_SIZE)
+                    if chunk:
+                        binio.write(chunk)
+                    else:
+                        return binio
+                logger.info(
+                    "File was too large, bailing out (max file size: %d bytes)",
+                    MAXIMUM_FILE_SIZE,
+                )
+                return None
+        except SSLError:
+            # Ignore SSL errors
+            return None
+        except Exception as error:
+            logger.info("Error while downloading %s", url, exc_info=error)
             return None
-    except SSLError:
-        # Ignore SSL errors
-        pass
-    except Exception as error:
-        logger.info("Error while downloading %s for hash check", url, exc_info=error)
-        return None
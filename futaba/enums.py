@@ -12,9 +12,12 @@
 
 from enum import Enum, unique
 
-import dateparser
 import discord
 
+from .lazy import lazy_import
+
+dateparser = lazy_import("dateparser")
+
 
 @unique
 class Reactions(Enum):
@@ -0,0 +1,58 @@
+#
+# event_loop.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Selects the event loop implementation the bot runs on.
+
+uvloop is an optional dependency. If it is selected but can't be imported
+(it isn't installed, or the platform is unsupported), the standard asyncio
+loop is used instead, with a warning.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["LOOP_POLICIES", "loop_policy", "install_loop_policy"]
+
+LOOP_POLICIES = ("asyncio", "uvloop")
+
+
+def loop_policy(name):
+    """
+    Returns the name of the loop actually used and an instance of its policy.
+    """
+
+    if name == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("uvloop is not installed, falling back to asyncio's loop")
+        else:
+            return "uvloop", uvloop.EventLoopPolicy()
+    elif name != "asyncio":
+        raise ValueError(f"Unknown event loop: {name}")
+
+    return "asyncio", asyncio.DefaultEventLoopPolicy()
+
+
+def install_loop_policy(name):
+    """
+    Sets the event loop policy. This must happen before the client is
+    created, as that is when the loop is made. Returns the loop's name.
+    """
+
+    name, policy = loop_policy(name)
+    asyncio.set_event_loop_policy(policy)
+    logger.info("Using the %s event loop", name)
+    return name
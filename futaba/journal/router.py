@@ -12,10 +12,12 @@
 
 import asyncio
 import logging
+import time
 from collections import defaultdict, deque
 from itertools import chain
 from pathlib import PurePath
 
+from ..metrics import Gauge
 from .process import process_content
 
 logger = logging.getLogger(__name__)
@@ -31,7 +33,7 @@ def attrs_match(obj, attrs):
 
 
 class Router:
-    __slots__ = ("bot", "paths", "queue", "history")
+    __slots__ = ("bot", "paths", "queue", "history", "events_metric", "handle_metric")
 
     def __init__(self, bot):
         self.bot = bot
@@ -39,6 +41,22 @@ class Router:
         self.queue = asyncio.Queue()
         self.history = deque(maxlen=1024)
 
+        metrics = bot.metrics
+        self.events_metric = metrics.counter(
+            "futaba_journal_events_total",
+            "Journal events routed, by top-level path",
+            ("root", "guild"),
+        )
+        self.handle_metric = metrics.histogram(
+            "futaba_journal_handle_seconds", "Time spent running journal listeners"
+        )
+        metrics.register_callback(
+            Gauge,
+            "futaba_journal_queue_depth",
+            "Journal events waiting to be routed",
+            self.queue.qsize,
+        )
+
     def start(self, eventloop):
         logger.info("Start journal event processing task")
         eventloop.create_task(self.handle_events())
@@ -74,6 +92,10 @@ class Router:
             content = process_content(event.content, event.attributes)
             logger.debug("Journal content after processing: '%s'", event.content)
 
+            parts = event.path.parts
+            root = parts[1] if len(parts) > 1 else ""
+            self.events_metric.inc(labels=(root, self.bot.metrics.guild(event.guild)))
+
             # Add events for this path
             for path in chain((event.path,), event.path.parents):
                 for listener in self.paths[path]:
@@ -85,10 +107,12 @@ class Router:
                         )
 
             # Run all the event handlers
+            start = time.perf_counter()
             try:
                 await asyncio.gather(*responses)
             except Exception as error:
                 logger.error("Error while running journal handlers", exc_info=error)
+            self.handle_metric.observe(time.perf_counter() - start)
             responses.clear()
 
             # Append to event list
@@ -0,0 +1,59 @@
+#
+# lazy.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Deferred imports for heavy modules which only a command or two need.
+
+"dateparser = lazy_import('dateparser')" binds a stand-in which imports
+the module the first time one of its attributes is used, so its cost is
+paid by that command rather than by every startup.
+"""
+
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["LazyModule", "lazy_import"]
+
+
+class LazyModule:
+    __slots__ = ("_name", "_module")
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            elapsed = time.perf_counter() - start
+            logger.debug("Lazily imported '%s' in %.3fs", self._name, elapsed)
+
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """
+    Returns a proxy for the module, which imports it on first attribute access.
+    """
+
+    return LazyModule(name)
@@ -0,0 +1,137 @@
+#
+# locks.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+A table of asyncio locks by key, such as a message or a member.
+
+Each lock is reference-counted by its holder and waiters, and is removed
+from the table once the last of them is done. So the table only ever holds
+locks which are in use, and a lock can never be dropped while held.
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["KeyedLocks", "LockStats"]
+
+
+class LockStats:
+    __slots__ = ("acquisitions", "contended", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def mean_wait(self):
+        return self.total_wait / self.contended if self.contended else 0.0
+
+    def record(self, waited):
+        self.acquisitions += 1
+        if waited is not None:
+            self.contended += 1
+            self.total_wait += waited
+            if waited > self.max_wait:
+                self.max_wait = waited
+
+
+class _Entry:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class _KeyedLock:
+    __slots__ = ("table", "key", "entry")
+
+    def __init__(self, table, key):
+        self.table = table
+        self.key = key
+        self.entry = None
+
+    async def __aenter__(self):
+        self.entry = entry = self.table._ref(self.key)
+        contended = entry.lock.locked()
+        start = time.perf_counter()
+        try:
+            await entry.lock.acquire()
+        except BaseException:
+            # Cancelled while acquiring, so this never held the lock
+            self.table._unref(self.key, entry)
+            raise
+
+        self.table._acquired(time.perf_counter() - start if contended else None)
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.entry.lock.release()
+        self.table._unref(self.key, self.entry)
+
+
+class KeyedLocks:
+    """
+    Hands out a lock per key, used as "async with locks(key):".
+    """
+
+    __slots__ = ("name", "entries", "stats", "wait_metric")
+
+    def __init__(self, name, metrics=None):
+        self.name = name
+        self.entries = {}
+        self.stats = LockStats()
+        self.wait_metric = None
+
+        if metrics is not None:
+            self.wait_metric = metrics.histogram(
+                "futaba_lock_wait_seconds",
+                "Time spent waiting for a contended keyed lock",
+                ("table",),
+            )
+
+    def __call__(self, key):
+        return _KeyedLock(self, key)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def locked(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry.lock.locked()
+
+    @property
+    def waiters(self):
+        # Every reference to a held lock other than its holder
+        return sum(entry.refs - 1 for entry in self.entries.values())
+
+    def _ref(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = _Entry()
+        entry.refs += 1
+        return entry
+
+    def _unref(self, key, entry):
+        entry.refs -= 1
+        if entry.refs == 0:
+            del self.entries[key]
+
+    def _acquired(self, waited):
+        self.stats.record(waited)
+        if waited is not None and self.wait_metric is not None:
+            self.wait_metric.observe(waited, (self.name,))
@@ -0,0 +1,240 @@
+#
+# loop_monitor.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Watches for work which blocks the event loop.
+
+Lag is sampled continuously, by checking how late a periodic sleep wakes
+up. Separately, listeners, pipeline stages and commands are run through
+watch(), which times each synchronous step of the coroutine, that is the
+time it holds the loop between awaits. Any invocation which held it for
+longer than the threshold in total is recorded under its name.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["LoopMonitor", "SlowCall", "OffenderStats", "callable_name"]
+
+# Seconds between lag samples
+SAMPLE_INTERVAL = 0.5
+
+# Number of lag samples kept, ten minutes' worth
+MAX_SAMPLES = 1200
+
+# Number of recent slow invocations kept
+MAX_SLOW_CALLS = 100
+
+# Minimum seconds between journaled lag warnings
+WARN_COOLDOWN = 60.0
+
+SlowCall = namedtuple("SlowCall", ("kind", "name", "blocked", "elapsed", "when"))
+
+
+def callable_name(func):
+    """
+    Gets a readable name for a listener, like "Tracker.on_message_delete".
+    """
+
+    name = getattr(func, "__qualname__", None)
+    if name is None:
+        return repr(func)
+
+    # Closures such as async_partial() are named "outer.<locals>.inner"
+    return name.replace(".<locals>", "")
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class OffenderStats:
+    __slots__ = ("count", "total_blocked", "max_blocked")
+
+    def __init__(self):
+        self.count = 0
+        self.total_blocked = 0.0
+        self.max_blocked = 0.0
+
+    def record(self, blocked):
+        self.count += 1
+        self.total_blocked += blocked
+        if blocked > self.max_blocked:
+            self.max_blocked = blocked
+
+
+class _Watched:
+    """
+    Drives a coroutine one step at a time, timing each step.
+    """
+
+    __slots__ = ("monitor", "kind", "name", "coro")
+
+    def __init__(self, monitor, kind, name, coro):
+        self.monitor = monitor
+        self.kind = kind
+        self.name = name
+        self.coro = coro
+
+    def __await__(self):
+        coro = self.coro
+        blocked = 0.0
+        started = time.perf_counter()
+        value = None
+        error = None
+
+        try:
+            while True:
+                step = time.perf_counter()
+                try:
+                    if error is None:
+                        future = coro.send(value)
+                    else:
+                        future = coro.throw(error)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    blocked += time.perf_counter() - step
+
+                try:
+                    value = yield future
+                    error = None
+                except BaseException as exc:
+                    value = None
+                    error = exc
+        finally:
+            elapsed = time.perf_counter() - started
+            self.monitor.record(self.kind, self.name, blocked, elapsed)
+
+
+class LoopMonitor:
+    """
+    Samples event loop lag and keeps track of what has been blocking it.
+    """
+
+    __slots__ = (
+        "bot",
+        "lag_limit",
+        "slow_threshold",
+        "samples",
+        "slow_calls",
+        "offenders",
+        "last_warning",
+        "task",
+    )
+
+    def __init__(self, bot, lag_limit, slow_threshold):
+        self.bot = bot
+        self.lag_limit = lag_limit
+        self.slow_threshold = slow_threshold
+        self.samples = deque(maxlen=MAX_SAMPLES)
+        self.slow_calls = deque(maxlen=MAX_SLOW_CALLS)
+        self.offenders = {}
+        self.last_warning = 0.0
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._sample())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def watch(self, kind, name, coro):
+        """
+        Wraps a coroutine so the time it blocks the loop is attributed to the
+        given name. The kind is one of "listener", "stage" or "command".
+        """
+
+        return _Watched(self, kind, name, coro)
+
+    def record(self, kind, name, blocked, elapsed):
+        if blocked < self.slow_threshold:
+            return
+
+        logger.debug(
+            "%s '%s' blocked the event loop for %.3f seconds",
+            kind.capitalize(),
+            name,
+            blocked,
+        )
+        self.slow_calls.append(
+            SlowCall(
+                kind=kind,
+                name=name,
+                blocked=blocked,
+                elapsed=elapsed,
+                when=datetime.utcnow(),
+            )
+        )
+
+        stats = self.offenders.get((kind, name))
+        if stats is None:
+            stats = self.offenders[(kind, name)] = OffenderStats()
+        stats.record(blocked)
+
+    def percentiles(self, fractions=(0.5, 0.9, 0.99)):
+        """
+        Returns the lag at each of the given fractions, over the recent samples.
+        """
+
+        if not self.samples:
+            return [0.0 for _ in fractions]
+
+        samples = sorted(self.samples)
+        return [_percentile(samples, fraction) for fraction in fractions]
+
+    def worst_offenders(self, count=10):
+        """
+        Returns the ((kind, name), OffenderStats) pairs that blocked the longest.
+        """
+
+        items = sorted(
+            self.offenders.items(), key=lambda item: item[1].max_blocked, reverse=True,
+        )
+        return items[:count]
+
+    async def _sample(self):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            expected = loop.time() + SAMPLE_INTERVAL
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+
+            if lag >= self.lag_limit:
+                self._warn(lag, loop.time())
+
+    def _warn(self, lag, now):
+        if now - self.last_warning < WARN_COOLDOWN:
+            return
+
+        self.last_warning = now
+
+        # Whatever blocked the loop was most likely recorded just now
+        recent = self.slow_calls[-1] if self.slow_calls else None
+        content = f"Event loop was blocked for {lag * 1000:.0f} ms"
+        if recent is not None:
+            content += f", most recently by {recent.kind} `{recent.name}`"
+
+        logger.warning(content)
+        if self.bot.journal_cog is not None:
+            journal = self.bot.get_broadcaster("/debug")
+            journal.send("loop", None, content, icon="warning", lag=lag, recent=recent)
@@ -10,49 +10,208 @@
 # WITHOUT ANY WARRANTY. See the LICENSE file for more details.
 #
 
+"""
+A least-recently used cache, bounded by entry count and/or total weight,
+with optional expiry and an async single-flight get_or_compute().
+"""
+
+import asyncio
+import time
 from collections import OrderedDict
 from collections.abc import MutableMapping
 
+__all__ = ["LruCache"]
+
+_MISSING = object()
+
 
 class LruCache(MutableMapping):
-    def __init__(self, max_size=None):
+    """
+    A mapping which evicts its least recently used entries once it holds more
+    than max_size of them, or their weights (from weigher(value)) add up to
+    more than max_weight. Either limit may be None.
+
+    If ttl is set, entries expire that many seconds after being stored.
+    Expired entries are treated as missing, and are dropped when looked up
+    or by expire(). Lookups and evictions are counted in the stats attributes.
+    """
+
+    __slots__ = (
+        "store",
+        "max_size",
+        "max_weight",
+        "weigher",
+        "weights",
+        "weight",
+        "ttl",
+        "expiries",
+        "pending",
+        "hits",
+        "misses",
+        "evictions",
+        "expirations",
+    )
+
+    def __init__(self, max_size=None, ttl=None, weigher=None, max_weight=None):
         self.store = OrderedDict()
         self.max_size = max_size
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weights = {} if weigher is not None else None
+        self.weight = 0
+        self.ttl = ttl
+        self.expiries = {}
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key):
+        value = self.store.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return _MISSING
+
+        if self.expiries:
+            expires_at = self.expiries.get(key)
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._discard(key)
+                self.expirations += 1
+                self.misses += 1
+                return _MISSING
+
+        self.store.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _discard(self, key):
+        value = self.store.pop(key)
+        self.expiries.pop(key, None)
+        if self.weights is not None:
+            self.weight -= self.weights.pop(key)
+        return value
+
+    def _evict(self):
+        while self.store and (
+            (self.max_size is not None and len(self.store) > self.max_size)
+            or (self.max_weight is not None and self.weight > self.max_weight)
+        ):
+            key = next(iter(self.store))
+            self._discard(key)
+            self.evictions += 1
 
     def __getitem__(self, key):
-        obj = self.store.pop(key)
-        self.store[key] = obj
-        return obj
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
 
     def get(self, key, default=None):
-        try:
-            return self[key]
-        except KeyError:
-            if callable(default):
-                return default()
-            else:
-                return default
+        value = self._lookup(key)
+        if value is _MISSING:
+            return default() if callable(default) else default
+        return value
 
     def get_or_put(self, key, default):
-        try:
-            return self[key]
-        except KeyError:
-            item = default() if callable(default) else default
-            self[key] = item
-            return item
+        value = self._lookup(key)
+        if value is _MISSING:
+            value = default() if callable(default) else default
+            self[key] = value
+        return value
+
+    def put(self, key, value, ttl=None):
+        """
+        Stores a value, expiring after ttl seconds if given, else the cache's ttl.
+        """
+
+        if key in self.store:
+            self._discard(key)
 
-    def __setitem__(self, key, value):
-        self.store.pop(key, None)
         self.store[key] = value
 
-        while len(self) > self.max_size:
-            self.store.popitem(last=False)
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None:
+            self.expiries[key] = time.monotonic() + ttl
+
+        if self.weights is not None:
+            weight = self.weigher(value)
+            self.weights[key] = weight
+            self.weight += weight
+
+        self._evict()
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
 
     def __delitem__(self, key):
-        del self.store[key]
+        self._discard(key)
+
+    def pop(self, key, default=_MISSING):
+        if key in self.store:
+            return self._discard(key)
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def clear(self):
+        self.store.clear()
+        self.expiries.clear()
+        if self.weights is not None:
+            self.weights.clear()
+        self.weight = 0
+
+    def expire(self):
+        """
+        Drops every entry which has expired.
+        """
+
+        now = time.monotonic()
+        expired = [key for key, when in self.expiries.items() if when <= now]
+        for key in expired:
+            self._discard(key)
+        self.expirations += len(expired)
+
+    async def get_or_compute(self, key, compute):
+        """
+        Returns the cached value, or awaits compute() to produce and store it.
+        Concurrent calls for a key which is being computed wait for that
+        result, instead of computing it again. If it raises, they all do.
+        """
+
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        future = self.pending.get(key)
+        if future is not None:
+            # Shielded, so one waiter being cancelled doesn't cancel the rest
+            return await asyncio.shield(future)
+
+        future = self.pending[key] = asyncio.get_event_loop().create_future()
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            # Only waiters need to see it, so don't warn if there are none
+            future.exception()
+            raise
+        else:
+            self[key] = value
+            future.set_result(value)
+            return value
+        finally:
+            del self.pending[key]
 
     def __contains__(self, key):
-        return key in self.store
+        if key not in self.store:
+            return False
+
+        expires_at = self.expiries.get(key)
+        return expires_at is None or expires_at > time.monotonic()
 
     def __iter__(self):
         return iter(self.store)
@@ -0,0 +1,68 @@
+#
+# message_cache.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Memory-bounded cache of minimal message snapshots, used in place of
+discord.py's cache of full message objects when "compact" mode is set.
+"""
+
+import logging
+import sys
+
+from .lru import LruCache
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["CompactMessageCache", "snapshot_size"]
+
+# Approximate size of a snapshot without its strings: the tuple,
+# its integers and the attachment list, plus the dictionary slot
+SNAPSHOT_OVERHEAD = 400
+
+
+def snapshot_size(archived):
+    """
+    Estimates how many bytes a snapshot takes up in memory.
+    """
+
+    size = SNAPSHOT_OVERHEAD
+    size += sys.getsizeof(archived.content) + sys.getsizeof(archived.author)
+    for url in archived.attachments:
+        size += sys.getsizeof(url)
+    return size
+
+
+class CompactMessageCache(LruCache):
+    """
+    Holds ArchivedMessage snapshots by message ID, evicting the
+    least recently used ones once the byte budget is exceeded.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, max_bytes):
+        super().__init__(weigher=snapshot_size, max_weight=max_bytes)
+
+    @property
+    def max_bytes(self):
+        return self.max_weight
+
+    @property
+    def bytes_used(self):
+        return self.weight
+
+    def add(self, archived):
+        """
+        Stores a snapshot, replacing any earlier one of the same message.
+        """
+
+        self[archived.id] = archived
@@ -0,0 +1,260 @@
+#
+# metrics.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+A small registry of counters, gauges and histograms describing the bot's
+internals, and a local HTTP server exporting them in the Prometheus text format.
+"""
+
+import logging
+from bisect import bisect_left
+
+from aiohttp import web
+
+from .str_builder import StringBuilder
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Counter", "Gauge", "Histogram", "MetricsRegistry", "MetricsServer"]
+
+# Upper bounds of the default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [
+        f'{name}="{_escape(value)}"'
+        for name, value in zip(names, values)
+        # Empty labels are left out, such as an unused guild label
+        if value != ""
+    ]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    __slots__ = ("name", "help", "labelnames", "values", "func")
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), func=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.func = func
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} takes labels {self.labelnames}")
+        return tuple(str(value) for value in labels)
+
+    def samples(self):
+        if self.func is not None:
+            yield self.name, (), self.func()
+            return
+
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+    def render(self, output):
+        output.writeln(f"# HELP {self.name} {self.help}")
+        output.writeln(f"# TYPE {self.name} {self.kind}")
+        for name, labels, value in self.samples():
+            labels = _format_labels(self.labelnames, labels)
+            output.writeln(f"{name}{labels} {_format_value(value)}")
+
+
+class Counter(_Metric):
+    """
+    A value which only goes up. If func is given, it is read on each
+    scrape instead, for counters which are already kept elsewhere.
+    """
+
+    __slots__ = ()
+
+    kind = "counter"
+
+    def inc(self, amount=1, labels=()):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    A value which can go up and down. If func is given, it is read on each scrape.
+    """
+
+    __slots__ = ()
+
+    kind = "gauge"
+
+    def set(self, value, labels=()):
+        self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """
+    Counts observations into cumulative buckets, along with their sum and count.
+    """
+
+    __slots__ = ("buckets",)
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, labels=()):
+        key = self._key(labels)
+        counts = self.values.get(key)
+        if counts is None:
+            # Bucket counts, then the sum of all values
+            counts = self.values[key] = [0] * len(self.buckets) + [0.0]
+
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def summary(self, labels=()):
+        """
+        Returns the number of observations and their sum.
+        """
+
+        counts = self.values.get(self._key(labels))
+        if counts is None:
+            return 0, 0.0
+        return sum(counts[:-1]), counts[-1]
+
+    def render(self, output):
+        output.writeln(f"# HELP {self.name} {self.help}")
+        output.writeln(f"# TYPE {self.name} {self.kind}")
+        for labels, counts in self.values.items():
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                label_str = _format_labels(
+                    self.labelnames, labels, (("le", _format_value(bound)),)
+                )
+                output.writeln(f"{self.name}_bucket{label_str} {total}")
+
+            label_str = _format_labels(self.labelnames, labels)
+            output.writeln(f"{self.name}_sum{label_str} {_format_value(counts[-1])}")
+            output.writeln(f"{self.name}_count{label_str} {total}")
+
+
+class MetricsRegistry:
+    """
+    Holds every metric by name. Requesting a metric which already
+    exists returns it, so modules can declare the metrics they use.
+    """
+
+    __slots__ = ("metrics", "per_guild")
+
+    def __init__(self, per_guild=False):
+        self.metrics = {}
+        self.per_guild = per_guild
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+        elif not isinstance(metric, cls):
+            raise TypeError(f"Metric {name} is already a {metric.kind}")
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_callback(self, cls, name, help, func):
+        """
+        Adds a counter or gauge whose value is read from func on each scrape.
+        This replaces any existing metric of the same name, such as one
+        registered by a previous instance of a cog.
+        """
+
+        self.metrics[name] = cls(name, help, func=func)
+
+    def remove(self, name):
+        self.metrics.pop(name, None)
+
+    def guild(self, guild):
+        """
+        Gets the value of a "guild" label. It is empty, and so left
+        out of the export, unless per-guild labels are enabled.
+        """
+
+        if not self.per_guild or guild is None:
+            return ""
+        return str(guild.id)
+
+    def render(self):
+        output = StringBuilder()
+        for name in sorted(self.metrics):
+            try:
+                self.metrics[name].render(output)
+            except Exception as error:
+                logger.error("Unable to render metric %s", name, exc_info=error)
+        return str(output)
+
+
+class MetricsServer:
+    """
+    Serves the registry on /metrics from a local aiohttp server.
+    """
+
+    __slots__ = ("registry", "host", "port", "runner")
+
+    def __init__(self, registry, host, port):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def handle_metrics(self, request):
+        return web.Response(
+            text=self.registry.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def start(self):
+        if self.runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        logger.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
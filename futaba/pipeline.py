@@ -0,0 +1,239 @@
+#
+# pipeline.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Runs the handlers of frequent gateway events as ordered stages.
+
+Rather than each cog registering its own listener and re-inspecting the
+event, the bot inspects it once into a context object (what changed, the
+role delta, the guild's special roles) and passes that to every stage.
+Stages can declare which kinds of event they care about, and are skipped
+for the rest.
+
+Stages run concurrently, so a slow one (such as downloading attachments)
+doesn't hold up the others. A stage which needs another's result names it
+in 'after', and starts once that stage has finished.
+"""
+
+import asyncio
+import logging
+import time
+from collections import namedtuple
+from enum import Enum, unique
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "EventKind",
+    "Stage",
+    "StageTiming",
+    "MemberUpdate",
+    "NewMessage",
+    "EventPipeline",
+    "MEMBER_UPDATE",
+    "MESSAGE",
+]
+
+MEMBER_UPDATE = "member_update"
+MESSAGE = "message"
+
+
+@unique
+class EventKind(Enum):
+    # Member updates
+    ROLES = "roles"
+    NAME = "name"
+    NICK = "nick"
+    AVATAR = "avatar"
+
+    # New messages
+    GUILD = "guild"
+    PRIVATE = "private"
+    OWN = "own"
+
+
+Stage = namedtuple("Stage", ("name", "order", "callback", "kinds", "after"))
+
+
+class StageTiming:
+    __slots__ = ("calls", "skips", "total", "max")
+
+    def __init__(self):
+        self.calls = 0
+        self.skips = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self):
+        return self.total / self.calls if self.calls else 0.0
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+
+class MemberUpdate:
+    """
+    The shared context of one member update event.
+    """
+
+    __slots__ = (
+        "bot",
+        "before",
+        "after",
+        "guild",
+        "kinds",
+        "roles_added",
+        "roles_removed",
+        "_special_roles",
+    )
+
+    def __init__(self, bot, before, after):
+        self.bot = bot
+        self.before = before
+        self.after = after
+        self.guild = after.guild
+
+        before_roles = frozenset(before.roles)
+        after_roles = frozenset(after.roles)
+        self.roles_added = after_roles - before_roles
+        self.roles_removed = before_roles - after_roles
+
+        kinds = set()
+        if self.roles_added or self.roles_removed:
+            kinds.add(EventKind.ROLES)
+        if before.name != after.name:
+            kinds.add(EventKind.NAME)
+        if before.nick != after.nick:
+            kinds.add(EventKind.NICK)
+        if before.avatar != after.avatar:
+            kinds.add(EventKind.AVATAR)
+        self.kinds = frozenset(kinds)
+
+        self._special_roles = None
+
+    @property
+    def roles_changed(self):
+        return self.roles_added | self.roles_removed
+
+    @property
+    def special_roles(self):
+        """
+        The guild's special roles, fetched once for all stages.
+        """
+
+        if self._special_roles is None:
+            self._special_roles = self.bot.sql.settings.get_special_roles(self.guild)
+        return self._special_roles
+
+
+class NewMessage:
+    """
+    The shared context of one new message event.
+    """
+
+    __slots__ = ("bot", "message", "guild", "kinds")
+
+    def __init__(self, bot, message):
+        self.bot = bot
+        self.message = message
+        self.guild = message.guild
+
+        kinds = {EventKind.PRIVATE if message.guild is None else EventKind.GUILD}
+        if message.author == bot.user:
+            kinds.add(EventKind.OWN)
+        self.kinds = frozenset(kinds)
+
+
+class EventPipeline:
+    """
+    Holds the stages registered for each event, and runs them.
+    A stage which raises is logged, and doesn't stop the others.
+    """
+
+    __slots__ = ("bot", "stages", "timings")
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.stages = {MEMBER_UPDATE: [], MESSAGE: []}
+        self.timings = {}
+
+    def register(self, event, name, callback, order, kinds=None, after=()):
+        """
+        Adds a stage, replacing any stage of the same name. Stages are started
+        by ascending order. If kinds is given, the stage only runs for events
+        which have at least one of those kinds. If after is given, the stage
+        waits for those stages (of a lower order) to finish first.
+        """
+
+        logger.debug("Registering %s stage '%s' (order %d)", event, name, order)
+        stages = [stage for stage in self.stages[event] if stage.name != name]
+        stages.append(
+            Stage(
+                name=name,
+                order=order,
+                callback=callback,
+                kinds=None if kinds is None else frozenset(kinds),
+                after=tuple(after),
+            )
+        )
+        stages.sort(key=lambda stage: stage.order)
+        self.stages[event] = stages
+        self.timings.setdefault((event, name), StageTiming())
+
+    def unregister(self, event, name):
+        logger.debug("Removing %s stage '%s'", event, name)
+        self.stages[event] = [
+            stage for stage in self.stages[event] if stage.name != name
+        ]
+
+    async def run_stage(self, event, stage, context, waits):
+        # Errors are logged here, so stages waiting on this one still run
+        if waits:
+            await asyncio.wait(waits)
+
+        timing = self.timings[(event, stage.name)]
+        start = time.perf_counter()
+        try:
+            await self.bot.loop_monitor.watch(
+                "stage", f"{event}/{stage.name}", stage.callback(context)
+            )
+        except Exception as error:
+            logger.error("Error in %s stage '%s'", event, stage.name, exc_info=error)
+        finally:
+            timing.record(time.perf_counter() - start)
+
+    async def dispatch(self, event, context):
+        # Stage lists are replaced rather than mutated, so this is safe to iterate
+        tasks = {}
+        for stage in self.stages[event]:
+            if stage.kinds is not None and stage.kinds.isdisjoint(context.kinds):
+                self.timings[(event, stage.name)].skips += 1
+                continue
+
+            # Stages which were skipped or aren't registered aren't waited for
+            waits = [tasks[name] for name in stage.after if name in tasks]
+            tasks[stage.name] = asyncio.ensure_future(
+                self.run_stage(event, stage, context, waits)
+            )
+
+        if tasks:
+            await asyncio.gather(*tasks.values())
+
+    async def on_member_update(self, before, after):
+        await self.dispatch(MEMBER_UPDATE, MemberUpdate(self.bot, before, after))
+
+    async def on_message(self, message):
+        await self.dispatch(MESSAGE, NewMessage(self.bot, message))
@@ -0,0 +1,83 @@
+#
+# profiler.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Breaks down where the time of a command invocation goes.
+
+Bot.invoke() starts a CommandProfile in a context variable, so only code
+running as part of that command (and tasks it spawns) sees it. Converters,
+SQL statements and Discord API requests time themselves with section(),
+which is a no-op outside of a command. Phases can overlap, for instance
+a converter which fetches a message also counts as API time.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["PHASES", "CommandProfile", "current_profile", "section", "profiled"]
+
+PHASES = ("converter", "sql", "api")
+
+current_profile = ContextVar("current_profile", default=None)
+
+
+class CommandProfile:
+    __slots__ = ("command", "phases", "closed")
+
+    def __init__(self, command):
+        self.command = command
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.closed = False
+
+    def add(self, phase, elapsed):
+        # Tasks spawned by the command can outlive it
+        if not self.closed:
+            self.phases[phase] += elapsed
+
+
+@contextmanager
+def section(phase):
+    """
+    Adds the time spent in the block to the current command's profile, if any.
+    """
+
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(phase, time.perf_counter() - start)
+
+
+def profiled(phase):
+    """
+    Decorator for coroutine functions, timing each call as a section().
+    """
+
+    def decorator(coro):
+        @wraps(coro)
+        async def wrapped(*args, **kwargs):
+            with section(phase):
+                return await coro(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
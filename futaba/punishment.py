@@ -40,53 +40,55 @@ class PunishmentHandler:
         return role
 
     async def apply(self, name, guild, member, reason):
-        role = self.get_role(name, guild)
-        if role is None:
-            return
+        async with self.bot.member_lock(member):
+            role = self.get_role(name, guild)
+            if role is None:
+                return
 
-        if member.top_role > guild.me.top_role:
-            logger.warning(
-                "Lacks permission to %s user '%s' (%d) in guild '%s' (%d)",
-                name,
-                member.name,
-                member.id,
-                guild.name,
-                guild.id,
-            )
-            return
+            if member.top_role > guild.me.top_role:
+                logger.warning(
+                    "Lacks permission to %s user '%s' (%d) in guild '%s' (%d)",
+                    name,
+                    member.name,
+                    member.id,
+                    guild.name,
+                    guild.id,
+                )
+                return
 
-        remove_other = self.bot.sql.settings.get_remove_other_roles(guild)
-        if remove_other:
-            await self.bot.sql.moderation.remove_other_roles(member, role, reason)
-        else:
-            await member.add_roles(role, reason=reason)
+            remove_other = self.bot.sql.settings.get_remove_other_roles(guild)
+            if remove_other:
+                await self.bot.sql.moderation.remove_other_roles(member, role, reason)
+            else:
+                await member.add_roles(role, reason=reason)
 
     async def relieve(self, name, guild, member, reason):
-        role = self.get_role(name, guild)
-        if role is None:
-            return
+        async with self.bot.member_lock(member):
+            role = self.get_role(name, guild)
+            if role is None:
+                return
 
-        if member.top_role > guild.me.top_role:
-            logger.warning(
-                "Lacks permission to %s user '%s' (%d) in guild '%s' (%d)",
-                name,
-                member.name,
-                member.id,
-                guild.name,
-                guild.id,
-            )
-            return
-
-        remove_other = self.bot.sql.settings.get_remove_other_roles(guild)
-        if remove_other:
-            try:
-                await self.bot.sql.moderation.restore_other_roles(member, reason)
-            except KeyError as error:
+            if member.top_role > guild.me.top_role:
                 logger.warning(
-                    "Received KeyError while restoring other roles: %s", error
+                    "Lacks permission to %s user '%s' (%d) in guild '%s' (%d)",
+                    name,
+                    member.name,
+                    member.id,
+                    guild.name,
+                    guild.id,
                 )
-
-        await member.remove_roles(role, reason=reason)
+                return
+
+            remove_other = self.bot.sql.settings.get_remove_other_roles(guild)
+            if remove_other:
+                try:
+                    await self.bot.sql.moderation.restore_other_roles(member, reason)
+                except KeyError as error:
+                    logger.warning(
+                        "Received KeyError while restoring other roles: %s", error
+                    )
+
+            await member.remove_roles(role, reason=reason)
 
     async def mute(self, guild, member, reason=None):
         logger.info(
@@ -0,0 +1,153 @@
+#
+# reaction_state.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Tracks the status reactions the bot has put on command messages.
+
+A command starts out with no reactions, and the "waiting" reaction is only
+scheduled, so a command which finishes quickly never has it added. When
+the command finishes, only the difference between what was added and what
+should be shown is applied. Usually that is just adding the result.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+
+import discord
+
+from .enums import Reactions
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["BoundedSet", "ReactionTracker"]
+
+# Seconds before a running command gets the waiting reaction
+WAITING_DELAY = 0.5
+
+# Number of finished command messages remembered
+MAX_COMPLETED = 100
+
+
+class BoundedSet:
+    """
+    A set which forgets its oldest members past the given size.
+    """
+
+    __slots__ = ("items", "max_size")
+
+    def __init__(self, max_size):
+        self.items = OrderedDict()
+        self.max_size = max_size
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        self.items[item] = None
+        self.items.move_to_end(item)
+
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+
+class _MessageState:
+    __slots__ = ("added", "timer", "pending")
+
+    def __init__(self):
+        self.added = set()
+        self.timer = None
+        self.pending = None
+
+
+class ReactionTracker:
+    __slots__ = ("bot", "states", "completed", "requests")
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.states = {}
+        self.completed = BoundedSet(MAX_COMPLETED)
+        self.requests = bot.metrics.counter(
+            "futaba_reaction_requests_total",
+            "Status reaction requests sent for commands",
+            ("action",),
+        )
+
+    def start(self, message):
+        """
+        Schedules the waiting reaction for a command which has started.
+        """
+
+        if message.id in self.completed or message.id in self.states:
+            return
+
+        state = _MessageState()
+        state.timer = self.bot.loop.call_later(
+            WAITING_DELAY, self._waiting, message, state
+        )
+        self.states[message.id] = state
+
+    def _waiting(self, message, state):
+        state.timer = None
+        state.pending = asyncio.ensure_future(
+            self._add(message, state, Reactions.WAITING)
+        )
+
+    async def _add(self, message, state, reaction):
+        # Recorded first, in case the command finishes during the request
+        state.added.add(reaction)
+        self.requests.inc(labels=("add",))
+        await reaction.add(message)
+
+    async def _remove(self, message, reaction):
+        self.requests.inc(labels=("remove",))
+        try:
+            await message.remove_reaction(reaction.value, self.bot.user)
+        except discord.NotFound:
+            # Message was deleted
+            pass
+
+    async def finish(self, message, *reactions):
+        """
+        Marks the command as finished, so that its message shows
+        only the given reactions out of the ones the bot added.
+        """
+
+        self.completed.add(message.id)
+        state = self.states.pop(message.id, None)
+        added = set()
+
+        if state is not None:
+            if state.timer is not None:
+                state.timer.cancel()
+
+            if state.pending is not None:
+                try:
+                    await state.pending
+                except discord.HTTPException as error:
+                    logger.debug("Unable to add waiting reaction", exc_info=error)
+
+            added = state.added
+
+        stale = added.difference(reactions)
+        if stale:
+            await asyncio.gather(
+                *[self._remove(message, reaction) for reaction in stale]
+            )
+
+        for reaction in reactions:
+            if reaction not in added:
+                self.requests.inc(labels=("add",))
+                await reaction.add(message)
@@ -12,12 +12,13 @@
 
 
 class FilterSettingsData:
-    __slots__ = ("bot_immune", "manage_messages_immune", "reupload")
+    __slots__ = ("bot_immune", "manage_messages_immune", "reupload", "fail_closed")
 
     def __init__(self):
         self.bot_immune = False
         self.manage_messages_immune = True
         self.reupload = True
+        self.fail_closed = False
 
     def updated(self, field, value=None):
         """
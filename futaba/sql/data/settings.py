@@ -106,7 +106,12 @@ class SpecialRoleData:
 
 
 class TrackingBlacklistData:
-    __slots__ = ("guild", "blacklisted_channels", "blacklisted_users")
+    """
+    The compiled tracking blacklist for a guild. The sets are frozen,
+    changes to the blacklist replace this object rather than mutate it.
+    """
+
+    __slots__ = ("guild", "blacklisted_channels", "blacklisted_users", "blocked_ids")
 
     def __init__(self, guild, blacklist):
         # blacklist is an iterable of (type, data_id)
@@ -118,24 +123,21 @@ class TrackingBlacklistData:
             lambda block: block[1],
         )
 
-        self.blacklisted_channels, self.blacklisted_users = (
-            set(blacklisted_channels),
-            set(blacklisted_users),
-        )
+        self.blacklisted_channels = frozenset(blacklisted_channels)
+        self.blacklisted_users = frozenset(blacklisted_users)
+
+        # Snowflakes are unique across object types, so both can share one set
+        self.blocked_ids = self.blacklisted_channels | self.blacklisted_users
 
     def is_blocked(self, user_or_channel):
         if isinstance(user_or_channel, discord.abc.User):
             return user_or_channel.id in self.blacklisted_users
         return user_or_channel.id in self.blacklisted_channels
 
-    def add_block(self, user_or_channel):
-        if isinstance(user_or_channel, discord.abc.User):
-            self.blacklisted_users.add(user_or_channel.id)
-        else:
-            self.blacklisted_channels.add(user_or_channel.id)
+    def blocks(self, channel_id, user_id):
+        """
+        Checks whether an event in the given channel by the given user
+        should be ignored. Either ID may be None.
+        """
 
-    def remove_block(self, user_or_channel):
-        if isinstance(user_or_channel, discord.abc.User):
-            self.blacklisted_users.discard(user_or_channel.id)
-        else:
-            self.blacklisted_channels.discard(user_or_channel.id)
+        return not self.blocked_ids.isdisjoint((channel_id, user_id))
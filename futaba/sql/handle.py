@@ -15,9 +15,12 @@ Module for abstractly interfacing with the RDBMS.
 """
 
 import logging
+import time
 
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, inspect, MetaData
+from sqlalchemy.schema import CreateColumn
 
+from ..profiler import section
 from .models import (
     AliasHistoryModel,
     FilterModel,
@@ -42,6 +45,7 @@ class SqlHandler:
         "conn",
         "trans",
         "max_delete_messages",
+        "query_time",
         "alias",
         "filter",
         "guilds",
@@ -53,8 +57,16 @@ class SqlHandler:
         "welcome",
     )
 
-    def __init__(self, db_path: str, max_delete_messages=500):
+    def __init__(self, db_path: str, max_delete_messages=500, metrics=None):
         self.max_delete_messages = max_delete_messages
+        self.query_time = None
+        if metrics is not None:
+            self.query_time = metrics.histogram(
+                "futaba_sql_query_seconds",
+                "Time spent running database statements",
+                ("operation",),
+            )
+
         self.db = create_engine(db_path)
         self.conn = self.db.connect()
         self.trans = None
@@ -72,13 +84,58 @@ class SqlHandler:
         self.welcome = WelcomeModel(self, meta)
 
         meta.create_all(self.db)
+        self.add_missing_columns(meta)
         logger.info("Created all tables.")
 
+    def add_missing_columns(self, meta):
+        """
+        create_all() doesn't alter tables which already exist, so columns
+        added to a model since the table was made are added here. Such
+        columns need a server default, to fill in existing rows.
+        """
+
+        inspector = inspect(self.db)
+        preparer = self.db.dialect.identifier_preparer
+
+        for table in meta.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                if not column.nullable and column.server_default is None:
+                    logger.error(
+                        "Column '%s' is missing from table '%s', but has no default "
+                        "to fill in existing rows, so it must be added by hand",
+                        column.name,
+                        table.name,
+                    )
+                    continue
+
+                logger.info(
+                    "Adding column '%s' to existing table '%s'", column.name, table.name
+                )
+                definition = CreateColumn(column).compile(dialect=self.db.dialect)
+                self.conn.execute(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}"
+                )
+
     def __del__(self):
         self.conn.close()
 
-    def execute(self, *args, **kwargs):
-        return self.conn.execute(*args, **kwargs)
+    def execute(self, statement, *args, **kwargs):
+        if self.query_time is None:
+            with section("sql"):
+                return self.conn.execute(statement, *args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            with section("sql"):
+                return self.conn.execute(statement, *args, **kwargs)
+        finally:
+            # Such as "select", "insert" or "update"
+            operation = getattr(statement, "__visit_name__", "text")
+            self.query_time.observe(time.perf_counter() - start, (operation,))
 
     def transaction(self, trans_logger=logger):
         if self.trans is None:
@@ -22,7 +22,8 @@ import logging
 from collections import defaultdict
 
 from sqlalchemy import and_
-from sqlalchemy import BigInteger, Boolean, Column, Enum, LargeBinary, Table, Unicode
+from sqlalchemy import BigInteger, Boolean, Column, Enum, Integer, LargeBinary
+from sqlalchemy import Table, Unicode
 from sqlalchemy import CheckConstraint, ForeignKey, UniqueConstraint
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import select
@@ -45,10 +46,12 @@ class FilterModel:
         "sql",
         "tb_filters",
         "tb_content_filters",
+        "tb_perceptual_filters",
         "tb_filter_immune_users",
         "tb_filter_settings",
         "filter_cache",
         "content_filter_cache",
+        "perceptual_filter_cache",
         "immune_users_cache",
         "settings_cache",
     )
@@ -76,6 +79,16 @@ class FilterModel:
             Column("description", Unicode),
             UniqueConstraint("guild_id", "hashsum", name="content_filter_uq"),
         )
+        self.tb_perceptual_filters = Table(
+            "perceptual_filters",
+            meta,
+            Column("guild_id", BigInteger, ForeignKey("guilds.guild_id")),
+            Column("filter_type", Enum(FilterType)),
+            Column("phash", LargeBinary),
+            Column("threshold", Integer),
+            Column("description", Unicode),
+            UniqueConstraint("guild_id", "phash", name="perceptual_filter_uq"),
+        )
         self.tb_filter_immune_users = Table(
             "filter_immune_users",
             meta,
@@ -92,9 +105,11 @@ class FilterModel:
             Column("bot_immune", Boolean),
             Column("manage_messages_immune", Boolean),
             Column("reupload", Boolean),
+            Column("fail_closed", Boolean, server_default="0"),
         )
         self.filter_cache = {}
         self.content_filter_cache = {}
+        self.perceptual_filter_cache = {}
         self.immune_users_cache = defaultdict(set)
         self.settings_cache = {}
 
@@ -249,6 +264,100 @@ class FilterModel:
         assert result.rowcount in (0, 1), "Multiple rows deleted"
         return bool(result.rowcount)
 
+    def get_perceptual_filters(self, guild):
+        logger.debug(
+            "Getting perceptual filters for guild '%s' (%d)", guild.name, guild.id
+        )
+        if guild in self.perceptual_filter_cache:
+            return self.perceptual_filter_cache[guild]
+
+        sel = select(
+            [
+                self.tb_perceptual_filters.c.filter_type,
+                self.tb_perceptual_filters.c.phash,
+                self.tb_perceptual_filters.c.threshold,
+                self.tb_perceptual_filters.c.description,
+            ]
+        ).where(self.tb_perceptual_filters.c.guild_id == guild.id)
+        result = self.sql.execute(sel)
+
+        filters = {
+            int.from_bytes(phash, "big"): (filter_type, threshold, description)
+            for (filter_type, phash, threshold, description) in result.fetchall()
+        }
+        self.perceptual_filter_cache[guild] = filters
+        return filters
+
+    def add_perceptual_filter(self, guild, filter_type, phash, threshold, description):
+        logger.info(
+            "Adding perceptual hash %016x to filter, level '%s', threshold %d",
+            phash,
+            filter_type.value,
+            threshold,
+        )
+
+        ins = self.tb_perceptual_filters.insert().values(
+            guild_id=guild.id,
+            filter_type=filter_type,
+            phash=phash.to_bytes(8, "big"),
+            threshold=threshold,
+            description=description,
+        )
+
+        try:
+            self.sql.execute(ins)
+            self.perceptual_filter_cache[guild][phash] = (
+                filter_type,
+                threshold,
+                description,
+            )
+        except IntegrityError as error:
+            logger.error("Unable to insert new perceptual filter", exc_info=error)
+            raise ValueError("This perceptual filter already exists")
+
+    def update_perceptual_filter(
+        self, guild, filter_type, phash, threshold, description
+    ):
+        logger.info(
+            "Updating perceptual hash %016x to filter, level '%s', threshold %d",
+            phash,
+            filter_type.value,
+            threshold,
+        )
+
+        upd = (
+            self.tb_perceptual_filters.update()
+            .values(
+                filter_type=filter_type, threshold=threshold, description=description
+            )
+            .where(
+                and_(
+                    self.tb_perceptual_filters.c.guild_id == guild.id,
+                    self.tb_perceptual_filters.c.phash == phash.to_bytes(8, "big"),
+                )
+            )
+        )
+        self.sql.execute(upd)
+        self.perceptual_filter_cache[guild][phash] = (
+            filter_type,
+            threshold,
+            description,
+        )
+
+    def delete_perceptual_filter(self, guild, phash):
+        logger.info("Deleting perceptual hash %016x from filter", phash)
+
+        delet = self.tb_perceptual_filters.delete().where(
+            and_(
+                self.tb_perceptual_filters.c.guild_id == guild.id,
+                self.tb_perceptual_filters.c.phash == phash.to_bytes(8, "big"),
+            )
+        )
+        result = self.sql.execute(delet)
+        self.perceptual_filter_cache[guild].pop(phash, None)
+        assert result.rowcount in (0, 1), "Multiple rows deleted"
+        return bool(result.rowcount)
+
     def fetch_filter_immune_users(self, guild):
         logger.info(
             "Fetching users with filter immunity in guild '%s' (%d)",
@@ -335,6 +444,7 @@ class FilterModel:
                 self.tb_filter_settings.c.bot_immune,
                 self.tb_filter_settings.c.manage_messages_immune,
                 self.tb_filter_settings.c.reupload,
+                self.tb_filter_settings.c.fail_closed,
             ]
         ).where(self.tb_filter_settings.c.guild_id == guild.id)
         result = self.sql.execute(sel)
@@ -343,13 +453,14 @@ class FilterModel:
             self.add_settings(guild)
             return self.settings_cache[guild]
 
-        bot_immune, manage_messages_immune, reupload = result.fetchone()
+        bot_immune, manage_messages_immune, reupload, fail_closed = result.fetchone()
 
         # Update cache
         storage = FilterSettingsData()
         storage.bot_immune = bot_immune
         storage.manage_messages_immune = manage_messages_immune
         storage.reupload = reupload
+        storage.fail_closed = fail_closed
         self.settings_cache[guild] = storage
         return storage
 
@@ -367,6 +478,7 @@ class FilterModel:
             bot_immune=storage.bot_immune,
             manage_messages_immune=storage.manage_messages_immune,
             reupload=storage.reupload,
+            fail_closed=storage.fail_closed,
         )
         self.sql.execute(ins)
         self.settings_cache[guild] = storage
@@ -384,6 +496,22 @@ class FilterModel:
         self.sql.execute(upd)
         self.settings_cache[guild].reupload = reupload
 
+    def set_fail_closed(self, guild, fail_closed):
+        logger.info(
+            "Updating filter failure policy for guild '%s' (%d) to fail %s",
+            guild.name,
+            guild.id,
+            "closed" if fail_closed else "open",
+        )
+
+        upd = (
+            self.tb_filter_settings.update()
+            .where(self.tb_filter_settings.c.guild_id == guild.id)
+            .values(fail_closed=fail_closed)
+        )
+        self.sql.execute(upd)
+        self.settings_cache[guild].fail_closed = fail_closed
+
     def set_bot_filter_immunity(
         self, guild, bot_immune=None, manage_messages_immune=None
     ):
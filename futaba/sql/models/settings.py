@@ -507,15 +507,40 @@ class SettingsModel:
             guild_id=guild.id, type=block_type, data_id=user_or_channel.id
         )
         self.sql.execute(ins)
-        if guild in self.tracking_blacklist_cache:
-            self.tracking_blacklist_cache[guild].add_block(user_or_channel)
+        self.tracking_blacklist_cache.pop(guild.id, None)
+
+    def remove_from_tracking_blacklist(self, guild, user_or_channel):
+        logger.info(
+            "Removing '%s' (%d) from the tracking blacklist for guild '%s' (%d)",
+            user_or_channel.name,
+            user_or_channel.id,
+            guild.name,
+            guild.id,
+        )
+
+        block_type = (
+            LocationType.USER
+            if isinstance(user_or_channel, discord.abc.User)
+            else LocationType.CHANNEL
+        )
+
+        delet = self.tb_tracking_blacklists.delete().where(
+            and_(
+                self.tb_tracking_blacklists.c.guild_id == guild.id,
+                self.tb_tracking_blacklists.c.type == block_type,
+                self.tb_tracking_blacklists.c.data_id == user_or_channel.id,
+            )
+        )
+        self.sql.execute(delet)
+        self.tracking_blacklist_cache.pop(guild.id, None)
 
     def get_tracking_blacklist(self, guild):
         logger.debug(
             "Getting tracking blacklist for guild '%s' (%d)", guild.name, guild.id
         )
-        if guild in self.tracking_blacklist_cache:
-            return self.tracking_blacklist_cache[guild]
+        blacklist = self.tracking_blacklist_cache.get(guild.id)
+        if blacklist is not None:
+            return blacklist
 
         sel = select(
             [self.tb_tracking_blacklists.c.type, self.tb_tracking_blacklists.c.data_id]
@@ -523,7 +548,7 @@ class SettingsModel:
         result = self.sql.execute(sel)
 
         blacklist = TrackingBlacklistData(guild, result.fetchall())
-        self.tracking_blacklist_cache[guild] = blacklist
+        self.tracking_blacklist_cache[guild.id] = blacklist
         return blacklist
 
     def fetch_optional_cog_settings(self, guild, cog_name, default=None):
@@ -0,0 +1,133 @@
+#
+# startup.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Runs the bot's startup in timed phases.
+
+Within a phase, steps run in waves: each wave is every step whose
+dependencies have finished. Steps in a wave are started together, so
+coroutine steps (such as a cog setup() which offloads file reading to an
+executor) overlap with the rest. Plain functions run to completion when
+started, as SQL work must, since it shares a single connection.
+
+Warmups, work which the bot can answer commands without, are run in the
+background once it is ready.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from collections import namedtuple
+
+from .str_builder import StringBuilder
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Step", "StepTiming", "Startup"]
+
+Step = namedtuple("Step", ("name", "func", "after"))
+StepTiming = namedtuple("StepTiming", ("phase", "name", "elapsed"))
+
+
+def _waves(steps):
+    """
+    Groups the steps so each only comes after the ones it depends on.
+    Dependencies on steps which aren't in this phase are ignored.
+    """
+
+    names = {step.name for step in steps}
+    remaining = {step.name: set(step.after) & names for step in steps}
+    by_name = {step.name: step for step in steps}
+    waves = []
+
+    while remaining:
+        ready = [name for name, after in remaining.items() if not after]
+        if not ready:
+            raise ValueError(f"Circular startup dependencies: {sorted(remaining)}")
+
+        waves.append([by_name[name] for name in ready])
+        for name in ready:
+            del remaining[name]
+        for after in remaining.values():
+            after.difference_update(ready)
+
+    return waves
+
+
+class Startup:
+    __slots__ = ("started", "timings", "warmup_task")
+
+    def __init__(self):
+        self.started = False
+        self.timings = []
+        self.warmup_task = None
+
+    async def _run_step(self, phase, step, critical):
+        start = time.perf_counter()
+        try:
+            result = step.func()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as error:
+            if critical:
+                logger.error("Startup step '%s' in phase '%s' failed", step.name, phase)
+                raise
+
+            logger.error("Deferred step '%s' failed", step.name, exc_info=error)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings.append(StepTiming(phase, step.name, elapsed))
+
+    async def run_phase(self, phase, steps, critical=True):
+        """
+        Runs the steps, in waves by their dependencies. If critical,
+        a failing step stops the phase, otherwise it is only logged.
+        """
+
+        logger.info("Starting phase '%s' (%d steps)", phase, len(steps))
+        start = time.perf_counter()
+
+        for wave in _waves(steps):
+            await asyncio.gather(
+                *[self._run_step(phase, step, critical) for step in wave]
+            )
+
+        elapsed = time.perf_counter() - start
+        self.timings.append(StepTiming(phase, None, elapsed))
+
+    async def _run_deferred(self, phase, steps):
+        await self.run_phase(phase, steps, critical=False)
+        self.log_report(phases=(phase,))
+
+    def defer(self, phase, steps):
+        """
+        Runs a non-critical phase in the background, logging its timings when done.
+        """
+
+        self.warmup_task = asyncio.ensure_future(self._run_deferred(phase, steps))
+
+    def log_report(self, phases=None):
+        """
+        Logs a table of how long each phase and step took.
+        """
+
+        table = StringBuilder()
+        for timing in self.timings:
+            if phases is not None and timing.phase not in phases:
+                continue
+
+            name = timing.name or "(total)"
+            table.writeln(f"{timing.phase:<10} {name:<28} {timing.elapsed:8.3f}s")
+
+        for line in str(table).splitlines():
+            logger.info(line)
@@ -12,11 +12,11 @@
 
 import logging
 import os
-import re
 import string
+import struct
 import unicodedata
+from array import array
 from bisect import bisect
-from urllib.request import urlretrieve
 
 from futaba.str_builder import StringBuilder
 
@@ -25,7 +25,7 @@ logger = logging.getLogger(__name__)
 __all__ = [
     "READABLE_CHAR_SET",
     "UNICODE_BLOCKS",
-    "UNICODE_BLOCKS_FILENAME",
+    "UNICODE_BLOCKS_PATH",
     "UNICODE_CATEGORY_NAME",
     "normalize_caseless",
     "unicode_block",
@@ -34,36 +34,80 @@ __all__ = [
 
 READABLE_CHAR_SET = frozenset(string.printable) - frozenset("\t\n\r\x0b\x0c")
 
+# Generated by misc/build_unicode_blocks.py, which describes the format
+UNICODE_BLOCKS_PATH = os.path.join(
+    os.path.dirname(__file__), "data", "unicode-blocks.bin"
+)
+UNICODE_BLOCKS_FORMAT = 1
 
-# Adapted from https://gist.github.com/acdha/49a610089c2798db6fe2
-def _load_unicode_blocks():
-    if not os.path.exists(UNICODE_BLOCKS_FILENAME):
-        logger.info(
-            "Unicode blocks file '%s' does not exist, downloading...",
-            UNICODE_BLOCKS_FILENAME,
-        )
-        urlretrieve(
-            "https://unicode.org/Public/UNIDATA/Blocks.txt",
-            filename=UNICODE_BLOCKS_FILENAME,
-        )
 
-    blocks = []
-    with open(UNICODE_BLOCKS_FILENAME) as fh:
-        content = fh.read()
+class _UnicodeBlocks:
+    """
+    The block table, as parallel arrays of block starts, ends and name indexes.
+    """
+
+    __slots__ = ("version", "starts", "ends", "name_indexes", "names")
+
+    def __init__(self, data):
+        magic, version, count = struct.unpack_from("<4sHI", data)
+        if magic != b"UBLK" or version != UNICODE_BLOCKS_FORMAT:
+            raise ValueError("Unicode block data is not in the expected format")
+
+        offset = struct.calcsize("<4sHI")
+        (length,) = struct.unpack_from("<B", data, offset)
+        offset += 1
+        self.version = data[offset : offset + length].decode("ascii")
+        offset += length
+
+        self.starts = array("L", struct.unpack_from(f"<{count}I", data, offset))
+        offset += 4 * count
+        self.ends = array("L", struct.unpack_from(f"<{count}I", data, offset))
+        offset += 4 * count
+        self.name_indexes = array("H", struct.unpack_from(f"<{count}H", data, offset))
+        offset += 2 * count
+        self.names = data[offset:].decode("utf-8").split("\n")
+
+    def lookup(self, codepoint):
+        index = bisect(self.starts, codepoint) - 1
+        if index < 0 or codepoint > self.ends[index]:
+            return None
+
+        return self.names[self.name_indexes[index]]
 
-    for start, end, block_name in re.findall(
-        r"([0-9A-F]+)\.\.([0-9A-F]+);\ (\S.*\S)", content
-    ):
-        if block_name == "No_Block":
-            continue
 
-        blocks.append((int(start, 16), int(end, 16), block_name))
-    return blocks
+_blocks = None
 
 
-UNICODE_BLOCKS_FILENAME = "unidata-blocks.txt"
-UNICODE_BLOCKS = _load_unicode_blocks()
-UNICODE_BLOCK_STARTS = [block[0] for block in UNICODE_BLOCKS]
+def _unicode_blocks():
+    global _blocks
+
+    if _blocks is None:
+        with open(UNICODE_BLOCKS_PATH, "rb") as fh:
+            _blocks = _UnicodeBlocks(fh.read())
+
+        if _blocks.version != unicodedata.unidata_version:
+            logger.debug(
+                "Unicode block data is for version %s, but unicodedata is %s",
+                _blocks.version,
+                unicodedata.unidata_version,
+            )
+
+    return _blocks
+
+
+def __getattr__(name):
+    # Only built on request, as unicode_block() doesn't need it
+    if name == "UNICODE_BLOCKS":
+        blocks = _unicode_blocks()
+        return [
+            (start, end, blocks.names[index])
+            for start, end, index in zip(
+                blocks.starts, blocks.ends, blocks.name_indexes
+            )
+        ]
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 UNICODE_CATEGORY_NAME = {
     "Lu": "Letter, uppercase",
@@ -112,14 +156,7 @@ def normalize_caseless(s):
 def unicode_block(s):
     """ Gets the name of the Unicode block that contains the given character. """
 
-    codepoint = ord(s)
-    index = bisect(UNICODE_BLOCK_STARTS, codepoint)
-    try:
-        _, stop, block = UNICODE_BLOCKS[index]
-    except IndexError:
-        return None
-
-    return block if codepoint <= stop else None
+    return _unicode_blocks().lookup(ord(s))
 
 
 def unicode_repr(s):
@@ -10,7 +10,9 @@
 # WITHOUT ANY WARRANTY. See the LICENSE file for more details.
 #
 
+import functools
 import logging
+import os
 import re
 import subprocess
 from datetime import datetime
@@ -25,6 +27,7 @@ logger = logging.getLogger(__name__)
 
 __all__ = [
     "GIT_HASH",
+    "git_hash",
     "URL_REGEX",
     "Dummy",
     "DictEmbed",
@@ -44,7 +47,22 @@ __all__ = [
 ]
 
 
-def _get_git_hash():
+GIT_HASH_PATH = os.path.join(os.path.dirname(__file__), "git-hash")
+
+
+@functools.lru_cache(maxsize=None)
+def git_hash():
+    """
+    Returns the short hash of the running commit. This is read from the file
+    written at deploy time if there is one, otherwise git is asked, once.
+    """
+
+    try:
+        with open(GIT_HASH_PATH) as fh:
+            return fh.read().strip()
+    except FileNotFoundError:
+        pass
+
     try:
         output = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"])
         return output.decode("utf-8").strip()
@@ -56,7 +74,13 @@ def _get_git_hash():
     return ""
 
 
-GIT_HASH = _get_git_hash()
+def __getattr__(name):
+    # GIT_HASH is resolved on first use, rather than running git at import
+    if name == "GIT_HASH":
+        return git_hash()
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 URL_REGEX = re.compile(
     r"<?(https?:\/\/(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,6}\b(?:[-a-zA-Z0-9@:%_\+.~#?&//=]*))>?"
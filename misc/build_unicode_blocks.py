@@ -0,0 +1,108 @@
+#
+# misc/build_unicode_blocks.py
+#
+# futaba - A Discord Mod bot for the Programming server
+# Copyright (c) 2017-2020 Jake Richardson, Ammon Smith, jackylam5
+#
+# futaba is available free of charge under the terms of the MIT
+# License. You are free to redistribute and/or modify it under those
+# terms. It is distributed in the hopes that it will be useful, but
+# WITHOUT ANY WARRANTY. See the LICENSE file for more details.
+#
+
+"""
+Generates futaba/data/unicode-blocks.bin from the Unicode Character
+Database's Blocks.txt. Rerun this when updating to a new Unicode version.
+
+Usage:
+    python3 misc/build_unicode_blocks.py [Blocks.txt] [-o output]
+
+If no input file is given, the latest one is downloaded from unicode.org.
+
+The output is little-endian, and read by futaba.unicode:
+    magic "UBLK", format version (u16), block count (u32)
+    Unicode version length (u8), Unicode version (ASCII)
+    block starts (u32 each), block ends (u32 each), name indexes (u16 each)
+    block names (UTF-8, newline-separated) until the end of the file
+"""
+
+import argparse
+import re
+import struct
+import sys
+from urllib.request import urlopen
+
+BLOCKS_URL = "https://unicode.org/Public/UNIDATA/Blocks.txt"
+FORMAT_VERSION = 1
+
+BLOCK_REGEX = re.compile(r"^([0-9A-F]+)\.\.([0-9A-F]+);\s*(\S.*\S)\s*$", re.MULTILINE)
+VERSION_REGEX = re.compile(r"^# Blocks-([0-9.]+)\.txt", re.MULTILINE)
+
+
+def parse_blocks(content):
+    blocks = []
+    for start, end, name in BLOCK_REGEX.findall(content):
+        if name == "No_Block":
+            continue
+
+        blocks.append((int(start, 16), int(end, 16), name))
+
+    blocks.sort()
+    match = VERSION_REGEX.search(content)
+    version = match.group(1) if match else "unknown"
+    return version, blocks
+
+
+def pack_blocks(version, blocks):
+    names = []
+    name_indexes = {}
+    for _, _, name in blocks:
+        if name not in name_indexes:
+            name_indexes[name] = len(names)
+            names.append(name)
+
+    count = len(blocks)
+    version = version.encode("ascii")
+    return b"".join(
+        (
+            struct.pack("<4sHI", b"UBLK", FORMAT_VERSION, count),
+            struct.pack("<B", len(version)),
+            version,
+            struct.pack(f"<{count}I", *(start for start, _, _ in blocks)),
+            struct.pack(f"<{count}I", *(end for _, end, _ in blocks)),
+            struct.pack(f"<{count}H", *(name_indexes[name] for _, _, name in blocks)),
+            "\n".join(names).encode("utf-8"),
+        )
+    )
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Build the Unicode block table")
+    argparser.add_argument("input", nargs="?", help="Path to Blocks.txt")
+    argparser.add_argument(
+        "-o", "--output", default="futaba/data/unicode-blocks.bin", help="Output file"
+    )
+    args = argparser.parse_args()
+
+    if args.input is None:
+        print(f"Downloading {BLOCKS_URL}")
+        with urlopen(BLOCKS_URL) as response:
+            content = response.read().decode("utf-8")
+    else:
+        with open(args.input, encoding="utf-8") as fh:
+            content = fh.read()
+
+    version, blocks = parse_blocks(content)
+    if not blocks:
+        print("No blocks found in input", file=sys.stderr)
+        sys.exit(1)
+
+    data = pack_blocks(version, blocks)
+    with open(args.output, "wb") as fh:
+        fh.write(data)
+
+    print(f"Wrote {len(blocks)} blocks (Unicode {version}, {len(data)} bytes)")
+
+
+if __name__ == "__main__":
+    main()